@@ -12,14 +12,20 @@
 
 import string
 import re
+import importlib
 from typing import List
 from click.core import Context
 import click
-from apio import util
 
 # -- Maps group title to command names. Controls how the 'apio -h' help
 # -- information is printed. Should include all commands and without
 # -- duplicates.
+# --
+# -- The command modules are imported only when their command is invoked,
+# -- to keep apio's startup fast. For the same reason, modules that are
+# -- slow to import, such as requests, or that are needed only by some
+# -- commands or options, are imported inside the functions that use them,
+# -- with an 'import-outside-toplevel' pylint disable.
 COMMAND_GROUPS = {
     "Build commands": [
         "build",
@@ -142,31 +148,16 @@ def reformat_apio_help(original_help: str) -> str:
 class ApioCLI(click.MultiCommand):
     """DOC:TODO"""
 
-    def __init__(self, *args, **kwargs):
-
-        # -- Get the full path to the commands folder
-        # -- Ex. /home/obijuan/Develop/(...)/apio/commands
-        # -- Every apio command (Ex. apio build, apio upload...) is a
-        # -- separate .py file located in the commands folder
-        self.commands_folder = util.get_path_in_apio_package("commands")
-
-        self._cls = [None]
-        super().__init__(*args, **kwargs)
-
     # -- Return  a list of all the available commands
     # @override
     def list_commands(self, ctx):
-        # -- All the python files inside the apio/commands folder are commands,
-        # -- except __init__.py
-        # -- Create the list
+        # -- The registered commands are the ones listed in the command
+        # -- groups. Each one is implemented by the module
+        # -- apio/commands/<name>.py.
         cmd_list = [
-            element.stem  # -- Name without path and extension
-            for element in self.commands_folder.iterdir()
-            if (
-                element.is_file()
-                and element.suffix == ".py"
-                and element.stem != "__init__"
-            )
+            cmd_name
+            for cmd_names in COMMAND_GROUPS.values()
+            for cmd_name in cmd_names
         ]
 
         cmd_list.sort()
@@ -179,25 +170,16 @@ class ApioCLI(click.MultiCommand):
     # --   * cmd_name: Apio command name
     # @override
     def get_command(self, ctx, cmd_name: string):
-        nnss = {}
-
-        # -- Get the python filename asociated with the give command
-        # -- Ex. "system" --> "/home/obijuan/.../apio/commands/system.py"
-        filename = self.commands_folder / f"{cmd_name}.py"
-
-        # -- Check if the file exists
-        if filename.exists():
-            # -- Open the python file
-            with filename.open(encoding="utf8") as file:
-                # -- Compile it!
-                code = compile(file.read(), filename, "exec")
+        # -- Unknown commands are reported by click.
+        if cmd_name not in self.list_commands(ctx):
+            return None
 
-                # -- Get the function!
-                # pylint: disable=W0123
-                eval(code, nnss, nnss)
+        # -- Import the command module, only when the command is used.
+        # -- Ex. "system" --> apio.commands.system
+        module = importlib.import_module(f"apio.commands.{cmd_name}")
 
         # -- Return the function needed for executing the command
-        return nnss.get("cli")
+        return module.cli
 
     # @override
     def get_help(self, ctx: Context) -> str:
@@ -235,6 +217,10 @@ project where the project configuration file apio.ini and the project
 source files are stored. For help on specific commands use the -h
 flag (e.g. 'apio build -h').
 
+With --output=jsonl, apio writes to stdout machine readable events, one
+json object per line, for IDEs and other frontends, and its messages go
+to stderr. See apio/events.py for the events.
+
 For more information on the apio project see
 https://github.com/FPGAwars/apio/wiki/Apio
 """
@@ -248,11 +234,26 @@ https://github.com/FPGAwars/apio/wiki/Apio
 )
 @click.pass_context
 @click.version_option()
-def cli(ctx: Context):
+@click.option(
+    "output",  # Var name.
+    "--output",
+    type=click.Choice(["text", "jsonl"]),
+    default="text",
+    help="Output format, jsonl for json events.",
+)
+def cli(ctx: Context, output: str):
     """This function is executed when apio is invoked without
     any parameter. It prints the high level usage text of Apio.
     """
 
+    # -- Enable the json events until the command ends.
+    if output == "jsonl":
+        # pylint: disable=import-outside-toplevel
+        from apio import events
+
+        events.enable()
+        ctx.call_on_close(events.disable)
+
     # -- If no command was typed show top help. Equivalent to 'apio -h'.
     if ctx.invoked_subcommand is None:
         click.secho(ctx.get_help())
@@ -7,11 +7,13 @@
 # -- Licence GPLv2
 """Implementation of 'apio boards' command"""
 
+import json
 from pathlib import Path
 from varname import nameof
 import click
 from click.core import Context
 from apio.resources import Resources
+from apio.managers.board_index import BoardIndex, parse_filter
 from apio import cmd_util
 from apio.commands import options
 
@@ -27,6 +29,31 @@ list_fpgas_option = click.option(
     cls=cmd_util.ApioOption,
 )
 
+filter_option = click.option(
+    "filter_",  # Var name. Deconflicting from Python's builtin 'filter'.
+    "--filter",
+    type=str,
+    metavar="expr",
+    help="List the boards or FPGAs that match, e.g. arch=ecp5,size=85k.",
+    cls=cmd_util.ApioOption,
+)
+
+json_option = click.option(
+    "json_",  # Var name. Deconflicting from the json module.
+    "--json",
+    is_flag=True,
+    help="List the boards or FPGAs in json format.",
+    cls=cmd_util.ApioOption,
+)
+
+connected_option = click.option(
+    "connected",  # Var name.
+    "--connected",
+    is_flag=True,
+    help="List the boards that may be connected, by their USB ids.",
+    cls=cmd_util.ApioOption,
+)
+
 
 # ---------------------------
 # -- COMMAND
@@ -43,6 +70,14 @@ Examples:
   apio boards --fpga           # List FPGAs
   apio boards -l | grep ecp5   # Filter boards results
   apio boards -f | grep gowin  # Filter FPGA results.
+  apio boards --filter arch=ecp5,size=85k --json
+  apio boards --filter usb=0403:6010  # Boards with this USB vid:pid
+  apio boards --connected      # Boards that may be connected
+
+The --filter fields of the boards are board, fpga, arch, type, size,
+pack, programmer and usb, and of the FPGAs, with --fpga, fpga, arch, type,
+size and pack. A field that is given several times matches any of its
+values, e.g. arch=ice40,arch=ecp5.
 
 [Advanced] Boards with wide availability can be added by contacting the
 apio team. Custom one-of boards can be added to your project by
@@ -60,12 +95,20 @@ placing an alternative boards.json file in your apio project directory.
 @options.project_dir_option
 @options.list_option_gen(help="List supported FPGA boards.")
 @list_fpgas_option
+@filter_option
+@json_option
+@connected_option
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-positional-arguments
 def cli(
     ctx: Context,
     # Options
     project_dir: Path,
     list_: bool,
     fpgas: bool,
+    filter_: str,
+    json_: bool,
+    connected: bool,
 ):
     """Implements the 'boards' command which lists supported boards
     and FPGAs.
@@ -73,17 +116,55 @@ def cli(
 
     # Make sure these params are exclusive.
     cmd_util.check_at_most_one_param(ctx, nameof(list_, fpgas))
+    cmd_util.check_at_most_one_param(ctx, nameof(fpgas, connected))
 
     # -- Access to the apio resources. We need project scope since the project
-    # -- may override the list of boards.
-    resources = Resources(project_dir=project_dir, project_scope=True)
+    # -- may override the list of boards. The json output goes alone to
+    # -- stdout.
+    resources = Resources(
+        project_dir=project_dir, project_scope=True, notices_to_stderr=json_
+    )
+
+    # -- Option 1: Query the boards or fpgas index.
+    if filter_ or json_ or connected:
+        # -- A custom boards.json may have errors.
+        try:
+            index = BoardIndex(resources)
+        except ValueError as exc:
+            cmd_util.fatal_usage_error(ctx, f"{exc}.")
+
+        try:
+            filters = parse_filter(filter_) if filter_ else {}
+            if fpgas:
+                records = index.find_fpgas(filters)
+            else:
+                records = index.find_boards(filters)
+        except ValueError as exc:
+            cmd_util.fatal_usage_error(ctx, f"--filter: {exc}.")
+
+        if connected:
+            # pylint: disable=import-outside-toplevel
+            from apio.managers.device_inventory import DeviceInventory
+
+            # -- The boards that may be connected, within the filter.
+            devices = DeviceInventory(resources).usb_devices()
+            boards = index.boards_for_usb(d["hwid"] for d in devices)
+            records = [r for r in records if r["board"] in boards]
+
+        if json_:
+            click.echo(json.dumps(records, indent=2))
+        elif fpgas:
+            resources.list_fpgas([r["fpga"] for r in records])
+        else:
+            resources.list_boards([r["board"] for r in records])
+        ctx.exit(0)
 
-    # -- Option 1: List boards
+    # -- Option 2: List boards
     if list_:
         resources.list_boards()
         ctx.exit(0)
 
-    # -- Option 2: List fpgas
+    # -- Option 3: List fpgas
     if fpgas:
         resources.list_fpgas()
         ctx.exit(0)
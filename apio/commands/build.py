@@ -11,11 +11,34 @@ from pathlib import Path
 import click
 from click.core import Context
 from apio.managers.scons import SCons
+from apio.managers import build_stats
 from apio import cmd_util
 from apio.commands import options
 from apio.resources import Resources
 
 
+# ---------------------------
+# -- COMMAND SPECIFIC OPTIONS
+# ---------------------------
+seeds_option = click.option(
+    "seeds",  # Var name.
+    "--seeds",
+    type=click.IntRange(min=1),
+    default=1,
+    metavar="N",
+    help="Run N placements with different seeds and keep the best.",
+    cls=cmd_util.ApioOption,
+)
+
+profile_option = click.option(
+    "profile",  # Var name.
+    "--profile",
+    is_flag=True,
+    help="Show the time and memory of each build stage.",
+    cls=cmd_util.ApioOption,
+)
+
+
 # ---------------------------
 # -- COMMAND
 # ---------------------------
@@ -30,15 +53,25 @@ of the project that contains the apio.ini file.
 Examples:
   apio build       # Build
   apio build -v    # Build with verbose info
+  apio build --seeds 8  # Keep the best of 8 placements
+  apio build --profile  # Show the time and memory of each stage
 
 The build command builds all the .v files (e.g. my_module.v) in the project
 directory except for those whose name ends with _tb (e.g. my_module_tb.v) to
 indicate that they are testbenches.
+
+With the --seeds option, the placement is run in parallel with N different
+seeds and the one with the best worst case fmax margin is kept.
+
+With the --profile option, the wall time, CPU time and peak memory of each
+tool that the build ran are printed. Use 'apio report --history' to compare
+the times of past builds.
 """
 
 
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-positional-arguments
+# pylint: disable=too-many-locals
 @click.command(
     "build",
     short_help="Synthesize the bitstream.",
@@ -50,6 +83,8 @@ indicate that they are testbenches.
 @options.verbose_option
 @options.verbose_yosys_option
 @options.verbose_pnr_option
+@seeds_option
+@profile_option
 @options.top_module_option_gen(deprecated=True)
 @options.board_option_gen(deprecated=True)
 @options.fpga_option_gen(deprecated=True)
@@ -63,6 +98,8 @@ def cli(
     verbose: bool,
     verbose_yosys: bool,
     verbose_pnr: bool,
+    seeds: int,
+    profile: bool,
     # Deprecated options
     top_module: str,
     board: str,
@@ -99,9 +136,16 @@ def cli(
                 "pnr": verbose_pnr,
             },
             "top-module": top_module,
-        }
+        },
+        seeds=seeds,
     )
 
+    # -- Print the stats of the build that just ran.
+    if profile:
+        records = build_stats.load_records("build")
+        if records:
+            build_stats.print_profile(records[-1])
+
     # -- Done!
     ctx.exit(exit_code)
 
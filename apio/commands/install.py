@@ -13,6 +13,7 @@ from varname import nameof
 import click
 from click.core import Context
 from apio.managers.old_installer import Installer
+from apio.managers import installer as packages_installer
 from apio.resources import Resources
 from apio import cmd_util
 from apio.commands import options
@@ -108,9 +109,13 @@ def cli(
 
     # -- Install all the available packages (if any)
     if all_:
-        # -- Install all the available packages for this platform!
-        install_packages(
-            resources.platform_packages.keys(), resources, force, verbose
+        # -- Install all the available packages for this platform, with the
+        # -- concurrent installer of 'apio packages --install'.
+        packages_installer.install_packages(
+            resources,
+            package_specs=list(resources.platform_packages.keys()),
+            force=force,
+            verbose=verbose,
         )
         ctx.exit(0)
 
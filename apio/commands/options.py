@@ -192,7 +192,16 @@ ftdi_id = click.option(
     "--ftdi-id",
     type=str,
     metavar="ftdi-id",
-    help="Set the FTDI id.",
+    help="Set the FTDI id, or a comma separated list of ids.",
+)
+
+
+offline_option = click.option(
+    "offline",  # Var name.
+    "--offline",
+    is_flag=True,
+    help="Use only cached remote information, no network access.",
+    cls=cmd_util.ApioOption,
 )
 
 
@@ -230,7 +239,7 @@ serial_port_option = click.option(
     "--serial-port",
     type=str,
     metavar="serial-port",
-    help="Set the serial port.",
+    help="Set the serial port, or a comma separated list of ports.",
     cls=cmd_util.ApioOption,
 )
 
@@ -12,14 +12,18 @@ from typing import Tuple, List
 from varname import nameof
 import click
 from click.core import Context
-from apio.managers import installer
+from apio.managers import installer, package_staging, package_verify
 from apio.resources import Resources
 from apio import cmd_util, pkg_util, util
 from apio.commands import options
 
 
 def _install(
-    resources: Resources, packages: List[str], force: bool, verbose: bool
+    resources: Resources,
+    packages: List[str],
+    force: bool,
+    verbose: bool,
+    offline: bool,
 ) -> int:
     """Handles the --install operation. Returns exit code."""
     click.secho(f"Platform id '{resources.platform_id}'")
@@ -29,11 +33,14 @@ def _install(
     if not packages:
         packages = resources.platform_packages.keys()
 
-    # -- Install the packages, one by one.
-    for package in packages:
-        installer.install_package(
-            resources, package_spec=package, force=force, verbose=verbose
-        )
+    # -- Install the packages, concurrently.
+    installer.install_packages(
+        resources,
+        package_specs=list(packages),
+        force=force,
+        verbose=verbose,
+        offline=offline,
+    )
 
     return 0
 
@@ -71,6 +78,43 @@ def _uninstall(
     return 0
 
 
+def _rollback(resources: Resources, packages: List[str], verbose: bool) -> int:
+    """Handles the --rollback operation. Returns exit code."""
+
+    if not packages:
+        click.secho("Error: specify the packages to roll back", fg="red")
+        return 1
+
+    # -- Roll back the packages, one by one.
+    for package in packages:
+        package_staging.rollback_package(
+            resources, package_name=package, verbose=verbose
+        )
+
+    return 0
+
+
+def _verify(
+    resources: Resources, packages: List[str], deep: bool, verbose: bool
+) -> int:
+    """Handles the --verify operation. Returns exit code."""
+
+    # -- If packages where not specified, verify all the installed packages.
+    if not packages:
+        packages = pkg_util.scan_packages(resources).installed_package_ids
+
+    ok = package_verify.verify_packages(
+        resources, package_names=list(packages), deep=deep, verbose=verbose
+    )
+    return 0 if ok else 1
+
+
+def _gc(verbose: bool) -> int:
+    """Handles the --gc operation. Returns exit code."""
+    installer.gc_package_store(verbose)
+    return 0
+
+
 def _fix(resources: Resources, verbose: bool) -> int:
     """Handles the --fix operation. Returns exit code."""
 
@@ -79,7 +123,7 @@ def _fix(resources: Resources, verbose: bool) -> int:
 
     # -- Fix any errors.
     if scan.num_errors():
-        installer.fix_packages(resources, scan, verbose)
+        package_verify.fix_packages(resources, scan, verbose)
     else:
         click.secho("No errors to fix")
 
@@ -140,11 +184,33 @@ Examples:
   apio packages --uninstall                 # Uninstall all packages.
   apio packages --uninstall oss-cad-suite   # Uninstall only given package(s).
   apio packages --fix                       # Fix package errors.
+  apio packages --rollback oss-cad-suite    # Restore the previous version.
+  apio packages --install --offline         # Install from mirror/cache only.
+  apio packages --verify                    # Check the installed packages.
+  apio packages --verify --deep             # Check also the files content.
+  apio packages --gc                        # Delete unused package files.
 
 Adding --force to --install forces the reinstallation of existing packages,
 otherwise, packages that are already installed correctly are left with no
 change.
 
+With --offline, --install uses only the cached package versions and the
+package files mirror and cache (see APIO_PACKAGES_MIRROR and
+APIO_PACKAGES_CACHE_DIR), without network access.
+
+The --verify operation checks the files of the installed packages against
+the manifests that are created when they are installed, by their sizes and
+modification times or, with --deep, by their content. Damaged files are
+repaired if the package file is in the packages mirror or cache.
+
+The files of the installed packages are hardlinks to a shared store in the
+apio home dir, so files that are identical in several package versions
+take space once. The --gc operation deletes the files of the store that
+are no longer used, e.g. after packages were uninstalled.
+
+Installing a package keeps its previous version, and --rollback restores
+it without network access.
+
 [Hint] In case of doubt, run 'apio packages --install --force' to reinstall
 all packages from scratch.
 """
@@ -167,6 +233,38 @@ uninstall_option = click.option(
     cls=cmd_util.ApioOption,
 )
 
+rollback_option = click.option(
+    "rollback",  # Var name.
+    "--rollback",
+    is_flag=True,
+    help="Restore the previous version of packages.",
+    cls=cmd_util.ApioOption,
+)
+
+verify_option = click.option(
+    "verify",  # Var name.
+    "--verify",
+    is_flag=True,
+    help="Check the files of installed packages.",
+    cls=cmd_util.ApioOption,
+)
+
+gc_option = click.option(
+    "gc",  # Var name.
+    "--gc",
+    is_flag=True,
+    help="Delete unused files of the package store.",
+    cls=cmd_util.ApioOption,
+)
+
+deep_option = click.option(
+    "deep",  # Var name.
+    "--deep",
+    is_flag=True,
+    help="With --verify, check also the files content.",
+    cls=cmd_util.ApioOption,
+)
+
 fix_option = click.option(
     "fix",  # Var name.
     "--fix",
@@ -179,6 +277,7 @@ fix_option = click.option(
 # pylint: disable=duplicate-code
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-positional-arguments
+# pylint: disable=too-many-locals
 @click.command(
     "install",
     short_help="Manage the apio packages.",
@@ -190,8 +289,13 @@ fix_option = click.option(
 @options.list_option_gen(help="List packages.")
 @install_option
 @uninstall_option
+@rollback_option
+@verify_option
+@gc_option
 @fix_option
+@deep_option
 @options.force_option_gen(help="Force installation.")
+@options.offline_option
 @options.project_dir_option
 @options.sayyes
 @options.verbose_option
@@ -203,8 +307,13 @@ def cli(
     list_: bool,
     install: bool,
     uninstall: bool,
+    rollback: bool,
+    verify: bool,
+    gc: bool,
     fix: bool,
+    deep: bool,
     force: bool,
+    offline: bool,
     project_dir: Path,
     sayyes: bool,
     verbose: bool,
@@ -215,13 +324,25 @@ def cli(
 
     # Validate the option combination.
     cmd_util.check_exactly_one_param(
-        ctx, nameof(list_, install, uninstall, fix)
+        ctx, nameof(list_, install, uninstall, rollback, verify, gc, fix)
     )
     cmd_util.check_at_most_one_param(ctx, nameof(list_, force))
     cmd_util.check_at_most_one_param(ctx, nameof(uninstall, force))
     cmd_util.check_at_most_one_param(ctx, nameof(fix, force))
+    cmd_util.check_at_most_one_param(ctx, nameof(rollback, force))
+    cmd_util.check_at_most_one_param(ctx, nameof(verify, force))
+    cmd_util.check_at_most_one_param(ctx, nameof(verify, offline))
+    cmd_util.check_at_most_one_param(ctx, nameof(list_, offline))
+    cmd_util.check_at_most_one_param(ctx, nameof(uninstall, offline))
+    cmd_util.check_at_most_one_param(ctx, nameof(rollback, offline))
+    cmd_util.check_at_most_one_param(ctx, nameof(fix, offline))
     cmd_util.check_at_most_one_param(ctx, nameof(list_, packages))
     cmd_util.check_at_most_one_param(ctx, nameof(fix, packages))
+    cmd_util.check_at_most_one_param(ctx, nameof(gc, packages))
+    cmd_util.check_at_most_one_param(ctx, nameof(gc, force))
+    cmd_util.check_at_most_one_param(ctx, nameof(gc, offline))
+    if deep and not verify:
+        cmd_util.fatal_usage_error(ctx, "--deep requires --verify.")
 
     # -- Load the resources. We don't care about project specific resources.
     resources = Resources(
@@ -230,13 +351,25 @@ def cli(
     )
 
     if install:
-        exit_code = _install(resources, packages, force, verbose)
+        exit_code = _install(resources, packages, force, verbose, offline)
         ctx.exit(exit_code)
 
     if uninstall:
         exit_code = _uninstall(resources, packages, verbose, sayyes)
         ctx.exit(exit_code)
 
+    if rollback:
+        exit_code = _rollback(resources, packages, verbose)
+        ctx.exit(exit_code)
+
+    if verify:
+        exit_code = _verify(resources, packages, deep, verbose)
+        ctx.exit(exit_code)
+
+    if gc:
+        exit_code = _gc(verbose)
+        ctx.exit(exit_code)
+
     if fix:
         exit_code = _fix(resources, verbose)
         ctx.exit(exit_code)
@@ -11,11 +11,27 @@ from pathlib import Path
 import click
 from click.core import Context
 from apio.managers.scons import SCons
-from apio import cmd_util
+from apio.managers import build_stats
+from apio import cmd_util, util
 from apio.commands import options
 from apio.resources import Resources
 
 
+# ---------------------------
+# -- COMMAND SPECIFIC OPTIONS
+# ---------------------------
+history_option = click.option(
+    "history",  # Var name.
+    "--history",
+    is_flag=True,
+    help="Show the times of the last builds.",
+    cls=cmd_util.ApioOption,
+)
+
+# -- The number of builds shown by --history.
+HISTORY_SIZE = 20
+
+
 # ---------------------------
 # -- COMMAND
 # ---------------------------
@@ -30,7 +46,11 @@ of the project that contains the apio.ini file.
 Examples:
   apio report
   epio report --verbose
+  apio report --history  # Times of the last builds
 
+With the --history option, the date, toolchain version, total time, time
+of each tool and peak memory of the last builds are printed, to spot
+trends, e.g. after upgrading the toolchain.
 """
 
 
@@ -46,6 +66,7 @@ Examples:
 @click.pass_context
 @options.project_dir_option
 @options.verbose_option
+@history_option
 @options.top_module_option_gen(deprecated=True)
 @options.board_option_gen(deprecated=True)
 @options.fpga_option_gen(deprecated=True)
@@ -57,6 +78,7 @@ def cli(
     # Options
     project_dir: Path,
     verbose: bool,
+    history: bool,
     top_module: str,
     board: str,
     fpga: str,
@@ -66,6 +88,13 @@ def cli(
 ):
     """Analyze the design and report timing."""
 
+    # -- Print the stats of the last builds, without running scons.
+    if history:
+        project_dir = util.get_project_dir(project_dir)
+        records = build_stats.load_records("build", project_dir)
+        build_stats.print_history(records[-HISTORY_SIZE:])
+        ctx.exit(0)
+
     # -- Create the scons object
     resources = Resources(project_dir=project_dir, project_scope=True)
     scons = SCons(resources)
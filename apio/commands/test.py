@@ -7,6 +7,7 @@
 # -- Licence GPLv2
 """Implementation of 'apio test' command"""
 
+import os
 from pathlib import Path
 import click
 from click.core import Context
@@ -16,6 +17,22 @@ from apio.commands import options
 from apio.resources import Resources
 
 
+# ---------------------------
+# -- COMMAND SPECIFIC OPTIONS
+# ---------------------------
+jobs_option = click.option(
+    "jobs",  # Var name.
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=os.cpu_count() or 1,
+    show_default="number of CPUs",
+    metavar="N",
+    help="Run up to N testbenches in parallel.",
+    cls=cmd_util.ApioOption,
+)
+
+
 # ---------------------------
 # -- COMMAND
 # ---------------------------
@@ -30,6 +47,11 @@ used in the root directory of the project that contains the apio.ini.
 Examples
   apio test                 # Run all *_tb.v testbenches.
   apio test my_module_tb.v  # Run a single testbench
+  apio test --jobs 1        # Run the testbenches one at a time.
+
+The testbenches are run in parallel, each with its output grouped, and
+a summary table with the result and duration of each testbench is
+printed at the end.
 
 For a sample testbench that is compatible with apio see the
 example at
@@ -49,6 +71,7 @@ signals see the apio sim command.
 @click.pass_context
 @click.argument("testbench_file", nargs=1, required=False)
 @options.project_dir_option
+@jobs_option
 # @options.testbench
 def cli(
     ctx: Context,
@@ -56,6 +79,7 @@ def cli(
     testbench_file: str,
     # Options
     project_dir: Path,
+    jobs: int,
 ):
     """Implements the test command."""
 
@@ -63,5 +87,5 @@ def cli(
     resources = Resources(project_dir=project_dir, project_scope=True)
     scons = SCons(resources)
 
-    exit_code = scons.test({"testbench": testbench_file})
+    exit_code = scons.test({"testbench": testbench_file}, jobs=jobs)
     ctx.exit(exit_code)
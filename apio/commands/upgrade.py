@@ -11,8 +11,9 @@ import importlib.metadata
 import click
 from click.core import Context
 from packaging import version
-from apio.util import get_pypi_latest_version
+from apio.managers.remote_cache import get_pypi_latest_version
 from apio import cmd_util
+from apio.commands import options
 
 
 # ---------------------------
@@ -24,7 +25,10 @@ and provide upgrade directions if needed.
 
 \b
 Examples:
-  apio upgrade
+  apio upgrade             # Check the latest version.
+  apio upgrade --offline   # Use the last cached latest version.
+
+The latest version is cached for an hour.
 """
 
 
@@ -35,7 +39,8 @@ Examples:
     cls=cmd_util.ApioCommand,
 )
 @click.pass_context
-def cli(ctx: Context):
+@options.offline_option
+def cli(ctx: Context, offline: bool):
     """Check the latest Apio version."""
 
     # -- Get the current apio version from the python package installed
@@ -43,7 +48,7 @@ def cli(ctx: Context):
     current_version = importlib.metadata.version("apio")
 
     # -- Get the latest stable version published at Pypi
-    latest_version = get_pypi_latest_version()
+    latest_version = get_pypi_latest_version(offline=offline)
 
     # -- There was an error getting the version from pypi
     if latest_version is None:
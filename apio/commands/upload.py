@@ -38,6 +38,38 @@ flash_option = click.option(
     cls=cmd_util.ApioOption,
 )
 
+all_connected_option = click.option(
+    "all_connected",  # Var name.
+    "--all-connected",
+    is_flag=True,
+    help="Upload to all the connected boards in parallel.",
+    cls=cmd_util.ApioOption,
+)
+
+skip_unchanged_option = click.option(
+    "skip_unchanged",  # Var name.
+    "--skip-unchanged",
+    is_flag=True,
+    help="Skip the boards that already have the bitstream.",
+    cls=cmd_util.ApioOption,
+)
+
+readback_option = click.option(
+    "readback",  # Var name.
+    "--readback",
+    is_flag=True,
+    help="Confirm --skip-unchanged by reading back the flash.",
+    cls=cmd_util.ApioOption,
+)
+
+incremental_option = click.option(
+    "incremental",  # Var name.
+    "--incremental",
+    is_flag=True,
+    help="Write only the flash sectors that changed since the last upload.",
+    cls=cmd_util.ApioOption,
+)
+
 
 # ---------------------------
 # -- COMMAND
@@ -52,6 +84,26 @@ of the project that contains the apio.ini file.
 \b
 Examples:
   apio upload
+  apio upload --all-connected  # Upload to all the connected boards
+  apio upload --ftdi-id 0,1    # Upload to the boards with FTDI id 0 and 1
+  apio upload --skip-unchanged # Skip if the board has the bitstream
+  apio upload --incremental    # Write only the changed flash sectors
+
+The bitstream is built once and, when uploading to several boards, their
+programmers run in parallel, followed by a summary of the uploads.
+
+Apio records the hash of the last bitstream it uploaded to the flash of
+each board, by its USB serial number. With --skip-unchanged, the boards
+whose last bitstream is the current one are skipped, and with --readback,
+only if their flash also matches the bitstream, for programmers that can
+read it back (iceprog). Boards with an unknown serial number are skipped
+only with --readback, and SRAM uploads are never skipped.
+
+With --incremental, apio also keeps a copy of the last bitstream of each
+device and writes only the flash sectors that differ from it, followed by
+a check of the whole flash. If the check fails, the whole bitstream is
+written. It requires a programmer that can write at a flash offset and
+read the flash back (iceprog), and it's ignored for SRAM uploads.
 """
 
 
@@ -70,6 +122,10 @@ Examples:
 @options.ftdi_id
 @sram_option
 @flash_option
+@all_connected_option
+@skip_unchanged_option
+@readback_option
+@incremental_option
 @options.verbose_option
 @options.verbose_yosys_option
 @options.verbose_pnr_option
@@ -83,6 +139,10 @@ def cli(
     ftdi_id: str,
     sram: bool,
     flash: bool,
+    all_connected: bool,
+    skip_unchanged: bool,
+    readback: bool,
+    incremental: bool,
     verbose: bool,
     verbose_yosys: bool,
     verbose_pnr: bool,
@@ -92,6 +152,12 @@ def cli(
 ):
     """Implements the upload command."""
 
+    # -- Make sure these params are used together.
+    if readback and not skip_unchanged:
+        cmd_util.fatal_usage_error(
+            ctx, "--readback requires --skip-unchanged."
+        )
+
     # -- Create a drivers object
     resources = Resources(project_dir=project_dir, project_scope=True)
     drivers = Drivers(resources)
@@ -121,6 +187,10 @@ def cli(
         "ftdi_id": ftdi_id,
         "sram": sram,
         "flash": flash,
+        "all_connected": all_connected,
+        "skip_unchanged": skip_unchanged,
+        "readback": readback,
+        "incremental": incremental,
     }
 
     # Run scons: upload command
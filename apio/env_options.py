@@ -29,11 +29,46 @@ APIO_PACKAGES_DIR = "APIO_PACKAGES_DIR"
 # -- of the platforms specified in resources/platforms.json.
 APIO_PLATFORM = "APIO_PLATFORM"
 
+# -- Env variable to enable the persistent scons build server. If set to
+# -- a true value (e.g. '1' or 'true'), build commands are sent to a per
+# -- project server that keeps the SConstruct graph loaded between commands.
+APIO_SCONS_DAEMON = "APIO_SCONS_DAEMON"
+
+# -- Env variable to enable the shared build artifacts cache. If set to a
+# -- true value (e.g. '1' or 'true'), the synthesis, place and route and
+# -- bitstream outputs are cached, by their inputs, across projects.
+APIO_BUILD_CACHE = "APIO_BUILD_CACHE"
+
+# -- Env variable to override the shared build artifacts cache dir
+# -- ~/.apio/cache/build. A CI system can point it to a persistent location.
+# -- Setting it also enables the cache.
+APIO_BUILD_CACHE_DIR = "APIO_BUILD_CACHE_DIR"
+
+# -- Env variable to set the max size, in MB, of the build artifacts cache.
+# -- The least recently used files are evicted first. 0 disables the cache.
+APIO_BUILD_CACHE_SIZE = "APIO_BUILD_CACHE_SIZE"
+
+# -- Env variable to enable a cache of downloaded package files, in the
+# -- given dir. The cache can be shared by apio homes and concurrent apio
+# -- processes, e.g. of CI runners on the same machine.
+APIO_PACKAGES_CACHE_DIR = "APIO_PACKAGES_CACHE_DIR"
+
+# -- Env variable with a directory path or a 'file://' url of a local mirror
+# -- of the package files. Package files that are found in the mirror are not
+# -- downloaded.
+APIO_PACKAGES_MIRROR = "APIO_PACKAGES_MIRROR"
+
 # -- List of all supported env options.
 _SUPPORTED_APIO_VARS = [
     APIO_HOME_DIR,
     APIO_PACKAGES_DIR,
     APIO_PLATFORM,
+    APIO_SCONS_DAEMON,
+    APIO_BUILD_CACHE,
+    APIO_BUILD_CACHE_DIR,
+    APIO_BUILD_CACHE_SIZE,
+    APIO_PACKAGES_CACHE_DIR,
+    APIO_PACKAGES_MIRROR,
 ]
 
 
@@ -61,6 +96,13 @@ def get(var_name: str, default: str = None):
     return var_value
 
 
+def is_true(var_name: str) -> bool:
+    """Return True if the given APIO config env value is defined and is
+    set to a value that represents true, such as '1', 'true' or 'yes'."""
+    value = get(var_name, default="")
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 def get_defined() -> List[str]:
     """Return the list of apio env options vars that are defined."""
     result = []
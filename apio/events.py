@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""Machine readable events of apio commands, for IDEs and other frontends
+that run apio as a subprocess.
+
+With 'apio --output=jsonl ...', apio writes to stdout a json object per
+line for each event, and its human readable messages go to stderr. Each
+event has an 'event' field with its type and a 'time' field with its unix
+time, and these type specific fields:
+
+  step_start  'step', 'board'. A scons command, e.g. 'build', started.
+  step_end    'step', 'status' ('success' or 'error'), 'exit_code' and
+              'duration' in seconds. The final status of the command.
+  tool_start  'tool'. A tool with a detected output range, e.g.
+              'nextpnr', 'iceprog' or 'iverilog', started.
+  tool_end    'tool'. The tool ended.
+  diagnostic  'severity' ('error' or 'warning'), 'message', 'tool' and,
+              if known, 'file', 'line' and 'column'.
+  progress    'tool' and 'percent', e.g. while programming a board, and
+              with several boards, the 'device' of the percent.
+  output      'stream' ('stdout' or 'stderr'), 'tool' and 'text'. A line
+              of the scons output, without colors.
+
+The 'tool' fields are null if the tool is not known.
+"""
+
+import sys
+import json
+import time
+import threading
+from typing import Optional, TextIO
+
+# -- The stream to which events are written, or None if the events are
+# -- disabled.
+_stream: Optional[TextIO] = None
+
+# -- Serializes the writing of events from multiple threads.
+_lock = threading.Lock()
+
+
+def enable() -> None:
+    """Enables the events. They are written to the current stdout and
+    sys.stdout is redirected to stderr."""
+    # pylint: disable=global-statement
+    global _stream
+    if _stream is None:
+        _stream = sys.stdout
+        sys.stdout = sys.stderr
+
+
+def disable() -> None:
+    """Disables the events and restores sys.stdout."""
+    # pylint: disable=global-statement
+    global _stream
+    if _stream is not None:
+        sys.stdout = _stream
+        _stream = None
+
+
+def enabled() -> bool:
+    """Returns True if the events are enabled."""
+    return _stream is not None
+
+
+def emit(event: str, **fields) -> None:
+    """Writes an event with the given type and fields, if the events are
+    enabled."""
+    if _stream is None:
+        return
+    record = {"event": event, "time": round(time.time(), 3), **fields}
+    text = json.dumps(record) + "\n"
+    with _lock:
+        _stream.write(text)
+        _stream.flush()
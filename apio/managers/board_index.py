@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""An in-memory index of the boards and FPGAs of boards.json, fpgas.json
+and programmers.json, used by 'apio boards --filter' to find them by their
+attributes, e.g. 'arch=ecp5,size=85k', and by the USB vid:pid of a
+connected device.
+
+Each board and FPGA is flattened into a record, e.g.
+  {'board': 'alhambra-ii', 'name': 'Alhambra II', 'fpga': 'iCE40-HX4K-TQ144',
+   'arch': 'ice40', 'type': 'hx', 'size': '4k', 'pack': 'tq144',
+   'programmer': 'iceprog', 'usb': '0403:6010'}
+
+and the records are indexed by each of their FIELDS, with case insensitive
+values.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set
+from apio.resources import Resources
+
+# -- The fields of the board records that can be filtered, in the order
+# -- they are shown. The 'name' field is free text and is not indexed.
+BOARD_FIELDS = [
+    "board",
+    "fpga",
+    "arch",
+    "type",
+    "size",
+    "pack",
+    "programmer",
+    "usb",
+]
+
+# -- The fields of the FPGA records that can be filtered.
+FPGA_FIELDS = ["fpga", "arch", "type", "size", "pack"]
+
+
+def parse_filter(expression: str) -> Dict[str, Set[str]]:
+    """Parses a filter expression, a comma separated list of field=value
+    terms, into the accepted values of each field, lowercased. A record
+    matches the filter if it matches all the fields, and a field that is
+    given several times matches any of its values.
+    Ex. 'arch=ice40,arch=ecp5,size=85k'
+      -> {'arch': {'ice40', 'ecp5'}, 'size': {'85k'}}
+
+    It raises a ValueError if a term is not in the field=value form."""
+    filters: Dict[str, Set[str]] = {}
+    for term in expression.split(","):
+        field, sep, value = term.partition("=")
+        field, value = field.strip().lower(), value.strip().lower()
+        if not sep or not field or not value:
+            raise ValueError(f"invalid filter term '{term.strip()}'")
+        filters.setdefault(field, set()).add(value)
+    return filters
+
+
+# R0903: Too few public methods (1/2)
+# pylint: disable=R0903
+class _RecordIndex:
+    """Records by name, indexed by the values of their fields."""
+
+    def __init__(self, records: Dict[str, dict], fields: List[str]):
+        self.records = records
+        self.fields = fields
+        # -- The names of the records by field and value.
+        self._index: Dict[str, Dict[str, Set[str]]] = {f: {} for f in fields}
+        for name, record in records.items():
+            for field in fields:
+                value = record[field]
+                if value is not None:
+                    self._index[field].setdefault(value.lower(), set()).add(
+                        name
+                    )
+
+    def query(self, filters: Dict[str, Set[str]]) -> List[dict]:
+        """Returns the records that match the given filters, see
+        parse_filter(), sorted by case insensitive name. It raises a
+        ValueError if a field is unknown."""
+        names = set(self.records)
+        for field, values in filters.items():
+            if field not in self._index:
+                raise ValueError(
+                    f"unknown filter field '{field}', expected one of: "
+                    + ", ".join(self.fields)
+                )
+            index = self._index[field]
+            names &= set().union(*(index.get(v, set()) for v in values))
+        return [self.records[n] for n in sorted(names, key=str.lower)]
+
+
+class BoardIndex:
+    """The index of the boards and FPGAs of the given resources, which
+    includes the custom boards.json of the project, if any. It raises a
+    ValueError if a board has an unknown FPGA."""
+
+    def __init__(self, resources: Resources):
+        fpgas = {}
+        for fpga, info in resources.fpgas.items():
+            fpgas[fpga] = {
+                "fpga": fpga,
+                "arch": info["arch"],
+                "type": info["type"],
+                "size": info["size"],
+                "pack": info["pack"],
+            }
+
+        boards = {}
+        for board, info in resources.boards.items():
+            if info["fpga"] not in fpgas:
+                raise ValueError(
+                    f"board '{board}' has an unknown fpga '{info['fpga']}'"
+                )
+            usb = info.get("usb")
+            boards[board] = {
+                "board": board,
+                "name": info.get("name"),
+                **fpgas[info["fpga"]],
+                "programmer": info["programmer"]["type"],
+                "usb": f"{usb['vid']}:{usb['pid']}".lower() if usb else None,
+            }
+
+        self._boards = _RecordIndex(boards, BOARD_FIELDS)
+        self._fpgas = _RecordIndex(fpgas, FPGA_FIELDS)
+
+    def find_boards(
+        self, filters: Optional[Dict[str, Set[str]]] = None
+    ) -> List[dict]:
+        """Returns the records of the boards that match the given filters,
+        or of all the boards if None, see parse_filter()."""
+        return self._boards.query(filters or {})
+
+    def find_fpgas(
+        self, filters: Optional[Dict[str, Set[str]]] = None
+    ) -> List[dict]:
+        """Returns the records of the FPGAs that match the given filters,
+        or of all the FPGAs if None, see parse_filter()."""
+        return self._fpgas.query(filters or {})
+
+    def boards_for_usb(self, hwids: Iterable[str]) -> Set[str]:
+        """Returns the names of the boards that may be the USB devices with
+        the given vid:pid, e.g. '0403:6010'. Boards with generic USB
+        bridges share their vid:pid, so a device may match several
+        boards."""
+        records = self.find_boards({"usb": {h.lower() for h in hwids}})
+        return {record["board"] for record in records}
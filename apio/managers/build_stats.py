@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""Statistics of the scons commands of a project, such as 'apio build'.
+
+The scons process runs each action command, e.g. yosys or nextpnr, through
+a spawn function that measures its wall time, CPU time and peak memory
+(RSS) and appends them to the file '.apio/build-actions.jsonl'. When the
+command ends, apio adds a record with the command, its total time and its
+actions to the file '.apio/build-stats.jsonl'. These records are shown by
+'apio build --profile' and 'apio report --history'.
+
+The commands that python actions run with their output captured, such as
+the testbenches of 'apio test' and the placements of a multi seed build,
+are recorded by record_action(), without their CPU time and peak memory.
+The CPU time and peak memory are not available on Windows either.
+"""
+
+import os
+import sys
+import json
+import time
+import datetime
+import subprocess
+from pathlib import Path
+from typing import Callable, List, Optional
+import click
+from apio.util import PROJECT_STATE_DIR
+
+# -- The actions of the current scons command, written by the scons process.
+ACTIONS_FILE = os.path.join(PROJECT_STATE_DIR, "build-actions.jsonl")
+
+# -- The records of the scons commands.
+STATS_FILE = os.path.join(PROJECT_STATE_DIR, "build-stats.jsonl")
+
+# -- When the stats file is larger than this, its older half is deleted.
+MAX_STATS_FILE_SIZE = 2 * 1024 * 1024
+
+
+def _spawn_with_rusage(sh: str, args: List[str], env: dict):
+    """Runs the command like the posix spawn of scons and returns its exit
+    code and its resource usage, including the processes it waited for."""
+    # R1732: Consider using 'with' for resource-allocating operations
+    # pylint: disable=R1732
+    proc = subprocess.Popen(
+        [sh, "-c", " ".join(args)], env=env, close_fds=True
+    )
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return (proc.returncode, rusage)
+
+
+def record_action(
+    tool: str,
+    start: float,
+    exit_code: int,
+    cpu: Optional[float] = None,
+    max_rss: Optional[int] = None,
+) -> None:
+    """Appends the statistics of an action command that started at the
+    given time and just ended to ACTIONS_FILE, ignoring errors. 'tool' is
+    the command's executable, e.g. 'yosys'."""
+    record = {
+        "tool": os.path.basename(tool),
+        "start": round(start, 3),
+        "duration": round(time.time() - start, 3),
+        "cpu": cpu,
+        "max_rss": max_rss,
+        "exit_code": exit_code,
+    }
+    try:
+        with open(ACTIONS_FILE, "a", encoding="utf8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError:
+        pass
+
+
+def make_timed_spawn(spawn: Callable) -> Callable:
+    """Returns a scons SPAWN function that runs the commands with the given
+    SPAWN function and appends their statistics to ACTIONS_FILE."""
+
+    def timed_spawn(sh, escape, cmd, args, env):
+        start = time.time()
+        cpu = max_rss = None
+        if hasattr(os, "wait4"):
+            exit_code, rusage = _spawn_with_rusage(sh, args, env)
+            cpu = round(rusage.ru_utime + rusage.ru_stime, 3)
+            # -- ru_maxrss is in bytes on macOS and in KB on linux.
+            max_rss = rusage.ru_maxrss * (
+                1 if sys.platform == "darwin" else 1024
+            )
+        else:
+            exit_code = spawn(sh, escape, cmd, args, env)
+        record_action(args[0], start, exit_code, cpu, max_rss)
+        return exit_code
+
+    return timed_spawn
+
+
+def _read_jsonl(file_name: str) -> List[dict]:
+    """Returns the records of a jsonl file, skipping invalid lines, or an
+    empty list if the file doesn't exist."""
+    records = []
+    try:
+        with open(file_name, "r", encoding="utf8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+    except OSError:
+        pass
+    return records
+
+
+def start_command() -> None:
+    """Called before a scons command runs. Deletes the actions of the
+    previous command."""
+    try:
+        os.makedirs(PROJECT_STATE_DIR, exist_ok=True)
+        os.unlink(ACTIONS_FILE)
+    except OSError:
+        pass
+
+
+# pylint: disable=too-many-arguments
+def end_command(
+    *,
+    command: str,
+    board: Optional[str],
+    toolchain: Optional[str],
+    start_time: float,
+    duration: float,
+    exit_code: int,
+) -> dict:
+    """Called after a scons command ran. Adds its record, with the actions
+    that it ran, to STATS_FILE and returns it."""
+
+    actions = _read_jsonl(ACTIONS_FILE)
+    record = {
+        "time": round(start_time, 3),
+        "command": command,
+        "board": board,
+        "toolchain": toolchain,
+        "exit_code": exit_code,
+        "duration": round(duration, 3),
+        # -- The time until the first action, mostly the scons startup.
+        "startup": (
+            round(max(0, actions[0]["start"] - start_time), 3)
+            if actions
+            else None
+        ),
+        "actions": actions,
+    }
+
+    try:
+        os.makedirs(PROJECT_STATE_DIR, exist_ok=True)
+        with open(STATS_FILE, "a", encoding="utf8") as f:
+            f.write(json.dumps(record) + "\n")
+        if os.path.getsize(STATS_FILE) > MAX_STATS_FILE_SIZE:
+            with open(STATS_FILE, "r", encoding="utf8") as f:
+                lines = f.readlines()
+            half = len(lines) // 2
+            with open(STATS_FILE, "w", encoding="utf8") as f:
+                f.writelines(lines[half:])
+    except OSError:
+        pass
+
+    return record
+
+
+def load_records(
+    command: str, project_dir: Optional[Path] = None
+) -> List[dict]:
+    """Returns the records of the given scons command in the given project
+    dir, or the current dir if None, oldest first."""
+    stats_file = Path(project_dir or ".") / STATS_FILE
+    return [r for r in _read_jsonl(stats_file) if r.get("command") == command]
+
+
+def _format_mb(size: Optional[int]) -> str:
+    """Formats a size in bytes, or '-' if not available."""
+    return f"{size / 1e6:7.1f} MB" if size is not None else f"{'-':>10}"
+
+
+def _format_secs(secs: Optional[float]) -> str:
+    """Formats a time in seconds, or '-' if not available."""
+    return f"{secs:7.2f} s" if secs is not None else f"{'-':>9}"
+
+
+def print_profile(record: dict) -> None:
+    """Prints a table with the time and memory of the stages of a scons
+    command."""
+
+    click.secho()
+    click.secho(
+        f"{'STAGE':<20}{'WALL':>9}{'CPU':>11}{'PEAK RSS':>12}", fg="cyan"
+    )
+    if record["startup"] is not None:
+        click.secho(f"{'scons startup':<20}{_format_secs(record['startup'])}")
+    for action in record["actions"]:
+        click.secho(
+            f"{action['tool']:<20}{_format_secs(action['duration'])}  "
+            f"{_format_secs(action['cpu'])}  {_format_mb(action['max_rss'])}"
+        )
+    if not record["actions"]:
+        click.secho("No tools were run, the targets are up to date.")
+    click.secho(f"{'total':<20}{_format_secs(record['duration'])}", bold=True)
+    click.secho()
+
+
+def print_history(records: List[dict]) -> None:
+    """Prints a table with the time of each tool in the given records, one
+    row per record, to show trends across builds, e.g. after upgrading the
+    toolchain."""
+
+    if not records:
+        click.secho("No build history, run 'apio build' first.")
+        return
+
+    # -- A column per tool, in the order they run.
+    tools = []
+    for record in records:
+        for action in record["actions"]:
+            if action["tool"] not in tools:
+                tools.append(action["tool"])
+
+    header = f"{'DATE':<18}{'TOOLCHAIN':<12}{'STATUS':<8}{'TOTAL':>9}"
+    header += "".join(f"{tool[:10]:>11}" for tool in tools)
+    click.secho(header + f"{'PEAK RSS':>12}", fg="cyan")
+    for record in records:
+        date = datetime.datetime.fromtimestamp(record["time"])
+        durations = {}
+        for action in record["actions"]:
+            durations[action["tool"]] = (
+                durations.get(action["tool"], 0) + action["duration"]
+            )
+        max_rss = max(
+            (a["max_rss"] for a in record["actions"] if a["max_rss"]),
+            default=None,
+        )
+        status = "ok" if record["exit_code"] == 0 else "error"
+        line = (
+            f"{date:%Y-%m-%d %H:%M}  {record['toolchain'] or '-':<12}"
+            f"{status:<8}{_format_secs(record['duration'])}"
+        )
+        line += "".join(
+            f"  {_format_secs(durations.get(tool))}" for tool in tools
+        )
+        click.secho(line + f"  {_format_mb(max_rss)}")
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""An inventory of the devices connected to the computer, such as the USB
+devices, FTDI devices and serial ports, that is used to find the board to
+upload to.
+
+Each kind of device is scanned at most once per inventory. On Linux, the
+USB devices are read directly from /sys/bus/usb/devices instead of running
+'lsusb', and the devices found by the slower scans, e.g. 'lsftdi', are
+also kept in the file ~/.apio/cache/devices.json. A cached scan is used
+only if the USB bus didn't change since it was done and it is not older
+than TTL seconds. A device that is plugged, unplugged or reset gets a new
+device number, which changes the bus fingerprint.
+"""
+
+import os
+import sys
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from apio import util
+from apio.resources import Resources
+from apio.managers.system import System
+
+# -- The sysfs dir with an entry per USB device and interface, on Linux.
+SYSFS_USB_DIR = Path("/sys/bus/usb/devices")
+
+# -- Time, in seconds, during which a cached scan is used.
+TTL = 60
+
+# -- The version of the cache file format.
+CACHE_FORMAT = 2
+
+
+def _read_attr(device_dir: Path, name: str) -> str:
+    """Returns the value of a sysfs attribute of a USB device."""
+    with open(device_dir / name, "r", encoding="utf8") as f:
+        return f.read().strip()
+
+
+def _scan_sysfs() -> Optional[List[list]]:
+    """Returns the sorted [name, vid:pid, bus number, device number, serial
+    number] of the USB devices, or None if sysfs is not available. The
+    serial number is None if the device doesn't have one."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        names = os.listdir(SYSFS_USB_DIR)
+    except OSError:
+        return None
+    devices = []
+    for name in names:
+        # -- Skip the interfaces, e.g. '1-1:1.0', which have no ids.
+        if ":" in name:
+            continue
+        device_dir = SYSFS_USB_DIR / name
+        try:
+            hwid = (
+                f"{_read_attr(device_dir, 'idVendor')}:"
+                f"{_read_attr(device_dir, 'idProduct')}"
+            )
+            device = [
+                name,
+                hwid.lower(),
+                _read_attr(device_dir, "busnum"),
+                _read_attr(device_dir, "devnum"),
+            ]
+        except OSError:
+            # -- E.g. the device was just unplugged.
+            continue
+        try:
+            device.append(_read_attr(device_dir, "serial") or None)
+        except OSError:
+            device.append(None)
+        devices.append(device)
+    return sorted(devices)
+
+
+class DeviceInventory:
+    """The devices connected to the computer. Each kind of device is
+    scanned on first use."""
+
+    def __init__(self, resources: Resources):
+        self.resources = resources
+        # -- The USB bus fingerprint, or None if not available.
+        self._usb_bus = _scan_sysfs()
+        # -- The devices that were scanned, by kind.
+        self._devices: Dict[str, list] = {}
+
+    def _cache_file(self) -> Path:
+        """Returns the path of the cache file."""
+        return util.get_home_dir() / "cache" / "devices.json"
+
+    def _load_cache(self) -> Optional[dict]:
+        """Returns the content of the cache file if it is valid for the
+        current USB bus, or None."""
+        try:
+            with open(self._cache_file(), "r", encoding="utf8") as f:
+                data = json.load(f)
+            if (
+                data.get("format") == CACHE_FORMAT
+                and data["usb_bus"] == self._usb_bus
+                and 0 <= time.time() - data["time"] < TTL
+            ):
+                return data
+        except (OSError, ValueError, KeyError, AttributeError, TypeError):
+            pass
+        return None
+
+    def _save_cache(self, kind: str, devices: list) -> None:
+        """Adds the given scan to the cache file, ignoring errors. The
+        time of the file is the time of its oldest scan."""
+        data = self._load_cache() or {
+            "format": CACHE_FORMAT,
+            "usb_bus": self._usb_bus,
+            "time": time.time(),
+            "devices": {},
+        }
+        data["devices"][kind] = devices
+        cache_file = self._cache_file()
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}")
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, "w", encoding="utf8") as f:
+                json.dump(data, f)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass
+
+    def _get(self, kind: str, scan: Callable[[], list]) -> list:
+        """Returns the devices of the given kind, scanning them with the
+        given function if they were not scanned yet or cached."""
+        if kind in self._devices:
+            return self._devices[kind]
+
+        # -- The disk cache is used only if we can tell that the USB bus
+        # -- didn't change.
+        devices = None
+        if self._usb_bus is not None:
+            devices = (self._load_cache() or {}).get("devices", {}).get(kind)
+        if devices is None:
+            devices = scan()
+            if self._usb_bus is not None:
+                self._save_cache(kind, devices)
+
+        self._devices[kind] = devices
+        return devices
+
+    def usb_devices(self) -> List[dict]:
+        """Returns the connected USB devices.
+        Ex. [{'hwid':'1d6b:0003'}, {'hwid':'8087:0aaa'}, ...]
+        """
+        if self._usb_bus is not None:
+            return [{"hwid": hwid} for _, hwid, _, _, _ in self._usb_bus]
+
+        return self._get(
+            "usb", lambda: System(self.resources).get_usb_devices()
+        )
+
+    def usb_serial_numbers(self, hwid: str) -> Optional[List[Optional[str]]]:
+        """Returns the serial numbers of the connected USB devices with the
+        given vid:pid, e.g. '0403:6010', with None for the devices without
+        a serial number, or None if the USB devices can't be read from
+        sysfs."""
+        if self._usb_bus is None:
+            return None
+        return [
+            serial
+            for _, device_hwid, _, _, serial in self._usb_bus
+            if device_hwid == hwid.lower()
+        ]
+
+    def ftdi_devices(self) -> List[dict]:
+        """Returns the connected FTDI devices, see
+        System.get_ftdi_devices()."""
+        return self._get(
+            "ftdi", lambda: System(self.resources).get_ftdi_devices()
+        )
+
+    def serial_ports(self) -> List[dict]:
+        """Returns the connected USB serial ports, see
+        util.get_serial_ports()."""
+        return self._get("serial", util.get_serial_ports)
+
+    def tinyprog_meta(self) -> List[dict]:
+        """Returns the meta data of the connected TinyFPGA boards, see
+        util.get_tinyprog_meta()."""
+        return self._get("tinyprog", util.get_tinyprog_meta)
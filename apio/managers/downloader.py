@@ -9,100 +9,475 @@
 # ---- Licence Apache v2
 """Implement a remote file downloader. Used to fetch packages from github
 packages release repositorie.s
+
+Files are downloaded into a '<file>.part' file, in parallel segments when
+the server supports HTTP ranges. The progress of the segments is saved in
+a '<file>.part.json' state file such that an interrupted download is
+resumed by the next download of the same url. The '.part' file is renamed
+to the destination file only after its size and optional sha256 checksum
+were verified.
+
+Alternatively, stream() passes the file content to a consumer while it's
+downloaded, e.g. to unpack a tar.gz package without storing it first.
 """
 
 # pylint: disable=fixme
 # TODO: capture all the exceptions and return them as method return status.
 # Motivation is simplifying the usage.
 
-from math import ceil
-import requests
+import os
+import json
+import time
+import hashlib
+import threading
+from functools import cache
+from pathlib import Path
+from typing import Optional, List, Dict, Callable, BinaryIO
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 import click
 from apio import util
+from apio.managers.package_manifest import file_hash
 
 # -- Timeout for geting a reponse from the server when downloading
 # -- a file (in seconds)
 TIMEOUT = 5
 
+# -- The version of the '.part.json' state file format.
+STATE_FORMAT = 1
+
+
+# -- Set to stop all the downloads in progress, e.g. when the user presses
+# -- Ctrl-C while packages are installed in parallel.
+_cancel_event = threading.Event()
+
+
+class DownloadNotFoundError(util.ApioException):
+    """The file to download doesn't exist on the server."""
+
+
+class DownloadCancelledError(util.ApioException):
+    """The download was stopped by cancel_downloads()."""
 
+
+def cancel_downloads() -> None:
+    """Stops the downloads in progress, in all the threads, which raise
+    DownloadCancelledError. The interrupted downloads are kept for
+    resuming later, as with Ctrl-C."""
+    _cancel_event.set()
+
+
+@cache
+def get_session():
+    """Returns a requests session that is shared by the apio downloads,
+    such that connections to the same server are reused."""
+
+    # pylint: disable=import-outside-toplevel
+    import requests
+
+    session = requests.Session()
+    # -- Range requests require the raw, unencoded content.
+    session.headers["Accept-Encoding"] = "identity"
+    return session
+
+
+# R0902: Too many instance attributes
+# pylint: disable=R0902
 class FileDownloader:
     """Class for downloading files"""
 
-    CHUNK_SIZE = 1024
+    # -- The range of the size of the blocks we read from the server. The
+    # -- size adapts to the connection speed such that each read takes
+    # -- about TARGET_CHUNK_TIME seconds.
+    MIN_CHUNK_SIZE = 256 * 1024
+    MAX_CHUNK_SIZE = 4 * 1024 * 1024
+    TARGET_CHUNK_TIME = 0.5
+
+    # -- The max number of parallel segments and the min size of a segment.
+    # -- Smaller files are downloaded with a single request.
+    MAX_SEGMENTS = 4
+    MIN_SEGMENT_SIZE = 4 * 1024 * 1024
 
-    def __init__(self, url: str, dest_dir=None):
+    # -- Min time between saves of the state file, in seconds.
+    STATE_SAVE_PERIOD = 1.0
+
+    def __init__(
+        self,
+        url: str,
+        dest_dir=None,
+        *,
+        sha256: Optional[str] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ):
         """Initialize a FileDownloader object
         * INPUTs:
           * url: File to download (full url)
                  (Ex. 'https://github.com/FPGAwars/apio-examples/
                        releases/download/0.0.35/apio-examples-0.0.35.zip')
           * dest_dir: Destination folder (where to download the file)
+          * sha256: Optional expected sha256 of the file, as a hex string.
+          * on_progress: Optional callback that is called with the bytes
+            downloaded and the file size instead of showing a progress bar.
         """
 
         # -- Store the url
         self._url = url
+        self._sha256 = sha256.lower() if sha256 else None
+        self._on_progress = on_progress
 
         # -- Get the file from the url
         # -- Ex: 'apio-examples-0.0.35.zip'
         self.fname = url.split("/")[-1]
 
         # -- Build the destination path
-        self.destination = self.fname
+        self.destination = Path(self.fname)
         if dest_dir:
 
             # -- Add the path
-            self.destination = dest_dir / self.fname
+            self.destination = Path(dest_dir) / self.fname
+
+        # -- The partial file and its state file.
+        self.part_file = self.destination.with_name(self.fname + ".part")
+        self.state_file = self.destination.with_name(self.fname + ".part.json")
+
+        self._session = get_session()
+
+        # -- Total bytes written to the part file, in all segments.
+        self._done_bytes = 0
+        self._segments: List[Dict[str, int]] = []
+        self._lock = threading.Lock()
+        self._last_state_save = 0.0
 
-        self._progressbar = None
-        self._request = None
+        # -- Set when the segment threads should stop.
+        self._segments_abort = False
 
-        # -- Request the file
-        self._request = requests.get(url, stream=True, timeout=TIMEOUT)
+        # -- Request the file headers. This also follows the github
+        # -- redirections to the actual file server.
+        response = self._session.head(
+            url, allow_redirects=True, timeout=TIMEOUT
+        )
+
+        # -- Some servers don't allow HEAD requests. Get the headers with a
+        # -- GET request instead, without reading its content.
+        if response.status_code in (403, 405):
+            response = self._session.get(
+                url, stream=True, allow_redirects=True, timeout=TIMEOUT
+            )
+            response.close()
 
         # -- Raise an exception in case of download error...
-        if self._request.status_code != 200:
+        if response.status_code != 200:
             click.secho(
                 "Got an unexpected HTTP status code: "
-                f"{self._request.status_code}"
+                f"{response.status_code}"
                 f"\nWhen downloading {url}",
                 fg="red",
             )
+            if response.status_code == 404:
+                raise DownloadNotFoundError()
             raise util.ApioException()
 
+        # -- The file url after redirections. We download the segments from
+        # -- it directly.
+        self._file_url = response.url
+
+        # -- The file size, None if unknown.
+        length = response.headers.get("content-length")
+        self._size = int(length) if length else None
+
+        # -- A string that changes when the file on the server changes.
+        self._validator = response.headers.get(
+            "etag", response.headers.get("last-modified", "")
+        )
+
+        # -- Ranges are used only if we know the file size.
+        self._ranges = (
+            self._size is not None
+            and response.headers.get("accept-ranges", "") == "bytes"
+        )
+
     def get_size(self) -> int:
-        """Return the size (in bytes) of the latest bytes block received"""
+        """Return the size (in bytes) of the file, or 0 if unknown."""
 
-        return int(self._request.headers["content-length"])
+        return self._size or 0
 
     def start(self):
         """Start the downloading of the file"""
 
-        # -- Download iterator
-        itercontent = self._request.iter_content(chunk_size=self.CHUNK_SIZE)
+        if self._ranges:
+            self._load_or_init_state()
+        else:
+            self._segments = [{"start": 0, "end": -1, "done": 0}]
+            self._done_bytes = 0
+            self.state_file.unlink(missing_ok=True)
+            self.part_file.unlink(missing_ok=True)
+
+        # -- Preallocate the part file so the segments can write at their
+        # -- offsets.
+        if not self.part_file.exists():
+            with open(self.part_file, "wb") as file:
+                file.truncate(self._size or 0)
+
+        # -- Download the pending segments in parallel and show a progress
+        # -- bar with the total progress.
+        pending = [s for s in self._segments if not self._segment_done(s)]
+        with util.progressbar(
+            length=self._size or 1,
+            label="Downloading",
+            on_progress=self._on_progress,
+        ) as pbar:
+            reported = self._done_bytes
+            pbar.update(reported)
+            with ThreadPoolExecutor(max_workers=len(pending) or 1) as pool:
+                futures = [
+                    pool.submit(self._download_segment, s) for s in pending
+                ]
+                try:
+                    not_done = futures
+                    while not_done:
+                        _, not_done = wait(
+                            not_done, timeout=0.1, return_when=FIRST_EXCEPTION
+                        )
+                        pbar.update(self._done_bytes - reported)
+                        reported = self._done_bytes
+                        # -- Raise the first segment error, if any.
+                        for future in futures:
+                            if future.done() and future.exception():
+                                raise future.exception()
+                finally:
+                    # -- Stop the other segments and save the progress,
+                    # -- for resuming later.
+                    self._segments_abort = True
+                    for future in futures:
+                        future.cancel()
+                    wait(futures)
+                    if self._ranges:
+                        self._save_state(force=True)
+
+        self._verify()
+
+        # -- Download done!
+        os.replace(self.part_file, self.destination)
+        self.state_file.unlink(missing_ok=True)
 
-        # -- Open destination file, for writing bytes
-        with open(self.destination, "wb") as file:
+    def stream(
+        self,
+        consumer: Callable[[BinaryIO], None],
+        copy_to: Optional[BinaryIO] = None,
+    ) -> None:
+        """Downloads the file and passes its content to the given consumer,
+        as a binary file object, while it's downloaded. If copy_to is given,
+        the content is also written to it. Once the consumer returns, the
+        size and checksum of the content are verified and an exception is
+        raised if they don't match. Streamed downloads are not
+        resumable."""
 
-            # -- Get the file length in Kbytes
-            chunks = int(ceil(self.get_size() / float(self.CHUNK_SIZE)))
+        with self._session.get(
+            self._file_url, stream=True, timeout=TIMEOUT
+        ) as response:
+            if response.status_code != 200:
+                raise IOError(
+                    f"Unexpected HTTP status code {response.status_code} "
+                    f"when downloading {self._url}"
+                )
 
-            # -- Download the file. Show a progress bar
-            with click.progressbar(
-                length=chunks,
-                label=click.style("Downloading", fg="yellow"),
-                fill_char=click.style("█", fg="blue"),
-                empty_char=click.style("░", fg="blue"),
+            with util.progressbar(
+                length=self._size or 1,
+                label="Downloading",
+                on_progress=self._on_progress,
             ) as pbar:
-                for _ in pbar:
+                reader = _VerifyingReader(response.raw, pbar, copy_to)
+                consumer(reader)
 
-                    # -- Receive next block of bytes
-                    file.write(next(itercontent))
+                # -- Read any trailing bytes the consumer didn't need, e.g.
+                # -- the padding at the end of a tar file.
+                while reader.read(self.MAX_CHUNK_SIZE):
+                    pass
 
-        # -- Download done!
-        self._request.close()
+        self._done_bytes = reader.size
+        error = self._content_error(reader.size, reader.sha256.hexdigest)
+        if error:
+            click.secho(
+                f"Error: corrupted download of {self._url}\n{error}",
+                fg="red",
+            )
+            raise util.ApioException()
+
+    @staticmethod
+    def _segment_done(segment: Dict[str, int]) -> bool:
+        """Returns True if the given segment was fully downloaded."""
+        size = segment["end"] - segment["start"]
+        return segment["done"] >= size >= 0
+
+    def _load_or_init_state(self) -> None:
+        """Loads the segments of a previous interrupted download of the
+        same file, or splits the file to new segments."""
+
+        try:
+            with open(self.state_file, "r", encoding="utf8") as f:
+                state = json.load(f)
+            if (
+                state["format"] == STATE_FORMAT
+                and state["url"] == self._url
+                and state["size"] == self._size
+                and state["validator"] == self._validator
+                and self.part_file.stat().st_size == self._size
+            ):
+                self._segments = state["segments"]
+                self._done_bytes = sum(s["done"] for s in self._segments)
+                return
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        # -- Here when starting a new download.
+        self.part_file.unlink(missing_ok=True)
+        count = max(
+            1,
+            min(self.MAX_SEGMENTS, self._size // self.MIN_SEGMENT_SIZE),
+        )
+        bounds = [self._size * i // count for i in range(count + 1)]
+        self._segments = [
+            {"start": bounds[i], "end": bounds[i + 1], "done": 0}
+            for i in range(count)
+        ]
+        self._done_bytes = 0
+        self._save_state(force=True)
+
+    def _save_state(self, *, force: bool = False) -> None:
+        """Saves the segments progress in the state file. Unless forced,
+        the file is saved at most once per STATE_SAVE_PERIOD."""
+
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_state_save < (
+                self.STATE_SAVE_PERIOD
+            ):
+                return
+            self._last_state_save = now
+            state = {
+                "format": STATE_FORMAT,
+                "url": self._url,
+                "size": self._size,
+                "validator": self._validator,
+                "segments": [dict(s) for s in self._segments],
+            }
+
+        tmp_file = self.state_file.with_name(self.state_file.name + ".tmp")
+        with open(tmp_file, "w", encoding="utf8") as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def _download_segment(self, segment: Dict[str, int]) -> None:
+        """Downloads the missing bytes of the given segment. Called from a
+        worker thread."""
+
+        headers = {}
+        offset = segment["start"] + segment["done"]
+        if self._ranges:
+            headers["Range"] = f"bytes={offset}-{segment['end'] - 1}"
+
+        with self._session.get(
+            self._file_url, headers=headers, stream=True, timeout=TIMEOUT
+        ) as response:
+            expected_status = 206 if self._ranges else 200
+            if response.status_code != expected_status:
+                raise IOError(
+                    f"Unexpected HTTP status code {response.status_code} "
+                    f"when downloading {self._url}"
+                )
+
+            chunk_size = self.MIN_CHUNK_SIZE
+            with open(self.part_file, "r+b") as file:
+                file.seek(offset)
+                while not self._segments_abort:
+                    if _cancel_event.is_set():
+                        raise DownloadCancelledError()
+                    start_time = time.monotonic()
+                    data = response.raw.read(chunk_size)
+                    if not data:
+                        break
+                    file.write(data)
+
+                    # -- Data is flushed before it's recorded in the state,
+                    # -- so a resumed download never skips missing bytes.
+                    if self._ranges:
+                        file.flush()
+                    with self._lock:
+                        segment["done"] += len(data)
+                        self._done_bytes += len(data)
+                    if self._ranges:
+                        self._save_state()
+
+                    # -- Adapt the chunk size to the connection speed.
+                    elapsed = time.monotonic() - start_time
+                    if elapsed < self.TARGET_CHUNK_TIME / 2:
+                        chunk_size = min(chunk_size * 2, self.MAX_CHUNK_SIZE)
+                    elif elapsed > self.TARGET_CHUNK_TIME * 2:
+                        chunk_size = max(chunk_size // 2, self.MIN_CHUNK_SIZE)
+
+    def _verify(self) -> None:
+        """Verifies the size and checksum of the downloaded part file.
+        On a mismatch, deletes the part file, prints an error message and
+        raises an exception."""
+
+        # -- The part file is preallocated so we also check the number of
+        # -- bytes that were actually written to it.
+        size = min(self.part_file.stat().st_size, self._done_bytes)
+        error = self._content_error(
+            size, lambda: file_hash(self.part_file, "sha256")
+        )
+
+        if error:
+            self.part_file.unlink(missing_ok=True)
+            self.state_file.unlink(missing_ok=True)
+            click.secho(
+                f"Error: corrupted download of {self._url}\n{error}",
+                fg="red",
+            )
+            raise util.ApioException()
+
+    def _content_error(
+        self, size: int, get_sha256: Callable[[], str]
+    ) -> Optional[str]:
+        """Checks the size and the sha256 of the downloaded content against
+        the expected ones. The sha256 is computed only if needed. Returns
+        None if ok, or an error message otherwise."""
+
+        if self._size is not None and size != self._size:
+            return f"expected {self._size} bytes, got {size}"
+
+        if self._sha256:
+            sha256 = get_sha256()
+            if sha256 != self._sha256:
+                return (
+                    f"sha256 mismatch, expected {self._sha256}, got {sha256}"
+                )
+
+        return None
+
+
+# R0903: Too few public methods (1/2) (too-few-public-methods)
+# pylint: disable=R0903
+class _VerifyingReader:
+    """A read only binary file object that reads from a download response
+    and tracks the size and the sha256 of the content read so far. The
+    content is also written to copy_to, if not None."""
 
-    def __del__(self):
-        """Close any pending request"""
+    def __init__(self, raw, pbar, copy_to: Optional[BinaryIO]):
+        self._raw = raw
+        self._pbar = pbar
+        self._copy_to = copy_to
+        self.size = 0
+        self.sha256 = hashlib.sha256()
 
-        if self._request:
-            self._request.close()
+    def read(self, size: int = -1) -> bytes:
+        """Reads up to size bytes, or all the remaining bytes if size is
+        negative."""
+        if _cancel_event.is_set():
+            raise DownloadCancelledError()
+        data = self._raw.read(None if size < 0 else size)
+        self.size += len(data)
+        self.sha256.update(data)
+        self._pbar.update(len(data))
+        if self._copy_to:
+            self._copy_to.write(data)
+        return data
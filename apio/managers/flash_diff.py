@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""The difference between the bitstream in the flash of a board and a new
+bitstream, in flash sectors, used by 'apio upload --incremental' to write
+only the sectors that changed.
+"""
+
+from typing import List, Tuple
+
+# -- The flash erase block size of the programmers, e.g. iceprog erases
+# -- 64KB blocks.
+SECTOR_SIZE = 64 * 1024
+
+# -- Each range is written by a separate programmer run, which has a fixed
+# -- overhead. If there are more ranges, the nearest ones are merged.
+MAX_RANGES = 4
+
+
+def changed_ranges(
+    old: bytes,
+    new: bytes,
+    sector_size: int = SECTOR_SIZE,
+    max_ranges: int = MAX_RANGES,
+) -> List[Tuple[int, int]]:
+    """Returns the (offset, length) of the ranges of the new bitstream that
+    should be written to a flash that holds the old one, in sector
+    aligned offsets, sorted. The sectors after the end of the old bitstream
+    are taken as changed. Returns an empty list if nothing changed."""
+
+    # -- The changed sectors, merged into runs of [start, end) sectors.
+    runs = []
+    for sector in range((len(new) + sector_size - 1) // sector_size):
+        start = sector * sector_size
+        end = start + sector_size
+        if new[start:end] == old[start:end]:
+            continue
+        if runs and runs[-1][1] == sector:
+            runs[-1][1] = sector + 1
+        else:
+            runs.append([sector, sector + 1])
+
+    # -- Merge the runs with the smallest gaps between them.
+    while len(runs) > max_ranges:
+        i = min(
+            range(len(runs) - 1), key=lambda i: runs[i + 1][0] - runs[i][1]
+        )
+        runs[i][1] = runs.pop(i + 1)[1]
+
+    ranges = []
+    for start, end in runs:
+        offset = start * sector_size
+        ranges.append((offset, min(end * sector_size, len(new)) - offset))
+    return ranges
@@ -8,27 +8,60 @@ Used by the 'apio packages' command.
 """
 
 import sys
+import threading
 from pathlib import Path
-from typing import Tuple
+from typing import Tuple, Optional, BinaryIO, Callable, List, Dict
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 import shutil
+import tarfile
 import click
-import requests
-from apio import util, pkg_util
+from apio import util
 from apio.resources import Resources
-from apio.managers.downloader import FileDownloader
-from apio.managers.unpacker import FileUnpacker
+from apio.managers.downloader import (
+    FileDownloader,
+    DownloadNotFoundError,
+    DownloadCancelledError,
+    cancel_downloads,
+    get_session,
+    TIMEOUT,
+)
+from apio.managers.unpacker import (
+    FileUnpacker,
+    unpack_tar_stream,
+)
+from apio.managers import (
+    package_cache,
+    package_manifest,
+    package_store,
+    remote_cache,
+)
+from apio.managers.package_staging import (
+    get_rollback_paths,
+    prepare_staging_dir,
+    delete_package_dir,
+    swap_in_package,
+)
+
+# -- A callback that reports the progress of a package installation stage,
+# -- called with the stage name, e.g. 'Downloading', the steps done and the
+# -- total steps.
+ProgressCallback = Callable[[str, int, int], None]
 
 
 def _get_remote_version(
-    resources: Resources, package_name: str, verbose: bool
+    resources: Resources, package_name: str, verbose: bool, offline: bool
 ) -> str:
     """Get the recommanded package version from the remote release server.
-    This version is not necessarily the latest one on the server.
+    This version is not necessarily the latest one on the server. The
+    version is cached, see remote_cache.fetch().
 
     - INPUTS:
       'resources' the Resources object of this apio session.
       'package_name' the package name, e.g. 'oss-cad-suite'.
       'verbose' indicates if to print detailed info.
+      'offline' indicates if to use only a cached version.
 
     - OUTPUT:
       A string with the package version (E.g. '0.0.35'). Exits with a user
@@ -44,23 +77,25 @@ def _get_remote_version(
     if verbose:
         print(f"Remote version url '{version_url}'")
 
-    # -- Fetch the version info.
-    resp: requests.Response = requests.get(version_url, timeout=5)
+    # -- Fetch the version info. Extract the version without the ending \n
+    try:
+        version = remote_cache.fetch(
+            version_url,
+            offline=offline,
+            extract=lambda text: text.rstrip("\n"),
+        )
 
     # -- Exit if http error.
-    if resp.status_code != 200:
+    except IOError as exc:
         click.secho("Error downloading the version file", fg="red")
         click.secho(f"URL {version_url}", fg="red")
-        click.secho(f"Error code {resp.status_code}", fg="red")
+        click.secho(str(exc), fg="red")
         sys.exit(1)
 
     # -- Here when download was ok.
     if verbose:
         print("Remote version file downloaded")
 
-    # -- Extract the version without the ending \n
-    version = resp.text.rstrip("\n")
-
     if verbose:
         print(f"Remote version {version}")
 
@@ -123,12 +158,53 @@ def _construct_package_download_url(
     return download_url
 
 
-def _download_package_file(url: str, dir_path: Path) -> str:
+def _get_package_sha256(url: str, verbose: bool) -> Optional[str]:
+    """Get the expected sha256 of the package file with the given url from
+    the '<url>.sha256' file on the release server, if it exists. The
+    checksum is the first word of that file, as done by 'sha256sum'.
+
+    Returns the sha256 hex string or None if not available.
+    """
+    checksum_url = f"{url}.sha256"
+    try:
+        resp = get_session().get(checksum_url, timeout=TIMEOUT)
+    except IOError:
+        resp = None
+
+    tokens = resp.text.split() if resp and resp.status_code == 200 else []
+    if not tokens or len(tokens[0]) != 64:
+        if verbose:
+            print("No package checksum, verifying the package size only")
+        return None
+
+    if verbose:
+        print(f"Package sha256 {tokens[0]}")
+    return tokens[0]
+
+
+def _stage_progress(
+    on_progress: Optional[ProgressCallback], stage: str
+) -> Optional[Callable[[int, int], None]]:
+    """Returns a progress callback of the downloader or the unpacker that
+    reports the progress of the given stage to on_progress, or None if
+    on_progress is None."""
+    return partial(on_progress, stage) if on_progress else None
+
+
+def _download_package_file(
+    url: str,
+    dir_path: Path,
+    sha256: Optional[str],
+    on_progress: Optional[ProgressCallback] = None,
+) -> str:
     """Download the given file (url). Return the path of local destination
     file. Exits with a user message and error code if any error.
 
     * INPUTS:
       * url: File to download
+      * dir_path: The directory to download to
+      * sha256: The expected sha256 of the file, or None if not known.
+      * on_progress: Optional progress callback instead of a progress bar.
     * OUTPUTS:
       * The path of the destination file
     """
@@ -137,15 +213,21 @@ def _download_package_file(url: str, dir_path: Path) -> str:
 
     try:
         # -- Object for downloading the file
-        downloader = FileDownloader(url, dir_path)
+        downloader = FileDownloader(
+            url,
+            dir_path,
+            sha256=sha256,
+            on_progress=_stage_progress(on_progress, "Downloading"),
+        )
 
         # -- Get the destination path
         filepath = downloader.destination
 
         downloader.start()
 
-    # -- If the user press Ctrl-C (Abort)
-    except KeyboardInterrupt:
+    # -- If the user press Ctrl-C (Abort). The partial download is kept
+    # -- and is resumed by the next install of this package.
+    except (KeyboardInterrupt, DownloadCancelledError):
 
         # -- Remove the file
         if filepath and filepath.is_file():
@@ -160,20 +242,175 @@ def _download_package_file(url: str, dir_path: Path) -> str:
         click.secho(str(exc), fg="red")
         sys.exit(1)
 
-    except util.ApioException:
+    except DownloadNotFoundError:
         click.secho("Error: package not found", fg="red")
         sys.exit(1)
 
+    except util.ApioException:
+        click.secho("Error: package download failed", fg="red")
+        sys.exit(1)
+
     # -- Return the destination path
     return filepath
 
 
-def _unpack_package_file(package_file: Path, package_dir: Path) -> None:
-    """Unpack the package_file in the package_dir directory.
-    Exit with an error message and error status if any error."""
+def _download_and_unpack_package(
+    url: str,
+    staging_dir: Path,
+    sha256: Optional[str],
+    copy_to: Optional[BinaryIO],
+    on_progress: Optional[ProgressCallback] = None,
+) -> None:
+    """Download a tar.gz package file and unpack it in the staging dir while
+    it's downloaded, without storing the package file. Exits with a user
+    message and error code if any error.
+
+    * INPUTS:
+      * url: The package file to download.
+      * staging_dir: The empty dir to unpack into.
+      * sha256: The expected sha256 of the file, or None if not known.
+      * copy_to: An optional file object to write the package file to.
+      * on_progress: Optional progress callback instead of a progress bar.
+    """
+
+    error = None
+    try:
+        downloader = FileDownloader(
+            url,
+            staging_dir.parent,
+            sha256=sha256,
+            on_progress=_stage_progress(on_progress, "Downloading"),
+        )
+        downloader.stream(
+            lambda fileobj: unpack_tar_stream(fileobj, staging_dir),
+            copy_to=copy_to,
+        )
+
+    # -- If the user press Ctrl-C (Abort)
+    except (KeyboardInterrupt, DownloadCancelledError):
+        error = "User abborted download"
+
+    except (IOError, tarfile.TarError) as exc:
+        error = f"I/O error while downloading\n{exc}"
+
+    except DownloadNotFoundError:
+        error = "Error: package not found"
+
+    except util.ApioException:
+        error = "Error: package download failed"
+
+    if error:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        click.secho(error, fg="red")
+        sys.exit(1)
 
-    # -- Create the unpacker.
-    operation = FileUnpacker(package_file, package_dir)
+
+# pylint: disable=too-many-arguments
+def _fetch_package(
+    url: str,
+    packages_dir: Path,
+    staging_dir: Path,
+    verbose: bool,
+    *,
+    offline: bool,
+    on_progress: Optional[ProgressCallback] = None,
+) -> None:
+    """Gets the package file with the given url from the local mirror, the
+    package files cache, or the release server, in this order, and unpacks
+    it in the staging dir. Downloaded package files are added to the
+    cache, if enabled. In offline mode, the release server is not used.
+    on_progress, if given, replaces the progress bars. Exits with a user
+    message and error code if any error."""
+
+    file_name = url.split("/")[-1]
+
+    # -- Case 1: The package file is in the local mirror.
+    mirror_file = package_cache.get_mirror_file(file_name)
+    if mirror_file:
+        if verbose:
+            print(f"Mirror file: {mirror_file}")
+        sha256 = package_cache.get_mirror_sha256(mirror_file)
+        if (
+            sha256
+            and package_manifest.file_hash(mirror_file, "sha256") != sha256
+        ):
+            click.secho(
+                f"Error: sha256 mismatch of mirror file {mirror_file}",
+                fg="red",
+            )
+            sys.exit(1)
+        _unpack_package_file(mirror_file, staging_dir, on_progress)
+        return
+
+    # -- Get the expected checksum of the package file, if available.
+    sha256 = None if offline else _get_package_sha256(url, verbose)
+
+    # -- The lock makes concurrent apio processes that need the same file
+    # -- download it only once.
+    cache = package_cache.get_package_cache()
+    with cache.lock(file_name) if cache else nullcontext():
+
+        # -- Case 2: The package file is in the cache.
+        cached_file = cache.lookup(file_name, sha256) if cache else None
+        if cached_file:
+            if verbose:
+                print(f"Cached file: {cached_file}")
+            _unpack_package_file(cached_file, staging_dir, on_progress)
+            return
+
+        if offline:
+            click.secho(
+                f"Error: package file {file_name} is not in the packages "
+                "mirror or cache, it can't be installed offline.",
+                fg="red",
+            )
+            sys.exit(1)
+
+        # -- Case 3: tar.gz packages are downloaded and unpacked in a
+        # -- single pass.
+        if file_name.endswith(".tar.gz"):
+            with (
+                cache.writer(file_name) if cache else nullcontext()
+            ) as copy_to:
+                _download_and_unpack_package(
+                    url, staging_dir, sha256, copy_to, on_progress
+                )
+            return
+
+        # -- Case 4: Downlod the package file from the remote server, verify
+        # -- it against its checksum, and unpack it.
+        local_file = _download_package_file(
+            url, packages_dir, sha256, on_progress
+        )
+        if verbose:
+            print(f"Local file: {local_file}")
+        _unpack_package_file(local_file, staging_dir, on_progress)
+        if cache:
+            cache.add_file(file_name, local_file)
+
+        # -- Remove the package file. We don't need it anymore.
+        if verbose:
+            print(f"Deleting package file {local_file}")
+        local_file.unlink()
+
+
+def _unpack_package_file(
+    package_file: Path,
+    package_dir: Path,
+    on_progress: Optional[ProgressCallback] = None,
+) -> None:
+    """Unpack the package_file in the package_dir directory. on_progress,
+    if given, replaces the progress bar. Exit with an error message and
+    error status if any error."""
+
+    # -- Create the unpacker. Package files are not modified after they are
+    # -- installed so identical files can share their storage.
+    operation = FileUnpacker(
+        package_file,
+        package_dir,
+        hardlink_duplicates=True,
+        on_progress=_stage_progress(on_progress, "Unpacking"),
+    )
 
     # -- Perform the operation.
     ok = operation.start()
@@ -207,37 +444,121 @@ def _parse_package_spec(package_spec: str) -> Tuple[str, str]:
     return (package_name, package_version)
 
 
-def _delete_package_dir(
-    resources: Resources, package_id: str, verbose: bool
+def _get_target_version(
+    resources: Resources,
+    package_name: str,
+    version: str,
+    verbose: bool,
+    offline: bool,
+) -> str:
+    """Returns the version to install of the given package. If the user
+    didn't specify a version we use the one recomanded by the release
+    server.
+
+    Note that we use the remote version even if the current installed
+    version is ok by the version spec in distribution.json."""
+    if version:
+        return version
+    return _get_remote_version(resources, package_name, verbose, offline)
+
+
+def _is_version_installed(
+    resources: Resources, package_name: str, version: str, verbose: bool
 ) -> bool:
-    """Delete the directory of the package with given name.  Returns
-    True if the packages existed. Exits with an error message on error."""
+    """Returns True if the given version of the package is installed."""
+
+    # -- Get the version of the installed package, None otherwise.
+    installed_version = resources.profile.get_package_installed_version(
+        package_name, default=None
+    )
 
-    package_dir = resources.get_package_dir(package_id)
+    if verbose:
+        print(f"Installed version {installed_version}")
 
-    dir_found = package_dir.is_dir()
-    if dir_found:
-        if verbose:
-            click.secho(f"Deleting {str(package_dir)}")
+    return version == installed_version
 
-        # -- Sanity check the path and delete.
-        package_folder_name = resources.get_package_folder_name(package_id)
-        assert package_folder_name in str(package_dir), package_dir
-        shutil.rmtree(package_dir)
 
-    if package_dir.exists():
-        click.secho(
-            f"Error: directory deletion failed: {str(package_dir.absolute())}",
-            fg="yellow",
+# pylint: disable=too-many-arguments
+def _install_package_version(
+    resources: Resources,
+    package_name: str,
+    target_version: str,
+    verbose: bool,
+    *,
+    offline: bool,
+    on_progress: Optional[ProgressCallback] = None,
+) -> None:
+    """Downloads and unpacks the given version of the package and replaces
+    the package dir with it. The profile is not updated. In offline mode,
+    the package file must be in the packages mirror or cache. on_progress,
+    if given, replaces the progress bars. Exits the program with an error
+    status and a user message if an error is detected."""
+
+    # -- Get package information (originated from packages.json)
+    package_info = resources.get_package_info(package_name)
+
+    # -- Construct the download URL.
+    download_url = _construct_package_download_url(
+        resources, package_name, target_version
+    )
+    if verbose:
+        print(f"Download URL: {download_url}")
+
+    # -- Prepare the packages directory.
+    packages_dir = util.get_packages_dir()
+    packages_dir.mkdir(exist_ok=True)
+
+    # -- The package is unpacked in a staging dir and replaces the current
+    # -- package dir only once it was unpacked successfully.
+    staging_dir = prepare_staging_dir(
+        resources.get_package_dir(package_name), verbose
+    )
+    _fetch_package(
+        download_url,
+        packages_dir,
+        staging_dir,
+        verbose,
+        offline=offline,
+        on_progress=on_progress,
+    )
+
+    # -- Get optional package internal wrapper dir name. It may contain a %V
+    # -- placeholder, Replace it with target version.
+    uncompressed_name = package_info["release"].get("uncompressed_name", "")
+    uncompressed_name = uncompressed_name.replace("%V", target_version)
+    unpacked_dir = staging_dir / uncompressed_name
+
+    # -- Write the manifest of the package files, for 'apio packages
+    # -- --verify', and replace the files with hardlinks to the package
+    # -- store, such that files that didn't change since other installed
+    # -- versions are stored once.
+    if verbose:
+        print("Creating the package manifest")
+    if unpacked_dir.is_dir():
+        manifest = package_manifest.create_manifest(
+            unpacked_dir,
+            version=target_version,
+            package_file=download_url.rsplit("/", maxsplit=1)[-1],
+            prefix=uncompressed_name,
+            on_progress=_stage_progress(on_progress, "Indexing"),
         )
-        sys.exit(1)
+        saved = package_store.get_package_store().intern(
+            unpacked_dir, manifest
+        )
+        if verbose:
+            print(f"Shared {saved / 1e6:.1f} MB with the package store")
 
-    return dir_found
+    # -- Replace the package dir with the new version.
+    swap_in_package(resources, package_name, unpacked_dir, verbose)
 
 
-# pylint: disable=too-many-branches
 def install_package(
-    resources: Resources, *, package_spec: str, force: bool, verbose: bool
+    resources: Resources,
+    *,
+    package_spec: str,
+    force: bool,
+    verbose: bool,
+    offline: bool = False,
 ) -> None:
     """Install a given package.
 
@@ -247,6 +568,8 @@ def install_package(
     'force' indicates if to perform the installation even if a matching
         package is already installed.
     `verbose` indicates if to print extra information.
+    'offline' indicates if to use only cached versions and the packages
+        mirror and cache, without network access.
 
     Returns normally if no error, exits the program with an error status
     and a user message if an error is detected.
@@ -256,108 +579,227 @@ def install_package(
     # Parse the requested package spec.
     package_name, target_version = _parse_package_spec(package_spec)
 
-    # -- Get package information (originated from packages.json)
-    package_info = resources.get_package_info(package_name)
+    # -- Make sure the package exists (originated from packages.json)
+    resources.get_package_info(package_name)
 
-    # -- If the user didn't specify a target version we use the one recomanded
-    # -- by the release server.
-    # --
-    # -- Note that we use the remote version even if the current installed
-    # -- version is ok by the version spec in distribution.json.
-    if not target_version:
-        target_version = _get_remote_version(resources, package_name, verbose)
+    target_version = _get_target_version(
+        resources, package_name, target_version, verbose, offline
+    )
 
     click.secho(f"Target version {target_version}")
 
     # -- If not focring and the target version already installed nothing to do.
-    if not force:
-        # -- Get the version of the installed package, None otherwise.
-        installed_version = resources.profile.get_package_installed_version(
-            package_name, default=None
+    if not force and _is_version_installed(
+        resources, package_name, target_version, verbose
+    ):
+        click.secho(
+            f"Version {target_version} was already installed", fg="green"
         )
+        return
 
-        if verbose:
-            print(f"Installed version {installed_version}")
-
-        # -- If the installed and the target versions are the same then
-        # -- nothing to do.
-        if target_version == installed_version:
-            click.secho(
-                f"Version {target_version} was already installed", fg="green"
-            )
-            return
-
-    # -- Construct the download URL.
-    download_url = _construct_package_download_url(
-        resources, package_name, target_version
+    _install_package_version(
+        resources, package_name, target_version, verbose, offline=offline
     )
-    if verbose:
-        print(f"Download URL: {download_url}")
 
-    # -- Prepare the packages directory.
-    packages_dir = util.get_packages_dir()
-    packages_dir.mkdir(exist_ok=True)
-
-    # -- Prepare the package directory.
-    package_dir = resources.get_package_dir(package_name)
-
-    # -- Downlod the package file from the remote server.
-    local_file = _download_package_file(download_url, packages_dir)
-    if verbose:
-        print(f"Local file: {local_file}")
-
-    # -- Get optional package internal wrapper dir name.
-    uncompressed_name = package_info["release"].get("uncompressed_name", "")
+    # -- Add package to profile and save.
+    resources.profile.add_package(package_name, target_version)
+    resources.profile.save()
 
-    # -- Delete the old package dir, if exists, to avoid name conflicts and
-    # -- left over files.
-    _delete_package_dir(resources, package_name, verbose)
+    # -- Inform the user!
+    click.secho(
+        f"Package '{package_name}' installed successfully",
+        fg="green",
+    )
 
-    if uncompressed_name:
 
-        # -- Case 1: The package include a top level wrapper directory.
-        #
-        # -- Unpack the package one level up, in the packages directory.
-        _unpack_package_file(local_file, packages_dir)
+class _InstallDisplay:
+    """A multi line display of the status of concurrent package
+    installations, with a line per package. If the output is not a
+    terminal, the status changes are printed as they happen, without the
+    progress percentage."""
+
+    def __init__(self, package_names: List[str]):
+        self._names = package_names
+        self._status = {name: "Waiting" for name in package_names}
+        self._stages = {name: "" for name in package_names}
+        self._width = max(len(name) for name in package_names)
+        self._tty = sys.stdout.isatty()
+        self._drawn = False
+        self._lock = threading.Lock()
+
+    def set(self, package_name: str, status: str, **styles) -> None:
+        """Sets the status line of the given package."""
+        with self._lock:
+            self._status[package_name] = click.style(status, **styles)
+            if self._tty:
+                self._draw()
+            else:
+                click.echo(f"{package_name}: {self._status[package_name]}")
+
+    def progress(
+        self, package_name: str, stage: str, done: int, total: int
+    ) -> None:
+        """A ProgressCallback for the given package."""
+        percent = min(100, done * 100 // total) if total else 0
+        status = f"{stage} {percent}%"
+        if self._tty:
+            if status != self._status[package_name]:
+                with self._lock:
+                    self._status[package_name] = status
+                    self._draw()
+        elif stage != self._stages[package_name]:
+            self.set(package_name, stage)
+        self._stages[package_name] = stage
+
+    def _draw(self) -> None:
+        """Redraws the status lines over the previous ones."""
+        lines = "".join(
+            f"\r\x1b[K{name:<{self._width}}  {self._status[name]}\n"
+            for name in self._names
+        )
+        if self._drawn:
+            lines = f"\x1b[{len(self._names)}A" + lines
+        click.echo(lines, nl=False)
+        self._drawn = True
+
+
+# R0914: Too many local variables (16/15)
+# pylint: disable=R0914
+def install_packages(
+    resources: Resources,
+    *,
+    package_specs: List[str],
+    force: bool,
+    verbose: bool,
+    offline: bool = False,
+) -> None:
+    """Install the given packages, concurrently. The remote versions are
+    resolved, and the packages are downloaded and unpacked, in parallel,
+    and the profile is updated once all of them are done. In verbose mode,
+    or for a single package, the packages are installed one by one.
+
+    The arguments are as in install_package(). Returns normally if no
+    error, exits the program with an error status and a user message if an
+    error is detected.
+    """
 
-        # -- The uncompressed name may contain a %V placeholder, Replace it
-        # -- with target version.
-        uncompressed_name = uncompressed_name.replace("%V", target_version)
+    # -- Parse the package specs, and check the package names, before we
+    # -- start. A package that is given more than once is installed once.
+    specs = _dedup_package_specs(
+        [_parse_package_spec(spec) for spec in package_specs]
+    )
+    for package_name, _ in specs:
+        resources.get_package_info(package_name)
+
+    if verbose or len(specs) < 2:
+        for package_name, version in specs:
+            install_package(
+                resources,
+                package_spec=(
+                    f"{package_name}@{version}" if version else package_name
+                ),
+                force=force,
+                verbose=verbose,
+                offline=offline,
+            )
+        return
 
-        # -- Construct the local path of the wrapper dir.
-        wrapper_dir = packages_dir / uncompressed_name
+    click.secho(f"Installing {util.count(specs, 'package')}")
+    display = _InstallDisplay([name for name, _ in specs])
 
-        # -- Rename the wrapper dir to the package dir.
-        if verbose:
-            print(f"Renaming {wrapper_dir} to {package_dir}")
-        if not wrapper_dir.is_dir():
-            click.secho(f"Error: no unpacked dir {wrapper_dir}", fg="red")
-            sys.exit(1)
-        wrapper_dir.rename(package_dir)
-
-    else:
-        # -- Case 2: package does not include a wrapper dir and we can simply
-        # -- unpack as the package dir.
+    def install(package_name: str, target_version: str) -> Optional[str]:
+        """Installs a package. Called from a worker thread. Returns the
+        installed version or None if already installed."""
+        display.set(package_name, "Resolving version")
+        target_version = _get_target_version(
+            resources, package_name, target_version, False, offline
+        )
+        if not force and _is_version_installed(
+            resources, package_name, target_version, verbose=False
+        ):
+            display.set(
+                package_name, f"Version {target_version} already installed"
+            )
+            return None
+        _install_package_version(
+            resources,
+            package_name,
+            target_version,
+            verbose=False,
+            offline=offline,
+            on_progress=partial(display.progress, package_name),
+        )
+        display.set(package_name, f"Installed version {target_version}")
+        return target_version
 
-        # -- Unpack the package. This creates a new package dir.
-        _unpack_package_file(local_file, package_dir)
+    installed: Dict[str, str] = {}
+    failed = []
+    pool = ThreadPoolExecutor(max_workers=len(specs))
+    try:
+        futures = {pool.submit(install, *spec): spec[0] for spec in specs}
+        for future in as_completed(futures):
+            package_name = futures[future]
+            # -- The installation functions exit on errors.
+            try:
+                version = future.result()
+            except (Exception, SystemExit):  # pylint: disable=broad-except
+                display.set(package_name, "Failed", fg="red")
+                failed.append(package_name)
+                continue
+            if version:
+                installed[package_name] = version
+    except KeyboardInterrupt:
+        # -- Don't start the pending installs and stop the downloads in
+        # -- progress, which are kept for resuming. Nothing is committed
+        # -- to the profile.
+        pool.shutdown(wait=False, cancel_futures=True)
+        cancel_downloads()
+        click.secho("User abborted installation", fg="red")
+        sys.exit(1)
+    pool.shutdown()
 
-    # -- Remove the package file. We don't need it anymore.
-    if verbose:
-        print(f"Deleting package file {local_file}")
-    local_file.unlink()
+    # -- Commit all the installed versions with a single profile save.
+    for package_name, version in installed.items():
+        resources.profile.add_package(package_name, version)
+    if installed:
+        resources.profile.save()
 
-    # -- Add package to profile and save.
-    resources.profile.add_package(package_name, target_version)
-    resources.profile.save()
+    if failed:
+        click.secho(
+            f"Error: failed to install {util.count(failed, 'package')}: "
+            f"{', '.join(failed)}",
+            fg="red",
+        )
+        sys.exit(1)
 
-    # -- Inform the user!
     click.secho(
-        f"Package '{package_name}' installed successfully",
+        f"{util.count(installed, 'package')} installed successfully",
         fg="green",
     )
 
 
+def _dedup_package_specs(
+    specs: List[Tuple[str, str]]
+) -> List[Tuple[str, str]]:
+    """Returns the given (name, version) package specs with a single spec
+    per package, in their original order. A spec without a version is
+    dropped if the package is also given with a version. Exits with an
+    error message if a package is given with different versions."""
+    versions: Dict[str, str] = {}
+    for package_name, version in specs:
+        other_version = versions.setdefault(package_name, version)
+        if version and other_version and version != other_version:
+            click.secho(
+                f"Error: package '{package_name}' is given with versions "
+                f"{other_version} and {version}",
+                fg="red",
+            )
+            sys.exit(1)
+        if version:
+            versions[package_name] = version
+    return list(versions.items())
+
+
 def uninstall_package(
     resources: Resources, *, package_spec: str, verbose: bool
 ):
@@ -375,7 +817,15 @@ def uninstall_package(
     click.secho(f"Uninstalling package '{package_name}'")
 
     # -- Remove the folder with all its content!!
-    dir_existed = _delete_package_dir(resources, package_name, verbose)
+    dir_existed = delete_package_dir(resources, package_name, verbose)
+
+    # -- Remove the previous version, if any.
+    rollback_dir, rollback_info = get_rollback_paths(
+        resources.get_package_dir(package_name)
+    )
+    if rollback_dir.exists():
+        shutil.rmtree(rollback_dir)
+    rollback_info.unlink(missing_ok=True)
 
     installed_version = resources.profile.get_package_installed_version(
         package_name, None
@@ -398,38 +848,13 @@ def uninstall_package(
         click.secho(f"Package '{package_name}' was not installed", fg="green")
 
 
-def fix_packages(
-    resources: Resources, scan: pkg_util.PackageScanResults, verbose: bool
-) -> None:
-    """If the package scan result contains errors, fix them."""
-
-    # -- If non verbose, print a summary message.
-    if not verbose:
-        click.secho(
-            f"Fixing {util.count(scan.num_errors(), 'package error')}."
-        )
-
-    # -- Fix broken packages.
-    for package_id in scan.broken_package_ids:
-        if verbose:
-            print(f"Uninstalling broken package '{package_id}'")
-        _delete_package_dir(resources, package_id, verbose=False)
-        resources.profile.remove_package(package_id)
-        resources.profile.save()
-
-    for package_id in scan.orphan_package_ids:
-        if verbose:
-            print(f"Uninstalling unknown package '{package_id}'")
-        resources.profile.remove_package(package_id)
-        resources.profile.save()
-
-    for dir_name in scan.orphan_dir_names:
-        if verbose:
-            print(f"Deleting unknown dir '{dir_name}'")
-        shutil.rmtree(util.get_packages_dir() / dir_name)
-
-    for file_name in scan.orphan_file_names:
-        if verbose:
-            print(f"Deleting unknown file '{file_name}'")
-        file_path = util.get_packages_dir() / file_name
-        file_path.unlink()
+def gc_package_store(verbose: bool) -> None:
+    """Deletes the files of the package store that are not used by any
+    installed package, or a version that is kept for rollback."""
+    if verbose:
+        print(f"Package store {package_store.get_package_store().objects_dir}")
+    count, size = package_store.get_package_store().gc()
+    click.secho(
+        f"Deleted {util.count(count, 'unused file')}, {size / 1e6:.1f} MB",
+        fg="green",
+    )
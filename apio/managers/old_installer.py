@@ -11,7 +11,6 @@ import shutil
 from pathlib import Path
 from dataclasses import dataclass
 import click
-import requests
 
 from apio import util
 from apio.managers.downloader import FileDownloader
@@ -403,6 +402,9 @@ class Installer:
             if self.verbose:
                 click.secho(f"Version url: {url_version}")
 
+            # pylint: disable=import-outside-toplevel
+            import requests
+
             # -- Get the version file with the latest version number
             req = requests.get(url_version, timeout=5)
 
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""A shared cache and a local mirror of package files, used by the
+installer to avoid downloading package files from the release server.
+
+The cache is content addressed. The package files are stored as
+'blobs/<sha256>.<ext>' and 'names/<file name>' maps a package file name to
+the sha256 of its content. Files are added through a temp file that is
+renamed in place, and a lock file per package file name serializes
+concurrent downloads of the same file, so the cache can be shared by
+concurrent apio processes, e.g. on CI runners.
+
+The mirror is a plain directory, possibly on a network share, with the
+package files, and optionally their '<file name>.sha256' files, as they
+appear on the release server.
+"""
+
+import os
+import hashlib
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Optional, Iterator
+from urllib.parse import urlparse, unquote
+from apio import env_options
+
+# -- The size of the blocks we copy and hash.
+BLOCK_SIZE = 1024 * 1024
+
+
+@contextmanager
+def _file_lock(lock_file: Path) -> Iterator[None]:
+    """A context manager that holds an exclusive lock on the given file,
+    waiting for other processes to release it."""
+
+    # -- Deferred imports, the lock api is platform specific.
+    # pylint: disable=import-outside-toplevel
+    # pylint: disable=import-error
+    with open(lock_file, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            # -- LK_LOCK retries for 10 secs, we retry until we get it.
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _file_ext(file_name: str) -> str:
+    """Returns the extension of a package file name, e.g. 'tar.gz'."""
+    for ext in ("tar.gz", "tar.bz2"):
+        if file_name.endswith("." + ext):
+            return ext
+    return file_name.rsplit(".", 1)[-1]
+
+
+class CacheWriter:
+    """A binary file object to which a new package file is written. It's
+    added to the cache when the writer is committed."""
+
+    def __init__(self, cache: "PackageCache", file_name: str):
+        self._cache = cache
+        self._file_name = file_name
+        self._sha256 = hashlib.sha256()
+        fd, tmp_name = tempfile.mkstemp(dir=cache.tmp_dir)
+        self._tmp_file = Path(tmp_name)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data: bytes) -> int:
+        """Writes the given bytes."""
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def commit(self) -> Path:
+        """Adds the written file to the cache and returns its path."""
+        self._file.close()
+        blob = self._cache.blob_path(
+            self._sha256.hexdigest(), _file_ext(self._file_name)
+        )
+        os.replace(self._tmp_file, blob)
+
+        # -- Point the file name to the new blob.
+        name_file = self._cache.names_dir / self._file_name
+        tmp_name_file = self._tmp_file.with_suffix(".name")
+        tmp_name_file.write_text(self._sha256.hexdigest(), encoding="utf8")
+        os.replace(tmp_name_file, name_file)
+        return blob
+
+    def discard(self) -> None:
+        """Deletes the written file."""
+        self._file.close()
+        self._tmp_file.unlink(missing_ok=True)
+
+
+class PackageCache:
+    """A content addressed cache of package files."""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        self.blobs_dir = cache_dir / "blobs"
+        self.names_dir = cache_dir / "names"
+        self.locks_dir = cache_dir / "locks"
+        self.tmp_dir = cache_dir / "tmp"
+        for path in (
+            self.blobs_dir,
+            self.names_dir,
+            self.locks_dir,
+            self.tmp_dir,
+        ):
+            path.mkdir(parents=True, exist_ok=True)
+
+    def blob_path(self, sha256: str, ext: str) -> Path:
+        """Returns the path of the blob with the given sha256."""
+        return self.blobs_dir / f"{sha256}.{ext}"
+
+    def lookup(self, file_name: str, sha256: Optional[str]) -> Optional[Path]:
+        """Returns the path of the cached package file with the given name,
+        or None if not in the cache. If sha256 is given, the file is looked
+        up by content instead."""
+
+        if not sha256:
+            try:
+                sha256 = (self.names_dir / file_name).read_text(
+                    encoding="utf8"
+                )
+            except OSError:
+                return None
+
+        blob = self.blob_path(sha256.strip().lower(), _file_ext(file_name))
+        return blob if blob.is_file() else None
+
+    @contextmanager
+    def lock(self, file_name: str) -> Iterator[None]:
+        """A context manager that holds the lock of the given package file
+        name. Used to download and add a file only once, when it's needed
+        by concurrent apio processes."""
+        with _file_lock(self.locks_dir / f"{file_name}.lock"):
+            yield
+
+    @contextmanager
+    def writer(self, file_name: str) -> Iterator[CacheWriter]:
+        """A context manager that returns a writer for a new package file.
+        The file is added to the cache if the context exits normally, and
+        discarded otherwise."""
+        cache_writer = CacheWriter(self, file_name)
+        try:
+            yield cache_writer
+        except BaseException:
+            cache_writer.discard()
+            raise
+        cache_writer.commit()
+
+    def add_file(self, file_name: str, path: Path) -> Path:
+        """Copies the given package file to the cache and returns the path
+        of its cached copy."""
+        with self.writer(file_name) as cache_writer:
+            with open(path, "rb") as f:
+                while block := f.read(BLOCK_SIZE):
+                    cache_writer.write(block)
+        return self.lookup(file_name, None)
+
+
+def get_package_cache() -> Optional[PackageCache]:
+    """Returns the package files cache, or None if not enabled by the
+    APIO_PACKAGES_CACHE_DIR env option."""
+    cache_dir = env_options.get(env_options.APIO_PACKAGES_CACHE_DIR)
+    return PackageCache(Path(cache_dir)) if cache_dir else None
+
+
+def get_mirror_file(file_name: str) -> Optional[Path]:
+    """Returns the path of the given package file in the mirror set by the
+    APIO_PACKAGES_MIRROR env option, or None if not mirrored. The option
+    is a directory path or a 'file://' url."""
+    mirror = env_options.get(env_options.APIO_PACKAGES_MIRROR)
+    if not mirror:
+        return None
+    if mirror.startswith("file:"):
+        mirror = unquote(urlparse(mirror).path)
+    path = Path(mirror) / file_name
+    return path if path.is_file() else None
+
+
+def get_mirror_sha256(mirror_file: Path) -> Optional[str]:
+    """Returns the sha256 of a mirrored package file from its '.sha256' file,
+    or None if it doesn't exist."""
+    try:
+        tokens = mirror_file.with_name(mirror_file.name + ".sha256").read_text(
+            encoding="utf8"
+        )
+    except OSError:
+        return None
+    tokens = tokens.split()
+    return tokens[0] if tokens and len(tokens[0]) == 64 else None
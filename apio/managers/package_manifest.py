@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""Manifests of the installed packages, used to check their integrity.
+
+When a package is installed, the installer writes to the package dir the
+file '.apio-manifest.json' with the relative path, size, modification time
+and hash of each of the package files. A quick check compares the sizes
+and modification times of the files with the manifest and a deep check
+hashes the files, with a pool of threads, and compares the hashes.
+
+The files are hashed with blake2b, which is the fastest cryptographic hash
+of the python standard library and releases the GIL, so the files are
+hashed in parallel.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, List, Dict, Tuple
+
+# -- The name of the manifest file, in the package dir.
+MANIFEST_NAME = ".apio-manifest.json"
+
+# -- The version of the manifest file format.
+MANIFEST_FORMAT = 1
+
+# -- The size of the blocks we hash.
+BLOCK_SIZE = 1024 * 1024
+
+
+@dataclass
+class Manifest:
+    """The content of a package manifest."""
+
+    # -- The package version, e.g. '0.0.35'.
+    version: str
+    # -- The name of the package file it was installed from.
+    package_file: str
+    # -- The path of the package dir in the package file, e.g.
+    # -- 'oss-cad-suite', or '' if the package file has no wrapper dir.
+    prefix: str
+    # -- Maps the relative path of each file, with '/' separators, to its
+    # -- [size, modification time in ns, hash].
+    files: Dict[str, list]
+    # -- Maps the relative path of each symbolic link to its target.
+    links: Dict[str, str]
+
+
+def file_hash(path: Path, algorithm: Optional[str] = None) -> str:
+    """Returns the hex hash of the given file. By default, the hash that is
+    stored in manifests, otherwise the hashlib algorithm with the given
+    name, e.g. 'sha256' for the checksums of the package files."""
+    digest = (
+        hashlib.new(algorithm)
+        if algorithm
+        else hashlib.blake2b(digest_size=16)
+    )
+    with open(path, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _hash_files(
+    package_dir: Path,
+    rel_paths: List[str],
+    jobs: Optional[int],
+    on_progress: Optional[Callable[[int, int], None]],
+) -> List[Optional[str]]:
+    """Returns the hashes of the given files, or None for files that can't
+    be read, hashed with a pool of threads. on_progress, if given, is
+    called with the files hashed and the number of files."""
+
+    def hash_file(rel_path: str) -> Optional[str]:
+        try:
+            return file_hash(package_dir / rel_path)
+        except OSError:
+            return None
+
+    jobs = jobs or min(32, (os.cpu_count() or 1) + 4)
+    hashes = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for file_hash_ in pool.map(hash_file, rel_paths, chunksize=16):
+            hashes.append(file_hash_)
+            if on_progress and len(hashes) % 100 == 0:
+                on_progress(len(hashes), len(rel_paths))
+    if on_progress:
+        on_progress(len(hashes), len(rel_paths))
+    return hashes
+
+
+def _scan_dir(package_dir: Path) -> Tuple[List[str], Dict[str, str]]:
+    """Returns the relative paths of the files in the package dir and a
+    dict with the targets of its symbolic links."""
+    files = []
+    links = {}
+    for dir_path, dir_names, file_names in os.walk(package_dir):
+        rel_dir = Path(dir_path).relative_to(package_dir).as_posix()
+        for name in dir_names + file_names:
+            path = os.path.join(dir_path, name)
+            rel_path = name if rel_dir == "." else f"{rel_dir}/{name}"
+            if os.path.islink(path):
+                links[rel_path] = os.readlink(path)
+            elif name in file_names and rel_path != MANIFEST_NAME:
+                files.append(rel_path)
+    return (files, links)
+
+
+def create_manifest(
+    package_dir: Path,
+    *,
+    version: str,
+    package_file: str,
+    prefix: str,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Manifest:
+    """Creates the manifest of the given package dir, writes it to the
+    package dir and returns it. on_progress, if given, is called with the
+    files hashed and the number of files."""
+
+    rel_paths, links = _scan_dir(package_dir)
+    hashes = _hash_files(package_dir, rel_paths, None, on_progress)
+    files = {}
+    for rel_path, hash_ in zip(rel_paths, hashes):
+        stat = os.lstat(package_dir / rel_path)
+        files[rel_path] = [stat.st_size, stat.st_mtime_ns, hash_]
+
+    manifest = Manifest(version, package_file, prefix, files, links)
+    write_manifest(package_dir, manifest)
+    return manifest
+
+
+def write_manifest(package_dir: Path, manifest: Manifest) -> None:
+    """Writes the given manifest to the package dir."""
+    manifest_file = package_dir / MANIFEST_NAME
+    tmp_file = manifest_file.with_name(manifest_file.name + ".tmp")
+    with open(tmp_file, "w", encoding="utf8") as f:
+        json.dump(
+            {"format": MANIFEST_FORMAT, **manifest.__dict__},
+            f,
+            separators=(",", ":"),
+        )
+    os.replace(tmp_file, manifest_file)
+
+
+def read_manifest(package_dir: Path) -> Optional[Manifest]:
+    """Returns the manifest of the given package dir, or None if it has no
+    valid manifest, e.g. if it was installed by an older apio."""
+    try:
+        with open(package_dir / MANIFEST_NAME, "r", encoding="utf8") as f:
+            data = json.load(f)
+        if data.pop("format", None) != MANIFEST_FORMAT:
+            return None
+        return Manifest(**data)
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def verify_package(
+    package_dir: Path,
+    manifest: Manifest,
+    *,
+    deep: bool,
+    jobs: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[str]:
+    """Checks the files of the package dir against its manifest and
+    returns the sorted relative paths of the files and links that are
+    missing or damaged. The quick check compares the file sizes and
+    modification times, and the deep check, if deep is True, compares the
+    file sizes and hashes. on_progress, if given, is called with the files
+    hashed and the number of files."""
+
+    damaged = []
+    for rel_path, target in manifest.links.items():
+        try:
+            if os.readlink(package_dir / rel_path) != target:
+                damaged.append(rel_path)
+        except OSError:
+            damaged.append(rel_path)
+
+    to_hash = []
+    for rel_path, (size, mtime_ns, _) in manifest.files.items():
+        try:
+            stat = os.lstat(package_dir / rel_path)
+        except OSError:
+            damaged.append(rel_path)
+            continue
+        if stat.st_size != size or (not deep and stat.st_mtime_ns != mtime_ns):
+            damaged.append(rel_path)
+        elif deep:
+            to_hash.append(rel_path)
+
+    if to_hash:
+        hashes = _hash_files(package_dir, to_hash, jobs, on_progress)
+        for rel_path, hash_ in zip(to_hash, hashes):
+            if hash_ != manifest.files[rel_path][2]:
+                damaged.append(rel_path)
+
+    return sorted(damaged)
+
+
+def update_manifest(
+    package_dir: Path, manifest: Manifest, rel_paths: List[str]
+) -> List[str]:
+    """Updates the modification times of the given repaired files in the
+    manifest and writes it. Returns the sorted relative paths of the given
+    files and links that still don't match the manifest."""
+
+    damaged = []
+    for rel_path in rel_paths:
+        path = package_dir / rel_path
+        if rel_path in manifest.links:
+            if not path.is_symlink() or os.readlink(path) != (
+                manifest.links[rel_path]
+            ):
+                damaged.append(rel_path)
+            continue
+        entry = manifest.files[rel_path]
+        try:
+            if file_hash(path) != entry[2]:
+                damaged.append(rel_path)
+                continue
+            entry[1] = os.lstat(path).st_mtime_ns
+        except OSError:
+            damaged.append(rel_path)
+
+    write_manifest(package_dir, manifest)
+    return sorted(damaged)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""The staging and rollback dirs of the packages. A new version of a
+package is unpacked in a staging dir next to the package dir and is then
+renamed in place, keeping the previous version in a rollback dir.
+Used by the installer and by 'apio packages --rollback'.
+"""
+
+import sys
+import json
+import shutil
+from pathlib import Path
+from typing import Tuple
+import click
+from apio.resources import Resources
+
+
+def get_staging_dir(package_dir: Path) -> Path:
+    """Returns the dir in which a new version of the package with the given
+    dir is unpacked before it replaces the package dir."""
+    return package_dir.with_name(f".{package_dir.name}.staging")
+
+
+def get_rollback_paths(package_dir: Path) -> Tuple[Path, Path]:
+    """Returns the dir with the previous version of the package with the
+    given dir and the json file with the version of that previous
+    version."""
+    rollback_dir = package_dir.with_name(f".{package_dir.name}.rollback")
+    return (rollback_dir, rollback_dir.with_name(rollback_dir.name + ".json"))
+
+
+def prepare_staging_dir(package_dir: Path, verbose: bool) -> Path:
+    """Creates an empty staging dir for the package with the given dir and
+    returns its path. A left over from a previous failed installation is
+    deleted."""
+
+    staging_dir = get_staging_dir(package_dir)
+    if staging_dir.exists():
+        shutil.rmtree(staging_dir)
+    staging_dir.mkdir()
+    if verbose:
+        print(f"Unpacking to {staging_dir}")
+    return staging_dir
+
+
+def delete_package_dir(
+    resources: Resources, package_id: str, verbose: bool
+) -> bool:
+    """Delete the directory of the package with given name.  Returns
+    True if the packages existed. Exits with an error message on error."""
+
+    package_dir = resources.get_package_dir(package_id)
+
+    dir_found = package_dir.is_dir()
+    if dir_found:
+        if verbose:
+            click.secho(f"Deleting {str(package_dir)}")
+
+        # -- Sanity check the path and delete.
+        package_folder_name = resources.get_package_folder_name(package_id)
+        assert package_folder_name in str(package_dir), package_dir
+        shutil.rmtree(package_dir)
+
+    if package_dir.exists():
+        click.secho(
+            f"Error: directory deletion failed: {str(package_dir.absolute())}",
+            fg="yellow",
+        )
+        sys.exit(1)
+
+    return dir_found
+
+
+def swap_in_package(
+    resources: Resources, package_name: str, unpacked_dir: Path, verbose: bool
+) -> None:
+    """Replaces the package dir with the unpacked dir of its new version,
+    in the staging dir. The current version, if any, is kept for a later
+    rollback and the staging dir is deleted. Exits with an error message
+    if any error."""
+
+    package_dir = resources.get_package_dir(package_name)
+    staging_dir = get_staging_dir(package_dir)
+    rollback_dir, rollback_info = get_rollback_paths(package_dir)
+
+    if not unpacked_dir.is_dir():
+        click.secho(f"Error: no unpacked dir {unpacked_dir}", fg="red")
+        sys.exit(1)
+
+    # -- Move the current version, if any, to the rollback dir. We keep only
+    # -- a single previous version.
+    installed_version = resources.profile.get_package_installed_version(
+        package_name, None
+    )
+    if package_dir.is_dir() and installed_version:
+        if rollback_dir.exists():
+            shutil.rmtree(rollback_dir)
+        if verbose:
+            print(f"Keeping version {installed_version} for rollback")
+        package_dir.rename(rollback_dir)
+        with open(rollback_info, "w", encoding="utf8") as f:
+            json.dump({"version": installed_version}, f)
+    else:
+        delete_package_dir(resources, package_name, verbose)
+
+    # -- Move the new version in place. This and the rename above are quick
+    # -- renames within the same file system, so the package is missing only
+    # -- for a very short time.
+    if verbose:
+        print(f"Renaming {unpacked_dir} to {package_dir}")
+    unpacked_dir.rename(package_dir)
+    if staging_dir.exists():
+        shutil.rmtree(staging_dir)
+
+
+def rollback_package(
+    resources: Resources, *, package_name: str, verbose: bool
+) -> None:
+    """Restores the version of the package that was installed before the
+    current one, without network access. The current version is kept
+    instead, such that a second rollback undoes the first.
+
+    Returns normally if no error, exits the program with an error status
+    and a user message if an error is detected.
+    """
+
+    if package_name not in resources.platform_packages:
+        click.secho(f"Error: no such package '{package_name}'", fg="red")
+        sys.exit(1)
+
+    package_dir = resources.get_package_dir(package_name)
+    rollback_dir, rollback_info = get_rollback_paths(package_dir)
+
+    # -- Get the version to roll back to.
+    try:
+        with open(rollback_info, "r", encoding="utf8") as f:
+            rollback_version = json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        rollback_version = None
+    if not rollback_version or not rollback_dir.is_dir():
+        click.secho(
+            f"Error: package '{package_name}' has no previous version "
+            "to roll back to",
+            fg="red",
+        )
+        sys.exit(1)
+
+    click.secho(
+        f"Rolling back package '{package_name}' to version "
+        f"{rollback_version}"
+    )
+
+    # -- Swap the package and the rollback dirs, through the staging dir.
+    installed_version = resources.profile.get_package_installed_version(
+        package_name, None
+    )
+    staging_dir = get_staging_dir(package_dir)
+    if staging_dir.exists():
+        shutil.rmtree(staging_dir)
+    if package_dir.is_dir():
+        package_dir.rename(staging_dir)
+    rollback_dir.rename(package_dir)
+    if staging_dir.exists() and installed_version:
+        if verbose:
+            print(f"Keeping version {installed_version} for rollback")
+        staging_dir.rename(rollback_dir)
+        with open(rollback_info, "w", encoding="utf8") as f:
+            json.dump({"version": installed_version}, f)
+    else:
+        if staging_dir.exists():
+            shutil.rmtree(staging_dir)
+        rollback_info.unlink()
+
+    # -- Add package to profile and save.
+    resources.profile.add_package(package_name, rollback_version)
+    resources.profile.save()
+
+    click.secho(
+        f"Package '{package_name}' rolled back successfully", fg="green"
+    )
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""A content addressed store of package files, shared by the installed
+packages, including the versions that are kept for rollback.
+
+The store is the directory ~/.apio/store/objects with a file per distinct
+content and permissions, named by the hash of the file in the package
+manifest. When a package is installed, its files are replaced by
+hardlinks to the store objects, so files that are identical in several
+package versions are stored only once. An existing object is reused only
+if its content still matches its hash. An object that is not linked from
+any package dir has a single link and is deleted by gc().
+"""
+
+import os
+import stat
+from pathlib import Path
+from typing import Tuple
+from apio import util
+from apio.managers import package_manifest
+from apio.managers.package_manifest import Manifest, write_manifest
+
+
+class PackageStore:
+    """A content addressed store of package files."""
+
+    def __init__(self, store_dir: Path):
+        self.objects_dir = store_dir / "objects"
+
+    def object_path(self, file_hash: str, mode: int) -> Path:
+        """Returns the path of the object with the given content hash and
+        permissions."""
+        return self.objects_dir / file_hash[:2] / f"{file_hash}-{mode:o}"
+
+    @staticmethod
+    def _replace_with_link(target: Path, path: Path) -> None:
+        """Replaces the file at path with a hardlink to target."""
+        tmp_path = path.with_name(f".{path.name}.apio-link")
+        os.link(target, tmp_path)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            tmp_path.unlink()
+            raise
+
+    def _link_file(
+        self, path: Path, obj: Path, size: int, content_hash: str
+    ) -> bool:
+        """Replaces the given file with a hardlink to the given object, or
+        adds it as that object if it doesn't exist. Returns True if the file
+        was replaced."""
+        try:
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            os.link(path, obj)
+            return False
+        except FileExistsError:
+            pass
+        if os.path.samefile(path, obj):
+            return False
+        # -- An object that was damaged, e.g. by editing a package file in
+        # -- place, is replaced by the new file. Its size may not change, so
+        # -- its content is hashed.
+        if (
+            os.lstat(obj).st_size != size
+            or package_manifest.file_hash(obj) != content_hash
+        ):
+            self._replace_with_link(path, obj)
+            return False
+        self._replace_with_link(obj, path)
+        return True
+
+    def intern(self, package_dir: Path, manifest: Manifest) -> int:
+        """Replaces the files of the given package dir with hardlinks to the
+        store objects with the same content and permissions, adding the
+        missing objects, and updates the modification times in the
+        manifest. Returns the number of bytes saved."""
+
+        saved = 0
+        for rel_path, entry in manifest.files.items():
+            size, _, file_hash = entry
+            if not file_hash or not size:
+                continue
+            path = package_dir / rel_path
+            try:
+                mode = stat.S_IMODE(os.lstat(path).st_mode)
+                obj = self.object_path(file_hash, mode)
+                if self._link_file(path, obj, size, file_hash):
+                    saved += size
+                entry[1] = os.lstat(path).st_mtime_ns
+            except OSError:
+                # -- E.g. the packages dir is on another file system. The
+                # -- file is kept as is.
+                continue
+
+        write_manifest(package_dir, manifest)
+        return saved
+
+    def gc(self) -> Tuple[int, int]:
+        """Deletes the objects that are not linked from any package dir.
+        Returns the number of objects deleted and their total size."""
+        count = 0
+        size = 0
+        for obj in self.objects_dir.glob("*/*"):
+            obj_stat = obj.stat()
+            if obj_stat.st_nlink == 1:
+                obj.unlink()
+                count += 1
+                size += obj_stat.st_size
+        return (count, size)
+
+
+def get_package_store() -> PackageStore:
+    """Returns the package files store of the apio home dir."""
+    return PackageStore(util.get_home_dir() / "store")
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""Verification and repair of the installed packages.
+Used by 'apio packages --verify' and 'apio packages --fix'.
+"""
+
+import sys
+import shutil
+from pathlib import Path
+from typing import Optional, List
+import click
+from apio import util, pkg_util
+from apio.resources import Resources
+from apio.managers.unpacker import extract_members
+from apio.managers import package_cache, package_manifest
+from apio.managers.package_staging import delete_package_dir
+
+
+def fix_packages(
+    resources: Resources, scan: pkg_util.PackageScanResults, verbose: bool
+) -> None:
+    """If the package scan result contains errors, fix them."""
+
+    # -- If non verbose, print a summary message.
+    if not verbose:
+        click.secho(
+            f"Fixing {util.count(scan.num_errors(), 'package error')}."
+        )
+
+    # -- Fix broken packages.
+    for package_id in scan.broken_package_ids:
+        if verbose:
+            print(f"Uninstalling broken package '{package_id}'")
+        delete_package_dir(resources, package_id, verbose=False)
+        resources.profile.remove_package(package_id)
+        resources.profile.save()
+
+    for package_id in scan.orphan_package_ids:
+        if verbose:
+            print(f"Uninstalling unknown package '{package_id}'")
+        resources.profile.remove_package(package_id)
+        resources.profile.save()
+
+    for dir_name in scan.orphan_dir_names:
+        if verbose:
+            print(f"Deleting unknown dir '{dir_name}'")
+        shutil.rmtree(util.get_packages_dir() / dir_name)
+
+    for file_name in scan.orphan_file_names:
+        if verbose:
+            print(f"Deleting unknown file '{file_name}'")
+        file_path = util.get_packages_dir() / file_name
+        file_path.unlink()
+
+
+def _find_package_file(file_name: str) -> Optional[Path]:
+    """Returns the path of the given package file in the packages mirror
+    or cache, or None if not available locally."""
+    mirror_file = package_cache.get_mirror_file(file_name)
+    if mirror_file:
+        return mirror_file
+    cache = package_cache.get_package_cache()
+    return cache.lookup(file_name, None) if cache else None
+
+
+def _verify_package(
+    resources: Resources, package_name: str, deep: bool, verbose: bool
+) -> bool:
+    """Verifies the files of an installed package against its manifest and
+    repairs the damaged files if the package file is in the packages
+    mirror or cache. Returns True if the package is ok or was repaired."""
+
+    package_dir = resources.get_package_dir(package_name)
+    if not resources.profile.get_package_installed_version(package_name, None):
+        click.secho(f"Package '{package_name}' is not installed")
+        return True
+
+    manifest = package_manifest.read_manifest(package_dir)
+    if not manifest:
+        click.secho(
+            f"Package '{package_name}' has no manifest, reinstall it with "
+            "'apio packages --install --force' to verify it",
+            fg="yellow",
+        )
+        return True
+
+    # -- The deep check hashes the files, which takes a while.
+    if deep:
+        with util.progressbar(
+            length=len(manifest.files), label="Hashing.."
+        ) as pbar:
+            hashed = [0]
+
+            def on_progress(done: int, _: int) -> None:
+                pbar.update(done - hashed[0])
+                hashed[0] = done
+
+            damaged = package_manifest.verify_package(
+                package_dir, manifest, deep=True, on_progress=on_progress
+            )
+    else:
+        damaged = package_manifest.verify_package(
+            package_dir, manifest, deep=False
+        )
+
+    if not damaged:
+        click.secho(
+            f"Package '{package_name}': "
+            f"{util.count(manifest.files, 'file')} ok",
+            fg="green",
+        )
+        return True
+
+    click.secho(
+        f"Package '{package_name}': {util.count(damaged, 'damaged file')}",
+        fg="red",
+    )
+    for rel_path in damaged if verbose else damaged[:10]:
+        click.secho(f"  {rel_path}")
+    if len(damaged) > 10 and not verbose:
+        click.secho(f"  ... and {len(damaged) - 10} more")
+
+    # -- Repair only the damaged files, from the package file.
+    package_file = _find_package_file(manifest.package_file)
+    if not package_file:
+        click.secho(
+            f"Package file {manifest.package_file} is not in the packages "
+            "mirror or cache, run "
+            f"'apio packages --install --force {package_name}'",
+            fg="yellow",
+        )
+        return False
+    if verbose:
+        print(f"Repairing from {package_file}")
+    extract_members(package_file, package_dir, manifest.prefix, set(damaged))
+    damaged = package_manifest.update_manifest(package_dir, manifest, damaged)
+    if damaged:
+        click.secho(
+            f"Error: failed to repair {util.count(damaged, 'file')} of "
+            f"package '{package_name}'",
+            fg="red",
+        )
+        return False
+    click.secho(f"Package '{package_name}' repaired successfully", fg="green")
+    return True
+
+
+def verify_packages(
+    resources: Resources,
+    *,
+    package_names: List[str],
+    deep: bool,
+    verbose: bool,
+) -> bool:
+    """Verifies the files of the given installed packages against their
+    manifests and repairs the damaged files that are available in the
+    packages mirror or cache.
+
+    'deep' indicates if to compare the hashes of the files, instead of
+    their sizes and modification times.
+
+    Returns True if all the packages are ok or were repaired.
+    """
+    ok = True
+    for package_name in package_names:
+        if package_name not in resources.platform_packages:
+            click.secho(f"Error: no such package '{package_name}'", fg="red")
+            sys.exit(1)
+        ok = _verify_package(resources, package_name, deep, verbose) and ok
+    return ok
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""A cache of small remote metadata, such as the package version files and
+the latest apio version on Pypi.
+
+Values are kept in the json file ~/.apio/cache/remote.json and are used
+without checking the server for TTL seconds. After that, they are
+revalidated with a conditional request (If-None-Match) that returns the
+cached value if the remote file didn't change. If the server can't be
+reached, a stale cached value is used. In offline mode, only cached values
+are used.
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Callable, Optional, Dict
+import click
+from apio import util
+from apio.managers.downloader import get_session, TIMEOUT
+
+# -- Time, in seconds, during which a cached value is used without checking
+# -- the server.
+TTL = 60 * 60
+
+# -- The version of the cache file format.
+CACHE_FORMAT = 1
+
+# -- Serializes the access of threads to the cache file.
+_lock = threading.Lock()
+
+
+def _cache_file() -> Path:
+    """Returns the path of the cache file."""
+    return util.get_home_dir() / "cache" / "remote.json"
+
+
+def _load() -> Dict[str, dict]:
+    """Returns the cache entries, or an empty dict if none."""
+    try:
+        with open(_cache_file(), "r", encoding="utf8") as f:
+            data = json.load(f)
+        if data.get("format") == CACHE_FORMAT:
+            return data["entries"]
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    return {}
+
+
+def _save(entries: Dict[str, dict]) -> None:
+    """Saves the cache entries, ignoring errors."""
+    cache_file = _cache_file()
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, "w", encoding="utf8") as f:
+            json.dump({"format": CACHE_FORMAT, "entries": entries}, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+
+
+def _update(url: str, entry: Optional[dict]) -> None:
+    """Sets the cache entry of the given url."""
+    with _lock:
+        entries = _load()
+        entries[url] = entry
+        _save(entries)
+
+
+def fetch(
+    url: str,
+    *,
+    offline: bool,
+    extract: Callable[[str], str] = lambda text: text,
+    timeout: float = TIMEOUT,
+) -> str:
+    """Returns the value of a small remote file, through the cache. The
+    value is extract() of the file's text, e.g. a field of a json file, and
+    only the value is cached.
+
+    Raises IOError if the value is not available, e.g. if not cached in
+    offline mode. The requests exceptions are subclasses of IOError.
+    """
+
+    with _lock:
+        entry = _load().get(url)
+
+    # -- Use a cached value that is fresh or if we are offline.
+    if entry and (offline or time.time() - entry["time"] < TTL):
+        return entry["value"]
+    if offline:
+        raise IOError(f"No cached value of {url} in offline mode")
+
+    # -- Check the server, conditionally if we have a cached value.
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    try:
+        resp = get_session().get(url, headers=headers, timeout=timeout)
+        if resp.status_code == 304 and entry:
+            value = entry["value"]
+        else:
+            resp.raise_for_status()
+            value = extract(resp.text)
+    except IOError:
+        # -- Flaky network, use the stale value if we have one.
+        if entry:
+            return entry["value"]
+        raise
+
+    _update(
+        url,
+        {
+            "value": value,
+            "etag": resp.headers.get(
+                "etag", entry.get("etag", "") if entry else ""
+            ),
+            "time": time.time(),
+        },
+    )
+    return value
+
+
+def get_pypi_latest_version(offline: bool = False) -> str:
+    """Get the latest stable version of apio from Pypi
+    Internet connection is required, unless the version was cached recently
+    or offline is True, see fetch().
+    Returns: A string with the version (Ex: "0.9.0")
+      In case of error, it returns None
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import requests
+
+    # -- Error message common to all exceptions
+    error_msg = "Error: could not connect to Pypi\n"
+
+    # -- Read the latest apio version from pypi
+    # -- More information: https://warehouse.pypa.io/api-reference/json.html
+    try:
+        # -- Get the version field from the json response
+        version = fetch(
+            "https://pypi.python.org/pypi/apio/json",
+            offline=offline,
+            extract=lambda text: json.loads(text)["info"]["version"],
+            timeout=10,
+        )
+
+    # -- Connection error
+    except requests.exceptions.ConnectionError as e:
+        click.secho(
+            f"\n{error_msg}" "Check your internet connection and try again\n",
+            fg="red",
+        )
+        util.print_exception_developers(e)
+        return None
+
+    # -- HTTP Error
+    except requests.exceptions.HTTPError as e:
+        click.secho(f"\nHTTP ERROR\n{error_msg}", fg="red")
+        util.print_exception_developers(e)
+        return None
+
+    # -- Timeout!
+    except requests.exceptions.Timeout as e:
+        click.secho(f"\nTIMEOUT!\n{error_msg}", fg="red")
+        util.print_exception_developers(e)
+        return None
+
+    # -- Another error
+    except requests.exceptions.RequestException as e:
+        click.secho(f"\nFATAL ERROR!\n{error_msg}", fg="red")
+        util.print_exception_developers(e)
+        return None
+
+    # -- Not cached in offline mode.
+    except IOError as e:
+        click.secho(
+            "Error: the latest apio version is not cached, "
+            "run without --offline.",
+            fg="red",
+        )
+        util.print_exception_developers(e)
+        return None
+
+    return version
@@ -11,23 +11,27 @@
 
 import os
 import re
+import json
 import time
 import datetime
 import shutil
 from functools import wraps
+from typing import Dict, List, Optional
 
 import importlib.metadata
 import click
-import semantic_version
 
 from apio import util
 from apio import pkg_util
+from apio import env_options
+from apio import events
 from apio.managers.arguments import process_arguments
 from apio.managers.arguments import serialize_scons_flags
-from apio.managers.system import System
 from apio.resources import Resources
 from apio.managers.project import Project
 from apio.managers.scons_filter import SconsFilter
+from apio.managers import build_stats
+from apio.managers.device_inventory import DeviceInventory
 
 # -- Constant for the dictionary PROG, which contains
 # -- the programming configuration
@@ -35,6 +39,13 @@ SERIAL_PORT = "serial_port"
 FTDI_ID = "ftdi_id"
 SRAM = "sram"
 FLASH = "flash"
+ALL_CONNECTED = "all_connected"
+SKIP_UNCHANGED = "skip_unchanged"
+READBACK = "readback"
+INCREMENTAL = "incremental"
+
+# -- Default max size, in MB, of the build artifacts cache.
+CACHE_MAX_MB = 1024
 
 # -- ANSI Constants
 CURSOR_UP = "\033[F"
@@ -87,6 +98,9 @@ class SCons:
         # -- Change to the project's folder.
         os.chdir(resources.project_dir)
 
+        # -- The connected devices, scanned when needed.
+        self.devices = DeviceInventory(resources)
+
     @on_exception(exit_code=1)
     def clean(self, args) -> int:
         """Runs a scons subprocess with the 'clean' target. Returns process
@@ -182,15 +196,19 @@ class SCons:
         )
 
     @on_exception(exit_code=1)
-    def test(self, args) -> int:
+    def test(self, args, jobs: int = 1) -> int:
         """Runs a scons subprocess with the 'test' target. Returns process
-        exit code, 0 if ok."""
+        exit code, 0 if ok. 'jobs' is the max number of testbenches to run
+        in parallel."""
 
         # -- Split the arguments
         variables, _, arch = process_arguments(
             args, self.resources, self.project
         )
 
+        # -- Let scons run the testbenches in parallel.
+        variables += ["-j", str(jobs)]
+
         return self._run(
             "test",
             variables=variables,
@@ -199,15 +217,20 @@ class SCons:
         )
 
     @on_exception(exit_code=1)
-    def build(self, args) -> int:
+    def build(self, args, seeds: int = 1) -> int:
         """Runs a scons subprocess with the 'build' target. Returns process
-        exit code, 0 if ok."""
+        exit code, 0 if ok. If 'seeds' is more than one, that many
+        placements are run in parallel and the best one is kept."""
 
         # -- Split the arguments
         variables, board, arch = process_arguments(
             args, self.resources, self.project
         )
 
+        # -- Ask for a multi seed placement.
+        if seeds > 1:
+            variables += [f"pnr_seeds={seeds}"]
+
         # -- Execute scons!!!
         # -- The packages to check are passed
         return self._run(
@@ -271,10 +294,15 @@ class SCons:
             * verbose
             * top-module
           * prog: Programming configuration parameters
-            * serial_port: Serial port name
-            * ftdi_id: ftdi identificator
+            * serial_port: Serial port name, or a comma separated list
+            * ftdi_id: ftdi identificator, or a comma separated list
             * sram: Perform SRAM programming
             * flash: Perform Flash programming
+            * all_connected: Upload to all the matching devices
+            * skip_unchanged: Skip the devices that already have the
+              bitstream
+            * readback: Confirm skip_unchanged by reading back the flash
+            * incremental: Write only the flash sectors that changed
         """
 
         # -- Get important information from the configuration
@@ -285,14 +313,81 @@ class SCons:
 
         # -- Information about the FPGA is ok!
 
-        # -- Get the command line to execute for programming
-        # -- the FPGA (programmer executable + arguments)
+        # -- Get the command lines to execute for programming
+        # -- the FPGA (programmer executable + arguments), by device.
         # -- Ex: 'tinyprog --pyserial -c /dev/ttyACM0 --program'
         # -- Ex: 'iceprog -d i:0x0403:0x6010:0'
-        programmer = self._get_programmer(board, prog)
+        programmers = self._get_programmer(board, prog)
+
+        # -- Add as a flag to pass it to scons. With several devices, scons
+        # -- runs their programmers in parallel.
+        flags += [f"progs={json.dumps(programmers)}"]
+
+        # -- The upload records are of the flash, the SRAM is not
+        # -- persistent.
+        skip_unchanged = prog.get(SKIP_UNCHANGED, False)
+        if skip_unchanged and prog[SRAM]:
+            click.secho(
+                "Warning: --skip-unchanged is ignored when programming the "
+                "SRAM.",
+                fg="yellow",
+            )
+            skip_unchanged = False
+        readback = skip_unchanged and prog.get(READBACK, False)
+
+        # -- The records are kept by the USB serial number of the devices.
+        # -- Without it, a device is skipped only if its flash is read back.
+        device_ids = (
+            {} if prog[SRAM] else self._get_device_ids(board, programmers)
+        )
+        flags += [f"prog_ids={json.dumps(device_ids)}"]
+        if skip_unchanged and not readback:
+            for device in programmers:
+                if device not in device_ids:
+                    click.secho(
+                        "Warning: the USB serial number of "
+                        f"{device or 'the board'} is unknown, it's not "
+                        "skipped without --readback.",
+                        fg="yellow",
+                    )
+
+        # -- Only the flash can be written at an offset.
+        incremental = prog.get(INCREMENTAL, False)
+        if incremental and prog[SRAM]:
+            click.secho(
+                "Warning: --incremental is ignored when programming the SRAM.",
+                fg="yellow",
+            )
+            incremental = False
 
-        # -- Add as a flag to pass it to scons
-        flags += [f"prog={programmer}"]
+        # -- The commands that compare the flash with the bitstream.
+        checks = self._get_programmer_variant(
+            board, prog, programmers, "check_args"
+        )
+        if readback and checks is None:
+            raise ValueError("the programmer can't read back the FPGA flash")
+
+        # -- The commands that write at an offset of the flash, which are
+        # -- followed by a check of the whole flash.
+        if incremental:
+            partials = self._get_programmer_variant(
+                board, prog, programmers, "offset_args"
+            )
+            if partials is None or checks is None:
+                raise ValueError(
+                    "the programmer can't write only the changed flash "
+                    "sectors, --incremental is not supported"
+                )
+            flags += [f"prog_partials={json.dumps(partials)}"]
+
+        if readback or incremental:
+            flags += [f"prog_checks={json.dumps(checks)}"]
+
+        flags += [
+            f"skip_unchanged={skip_unchanged}",
+            f"readback={readback}",
+            f"record_upload={not prog[SRAM]}",
+        ]
 
         # -- Execute Scons for uploading!
         exit_code = self._run(
@@ -305,31 +400,31 @@ class SCons:
 
         return exit_code
 
-    def _get_programmer(self, board: str, prog: dict) -> str:
-        """Get the command line (string) to execute for programming
+    def _get_programmer(self, board: str, prog: dict) -> Dict[str, str]:
+        """Get the command lines (string) to execute for programming
         the FPGA (programmer executable + arguments)
 
         * INPUT
           * board: (string): Board name
           * prog: Programming configuration params
-            * serial_port: Serial port name
-            * ftdi_id: ftdi identificator
+            * serial_port: Serial port name, or a comma separated list
+            * ftdi_id: ftdi identificator, or a comma separated list
             * sram: Perform SRAM programming
             * flash: Perform Flash programming
+            * all_connected: Upload to all the matching devices
 
-        * OUTPUT: A string with the command+args to execute and a $SOURCE
-          placeholder for the bitstream file name.
+        * OUTPUT: A dict with the command+args to execute, with a $SOURCE
+          placeholder for the bitstream file name, by device name.
+          Ex: {'ftdi 0': 'iceprog -d i:0x0403:0x6010:0 $SOURCE'}
+          The device name is '' if the programmer doesn't select a device.
         """
 
-        # -- Return string to create
-        programmer = ""
-
         # -- Mandatory: There should be a board defined
         # -- If not: return!
         # -- It should not be the case bacause it has been
         # -- checked previously... but just in case....
         if not board:
-            return programmer
+            return {"": ""}
 
         # -- Get the board information
         # -- Board name
@@ -354,10 +449,19 @@ class SCons:
         # -- Special case for the TinyFPGA on MACOS platforms
         # -- TinyFPGA BX board is not detected in MacOS HighSierra
         if "tinyprog" in board_info and self.resources.is_darwin():
+            # -- Tinyprog selects the device by itself, so it can't upload
+            # -- to several devices.
+            serial_ports = self._split_devices(prog.get(SERIAL_PORT))
+            if prog.get(ALL_CONNECTED, False) or len(serial_ports or []) > 1:
+                raise ValueError(
+                    "uploading to several TinyFPGA boards is not supported "
+                    "on macOS"
+                )
+
             # In this case the serial check is ignored
             # This is the command line to execute for uploading the
             # circuit
-            return "tinyprog --libusb --program"
+            return {"": "tinyprog --libusb --program"}
 
         # -- Serialize programmer command
         # -- Get a string with the command line to execute
@@ -409,11 +513,19 @@ class SCons:
             # -- If not, an exception is raised
             self._check_usb(board, board_info)
 
-            # -- Get the FTDI index of the connected board
-            ftdi_id = self._get_ftdi_id(board, board_info, prog[FTDI_ID])
+            # -- Get the FTDI indexes of the connected boards
+            ftdi_ids = self._get_ftdi_ids(
+                board,
+                board_info,
+                self._split_devices(prog[FTDI_ID]),
+                prog.get(ALL_CONNECTED, False),
+            )
 
-            # -- Place the value in the command string
-            programmer = programmer.replace("${FTDI_ID}", ftdi_id)
+            # -- Place the values in the command strings
+            return {
+                f"ftdi {ftdi_id}": programmer.replace("${FTDI_ID}", ftdi_id)
+                for ftdi_id in ftdi_ids
+            }
 
         # Replace Serial port
         # -- The board uses a Serial port for uploading the circuit
@@ -428,19 +540,105 @@ class SCons:
             # -- Check that the board is connected
             self._check_usb(board, board_info)
 
-            # -- Get the serial port
-            device = self._get_serial_port(
-                board, board_info, prog[SERIAL_PORT]
+            # -- Get the serial ports
+            devices = self._get_serial_ports(
+                board,
+                board_info,
+                self._split_devices(prog[SERIAL_PORT]),
+                prog.get(ALL_CONNECTED, False),
             )
 
-            # -- Place the value in the command string
-            programmer = programmer.replace("${SERIAL_PORT}", device)
+            # -- Place the values in the command strings
+            return {
+                device: programmer.replace("${SERIAL_PORT}", device)
+                for device in devices
+            }
 
         # -- Return the Command to execute for uploading the circuit
         # -- to the given board. Scons will replace $SOURCE with the
         # -- bitstream file name before executing the command.
         assert "$SOURCE" in programmer, programmer
-        return programmer
+        return {"": programmer}
+
+    def _get_device_ids(
+        self, board: str, programmers: Dict[str, str]
+    ) -> Dict[str, str]:
+        """Returns the USB ids of the devices of the given programmers, by
+        device name, e.g. {'ftdi 0': '0403:6010 FT1A2B3C'}, for the devices
+        with a known USB serial number. Unlike the device name, which is
+        where a board is connected, the id identifies the board.
+
+        The serial numbers are reported by lsftdi, for some versions, and
+        by pyserial. On Linux, a device is also identified if it's the only
+        connected device with the vid:pid of the board.
+        """
+
+        board_info = self.resources.boards.get(board, {})
+        if "usb" not in board_info:
+            return {}
+        hwid = f"{board_info['usb']['vid']}:{board_info['usb']['pid']}"
+        hwid = hwid.lower()
+
+        # -- The serial numbers of the devices, by device name.
+        serials = {}
+        if any(device.startswith("ftdi ") for device in programmers):
+            for ftdi_device in self.devices.ftdi_devices():
+                serials[f"ftdi {ftdi_device['index']}"] = ftdi_device.get(
+                    "serial"
+                )
+        elif any(programmers):
+            for serial_port in self.devices.serial_ports():
+                serials[serial_port["port"]] = serial_port.get("serial_number")
+
+        # -- A single device with the vid:pid of the board.
+        usb_serials = self.devices.usb_serial_numbers(hwid)
+        if len(programmers) == 1 and usb_serials and len(usb_serials) == 1:
+            device = next(iter(programmers))
+            serials[device] = serials.get(device) or usb_serials[0]
+
+        return {
+            device: f"{hwid} {serials[device]}"
+            for device in programmers
+            if serials.get(device)
+        }
+
+    def _get_programmer_variant(
+        self,
+        board: str,
+        prog: dict,
+        programmers: Dict[str, str],
+        args_name: str,
+    ) -> Optional[Dict[str, str]]:
+        """Get the command lines of the devices with the given extra args of
+        the programmer, from the programmer command lines returned by
+        _get_programmer(). The args are given in programmers.json:
+          * check_args: compare the flash with the bitstream. Ex. "-c"
+          * offset_args: write the bitstream at the flash offset ${OFFSET}
+
+        It returns None if the programmer doesn't have the args, or if
+        programming the SRAM.
+        """
+
+        # -- Get the args of the programmer.
+        prog_type = self.resources.boards[board]["programmer"]["type"]
+        extra_args = self.resources.programmers[prog_type].get(args_name)
+        if not extra_args or prog[SRAM]:
+            return None
+
+        # -- The args go before the bitstream file name, see
+        # -- _serialize_programmer().
+        return {
+            device: cmd.replace(" $SOURCE", f" {extra_args} $SOURCE", 1)
+            for device, cmd in programmers.items()
+        }
+
+    @staticmethod
+    def _split_devices(devices: Optional[str]) -> Optional[List[str]]:
+        """Splits a comma separated list of devices given by the user, e.g.
+        '0,1', or returns None if not given."""
+        if not devices:
+            return None
+        return [device.strip() for device in devices.split(",")]
 
     @staticmethod
     def _check_platform(board_info: dict, actual_platform_id: str) -> None:
@@ -474,6 +672,8 @@ class SCons:
                 f"'{required_platform_id}' but '{actual_platform_id}' found."
             )
 
+    # R0914: Too many local variables (16/15)
+    # pylint: disable=R0914
     def _check_pip_packages(self, board_info):
         """Check if the corresponding pip package with the programmer
         has already been installed. In the case of an apio package
@@ -504,6 +704,9 @@ class SCons:
         # -- In case of an apio package it is just ignored
         for pip_pkg in pip_packages:
 
+            # pylint: disable=import-outside-toplevel
+            import semantic_version
+
             # -- Get legacy string (Ex. ">=1.0.21,<1.1.0")
             legacy_str = all_pip_packages[pip_pkg]
 
@@ -649,9 +852,7 @@ class SCons:
         hwid = f"{usb_data['vid']}:{usb_data['pid']}"
 
         # -- Get the list of the connected USB devices
-        # -- (execute the command "lsusb" from the apio System module)
-        system = System(self.resources)
-        connected_devices = system.get_usb_devices()
+        connected_devices = self.devices.usb_devices()
 
         # -- Check if the given device (vid:pid) is connected!
         # -- Not connected by default
@@ -680,42 +881,85 @@ class SCons:
             # -- Raise an exception
             raise ConnectionError("board " + board + " not connected")
 
-    def _get_serial_port(
-        self, board: str, borad_info: dict, ext_serial_port: str
-    ) -> str:
-        """Get the serial port of the connected board
+    @staticmethod
+    def _select_devices(
+        board: str,
+        devices: List[str],
+        ext_devices: Optional[List[str]],
+        all_connected: bool,
+    ) -> List[str]:
+        """Select the devices to upload to.
         * INPUT:
           * board: Board name (string)
-          * board_info: Dictionary with board info from boards.json.
-          * ext_serial_port: serial port name given by the user (optional)
+          * devices: The connected devices of the board
+          * ext_devices: The devices given by the user (optional)
+          * all_connected: Select all the connected devices
 
-        * OUTPUT: (string) The serial port name
+        * OUTPUT: The given devices, or the first connected device, or all
+          of them if all_connected is True.
 
-        It raises an exception if the board is not connected
+        It raises an exception if a device is not connected
         """
 
-        # -- Search Serial port by USB id
-        device = self._check_serial(board, borad_info, ext_serial_port)
-
         # -- Board not connected
-        if not device:
+        if not devices:
             raise ConnectionError("board " + board + " not connected")
 
-        # -- Board connected. Return the serial port detected
-        return device
+        # -- All the devices given by the user should be connected
+        if ext_devices is not None:
+            missing = [d for d in ext_devices if d not in devices]
+            if missing:
+                raise ConnectionError(
+                    f"board {board} not connected at {', '.join(missing)}"
+                )
+            return ext_devices
+
+        return devices if all_connected else devices[:1]
+
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+    def _get_serial_ports(
+        self,
+        board: str,
+        board_info: dict,
+        ext_serial_ports: Optional[List[str]],
+        all_connected: bool,
+    ) -> List[str]:
+        """Get the serial ports of the connected boards
+        * INPUT:
+          * board: Board name (string)
+          * board_info: Dictionary with board info from boards.json.
+          * ext_serial_ports: serial port names given by the user (optional)
+          * all_connected: Return all the matching serial ports
+
+        * OUTPUT: (list) The serial port names
+
+        It raises an exception if the board is not connected
+        """
+
+        # -- Search Serial ports by USB id
+        devices = self._check_serial(board, board_info, ext_serial_ports)
+
+        # -- Board connected. Return the serial ports detected
+        return self._select_devices(
+            board, devices, ext_serial_ports, all_connected
+        )
 
     def _check_serial(
-        self, board: str, board_info: dict, ext_serial_port: str
-    ) -> str:
-        """Check the that the serial port for the given board exists
+        self,
+        board: str,
+        board_info: dict,
+        ext_serial_ports: Optional[List[str]],
+    ) -> List[str]:
+        """Check the that the serial ports for the given board exist
          (board connedted)
 
         * INPUT:
           * board: Board name (string)
           * board_info: Dictionary with board info from boards.json.
-          * ext_serial_port: serial port name given by the user (optional)
+          * ext_serial_ports: serial port names given by the user (optional)
 
-        * OUTPUT: (string) The serial port name
+        * OUTPUT: (list) The serial port names
         """
 
         # -- The board is connected by USB
@@ -735,7 +979,7 @@ class SCons:
         # -- Ex: [{'port': '/dev/ttyACM0',
         #          'description': 'ttyACM0',
         #          'hwid': 'USB VID:PID=1D50:6130 LOCATION=1-5:1.0'}]
-        serial_ports = util.get_serial_ports()
+        serial_ports = self.devices.serial_ports()
 
         # -- If no serial ports detected: raise an Error!
         if not serial_ports:
@@ -744,14 +988,15 @@ class SCons:
             raise AttributeError("board " + board + " not available")
 
         # -- Match the discovered serial ports
+        ports = []
         for serial_port_data in serial_ports:
 
             # -- Get the port name of the detected board
             port = serial_port_data["port"]
 
             # If the --device options is set but it doesn't match
-            # the detected port, skip the port.
-            if ext_serial_port and ext_serial_port != port:
+            # the detected ports, skip the port.
+            if ext_serial_ports and port not in ext_serial_ports:
                 continue
 
             # -- Check if the TinyFPGA board is connected
@@ -765,14 +1010,12 @@ class SCons:
                 if "tinyprog" in board_info and not connected:
                     continue
 
-                # -- Return the serial port
-                return port
+                # -- Add the serial port
+                ports.append(port)
 
-        # -- No serial port found...
-        return None
+        return ports
 
-    @staticmethod
-    def _check_tinyprog(board_info: dict, port: str) -> bool:
+    def _check_tinyprog(self, board_info: dict, port: str) -> bool:
         """Check if the correct TinyFPGA board is connected
         * INPUT:
           * board_info: Dictionary with board info from boards.json.
@@ -801,7 +1044,7 @@ class SCons:
 
         # -- Get a list with the meta data of all the TinyFPGA boards
         # -- connected
-        list_meta = util.get_tinyprog_meta()
+        list_meta = self.devices.tinyprog_meta()
 
         # -- Check if there is a match: target TinyFPGA is ok
         for tinyprog_meta in list_meta:
@@ -821,45 +1064,55 @@ class SCons:
         # -- TinyFPGA board not detected!
         return False
 
-    def _get_ftdi_id(self, board, board_info, ext_ftdi_id) -> str:
-        """Get the FTDI index of the detected board
+    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+    def _get_ftdi_ids(
+        self,
+        board: str,
+        board_info: dict,
+        ext_ftdi_ids: Optional[List[str]],
+        all_connected: bool,
+    ) -> List[str]:
+        """Get the FTDI indexes of the detected boards
 
         * INPUT:
           * board: Board name (string)
           * board_info: Dictionary with board info from boards.json.
-          * ext_ftdi_id: FTDI index given by the user (optional)
+          * ext_ftdi_ids: FTDI indexes given by the user (optional)
+          * all_connected: Return all the matching FTDI indexes
 
-        * OUTPUT: It return the FTDI index (as a string)
-                  Ex: '0'
+        * OUTPUT: It return the FTDI indexes (as strings)
+                  Ex: ['0']
 
           It raises an exception if no FTDI device is connected
         """
 
-        # -- Search device by FTDI id
-        ftdi_id = self._check_ftdi(board, board_info, ext_ftdi_id)
-
-        # -- No FTDI board connected
-        if ftdi_id is None:
-            raise AttributeError("board " + board + " not connected")
+        # -- Search devices by FTDI id
+        ftdi_ids = self._check_ftdi(board, board_info, ext_ftdi_ids)
 
-        # -- Return the FTDI index
-        # -- Ex: '0'
-        return ftdi_id
+        # -- Return the FTDI indexes
+        # -- Ex: ['0']
+        return self._select_devices(
+            board, ftdi_ids, ext_ftdi_ids, all_connected
+        )
 
     def _check_ftdi(
-        self, board: str, board_info: dict, ext_ftdi_id: str
-    ) -> str:
+        self,
+        board: str,
+        board_info: dict,
+        ext_ftdi_ids: Optional[List[str]],
+    ) -> List[str]:
         """Check if the given ftdi board is connected or not to the computer
-           and return its FTDI index
+           and return its FTDI indexes
 
         * INPUT:
           * board: Board name (string)
           * board_info: Dictionary with board info from boards.json.
-          * ext_ftdi_id: FTDI index given by the user (optional)
+          * ext_ftdi_ids: FTDI indexes given by the user (optional)
 
-        * OUTPUT: It return the FTDI index (as a string)
-                  Ex: '0'
-              * Or None if no board is found
+        * OUTPUT: It return the FTDI indexes (as strings)
+                  Ex: ['0']
+              * Or an empty list if no board is found
         """
 
         # -- Check that the given board has the property "ftdi"
@@ -881,9 +1134,7 @@ class SCons:
         desc_pattern = f"^{board_desc}.*$"
 
         # -- Get the list of the connected FTDI devices
-        # -- (execute the command "lsftdi" from the apio System module)
-        system = System(self.resources)
-        connected_devices = system.get_ftdi_devices()
+        connected_devices = self.devices.ftdi_devices()
 
         # -- No FTDI devices detected --> Error!
         if not connected_devices:
@@ -892,7 +1143,8 @@ class SCons:
             raise AttributeError("board " + board + " not available")
 
         # -- Check if the given board is connected
-        # -- and if so, return its FTDI index
+        # -- and if so, return its FTDI indexes
+        indexes = []
         for ftdi_device in connected_devices:
 
             # -- Get the FTDI index
@@ -900,17 +1152,16 @@ class SCons:
             index = ftdi_device["index"]
 
             # If the --device options is set but it doesn't match
-            # with the detected index, skip the port.
-            if ext_ftdi_id is not None and ext_ftdi_id != index:
+            # with the detected indexes, skip the port.
+            if ext_ftdi_ids is not None and index not in ext_ftdi_ids:
                 continue
 
             # If matches the description pattern
-            # return the index for the FTDI device.
+            # add the index of the FTDI device.
             if re.match(desc_pattern, ftdi_device["description"]):
-                return index
+                indexes.append(index)
 
-        # -- No FTDI board found
-        return None
+        return indexes
 
     # pylint: disable=too-many-arguments
     # pylint: disable=too-many-positional-arguments
@@ -931,6 +1182,9 @@ class SCons:
         # -- It is passed to scons using the flag -f default_scons_file
         variables += ["-f", f"{scons_file_path}"]
 
+        # -- Pass the configuration of the build artifacts cache.
+        variables += self._get_cache_variables(required_packages_names)
+
         # -- Check that the required packages are installed
         pkg_util.check_required_packages(
             required_packages_names, self.resources
@@ -942,6 +1196,47 @@ class SCons:
         # -- Execute scons
         return self._execute_scons(command, variables, board)
 
+    def _get_cache_variables(self, required_packages_names) -> list:
+        """Returns the scons variables that configure the shared build
+        artifacts cache, or an empty list if the cache is disabled."""
+
+        # -- The cache is opt-in since it can take a lot of disk space.
+        cache_dir = env_options.get(env_options.APIO_BUILD_CACHE_DIR)
+        if not cache_dir and not env_options.is_true(
+            env_options.APIO_BUILD_CACHE
+        ):
+            return []
+
+        # -- Get the max size of the cache. 0 disables it.
+        max_mb = env_options.get(
+            env_options.APIO_BUILD_CACHE_SIZE, default=str(CACHE_MAX_MB)
+        )
+        if not max_mb.isdigit():
+            raise ValueError(
+                f"Invalid {env_options.APIO_BUILD_CACHE_SIZE} value "
+                f"'{max_mb}', expecting a size in MB."
+            )
+        if int(max_mb) == 0:
+            return []
+
+        # -- Get the cache dir.
+        if not cache_dir:
+            cache_dir = util.get_home_dir() / "cache" / "build"
+
+        # -- The artifacts depends also on the version of the tools.
+        # -- Ex: 'oss-cad-suite-0.0.9'
+        profile = self.resources.profile
+        toolchain_version = ",".join(
+            f"{name}-{profile.get_package_installed_version(name)}"
+            for name in sorted(required_packages_names)
+        )
+
+        return [
+            f"cache_dir={cache_dir}",
+            f"cache_max_mb={max_mb}",
+            f"toolchain_version={toolchain_version}",
+        ]
+
     # R0914: Too many local variables (19/15)
     # pylint: disable=R0914
     def _execute_scons(self, command: str, variables: list, board: str) -> int:
@@ -951,7 +1246,7 @@ class SCons:
           * variables: Parameters passed to scons
             Ex. ['fpga_arch=ice40', 'fpga_size=8k', 'fpga_type=lp',
                  'fpga_pack=cm81', 'top_module=main',
-                 'prog=tinyprog --pyserial -c /dev/ttyACM0 --program',
+                 'progs={"/dev/ttyACM0": "tinyprog --pyserial -c ...'
                  '-f', '/home/obijuan/Develop/FPGAwars/apio/apio/
                         scons/ice40/SConstruct']
           * board: (string) Board name
@@ -967,6 +1262,8 @@ class SCons:
         # -- Read the time (for measuring how long does it take
         # -- to execute the apio command)
         start_time = time.time()
+        events.emit("step_start", step=command, board=board)
+        build_stats.start_command()
 
         # -- Only for these three commands
         if command in ("build", "upload", "time"):
@@ -1005,18 +1302,60 @@ class SCons:
         # -- needed and write them to stdout.
         scons_filter = SconsFilter()
 
-        # -- Execute the scons builder!
-        result = util.exec_command(
-            scons_command,
-            stdout=util.AsyncPipe(scons_filter.on_stdout_line),
-            stderr=util.AsyncPipe(scons_filter.on_stderr_line),
-        )
+        # -- The buffered lines of the filter are written also if the build
+        # -- is interrupted with Ctrl-C or fails with an exception.
+        try:
+            # -- If enabled, try first the persistent build server which
+            # -- keeps the SConstruct graph loaded between commands.
+            exit_code = None
+            if env_options.is_true(env_options.APIO_SCONS_DAEMON):
+                # pylint: disable=import-outside-toplevel
+                from apio.managers import scons_daemon
+
+                exit_code = scons_daemon.run(
+                    command,
+                    variables,
+                    scons_filter.on_stdout_line,
+                    scons_filter.on_stderr_line,
+                )
+
+            # -- Execute the scons builder!
+            if exit_code is None:
+                # -- The output is printed by the filter and is not needed
+                # -- after, so it's not kept in memory.
+                result = util.exec_command(
+                    scons_command,
+                    on_stdout=scons_filter.on_stdout_line,
+                    on_stderr=scons_filter.on_stderr_line,
+                    tail_lines=0,
+                )
+                exit_code = result.exit_code
+        finally:
+            # -- Write the remaining output of the filter.
+            scons_filter.flush()
 
         # -- Is there an error? True/False
-        is_error = result.exit_code != 0
+        is_error = exit_code != 0
 
         # -- Calculate the time it took to execute the command
         duration = time.time() - start_time
+        build_stats.end_command(
+            command=command,
+            board=board,
+            toolchain=self.resources.profile.get_package_installed_version(
+                "oss-cad-suite", None
+            ),
+            start_time=start_time,
+            duration=duration,
+            exit_code=exit_code,
+        )
+        events.emit(
+            "step_end",
+            step=command,
+            status="error" if is_error else "success",
+            exit_code=exit_code,
+            duration=round(duration, 3),
+        )
 
         # -- Summary
         summary_text = f" Took {duration:.2f} seconds "
@@ -1038,4 +1377,4 @@ class SCons:
         )
 
         # -- Return the exit code
-        return result.exit_code
+        return exit_code
@@ -0,0 +1,512 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Author Jesús Arroyo
+# -- Licence GPLv2
+"""A persistent, per project, scons build server.
+
+Running 'scons' from scratch for every apio command re-imports SCons and
+re-evaluates the SConstruct file (construction env, builders, source
+scanning) every time. For small designs this fixed overhead is a large part
+of the edit-build loop. When enabled with the APIO_SCONS_DAEMON env option,
+apio sends the scons commands to a long lived server process, one per project
+dir, that keeps 'scons --interactive' sessions alive with the SConstruct
+graph already loaded.
+
+The server listens on a localhost TCP port that is recorded, together with
+a random access token, in the project file .apio/scons-daemon.json. Each
+request is a single json line and the server streams back the stdout/stderr
+lines of the build as json lines, followed by the exit code. A session is
+kept per command line and build env vars (PATH, APIO_* and the toolchain
+vars), up to MAX_SESSIONS. The sessions are discarded and recreated when
+apio.ini, the constraint files or the set of *.v files change, and the
+server exits after being idle for a while.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import secrets
+import hashlib
+import subprocess
+import importlib.metadata
+import socketserver
+from collections import OrderedDict
+from queue import Queue
+from pathlib import Path
+from threading import Thread, Lock
+from typing import Callable, Optional, Dict, Tuple, List
+from apio import util
+
+# -- The name of the server info file in the project state dir.
+STATE_FILE_NAME = "scons-daemon.json"
+
+# -- The server exits after this many seconds without requests.
+IDLE_TIMEOUT_SECS = 30 * 60
+
+# -- How long the client waits for a newly spawned server to come up.
+SPAWN_TIMEOUT_SECS = 10
+
+# -- The apio commands that can be executed by the server. Clean and upload
+# -- are always executed directly.
+DAEMON_COMMANDS = (
+    "build",
+    "verify",
+    "graph",
+    "lint",
+    "sim",
+    "test",
+    "time",
+    "report",
+)
+
+# -- The max number of scons sessions that are kept alive. When exceeded,
+# -- the least recently used session is closed.
+MAX_SESSIONS = 4
+
+# -- The env vars that affect the builds, in addition to PATH and the APIO_*
+# -- vars. These are the vars that the packages set, see packages.json.
+TOOLCHAIN_ENV_VARS = (
+    "ICEBOX",
+    "IVL",
+    "TRELLIS",
+    "VERILATOR_ROOT",
+    "YOSYS_LIB",
+)
+
+# -- Constraint files that affect the loaded SConstruct graph.
+CONSTRAINT_FILE_PATTERNS = ("*.pcf", "*.lpf", "*.cst")
+
+# -- SCons prints this prompt, without a new line, when waiting for the next
+# -- interactive command. It ends up as a prefix of the next output line.
+PROMPT_REGEX = re.compile(r"^(scons>>> )+")
+
+# -- A stderr line that indicates that the build failed.
+ERROR_REGEX = re.compile(r"^scons: \*\*\* ")
+
+
+def _apio_version() -> str:
+    """Returns the version of the running apio package."""
+    return importlib.metadata.version("apio")
+
+
+def get_state_file(project_dir: Path) -> Path:
+    """Returns the path of the server info file of the given project."""
+    return util.get_project_state_dir(project_dir) / STATE_FILE_NAME
+
+
+def compute_fingerprint(project_dir: Path) -> str:
+    """Returns a fingerprint of the project files that are read when the
+    SConstruct file is loaded. Changes to the content of the verilog files
+    are handled by scons itself and don't require reloading the graph, but
+    adding or removing a file does."""
+
+    items = []
+
+    # -- apio.ini and the constraint files, by content stamp.
+    stamped = [project_dir / "apio.ini"]
+    for pattern in CONSTRAINT_FILE_PATTERNS:
+        stamped.extend(project_dir.glob(pattern))
+    for path in sorted(stamped):
+        if path.is_file():
+            stat = path.stat()
+            items.append(f"{path.name}:{stat.st_mtime_ns}:{stat.st_size}")
+
+    # -- The set of verilog files, by name only.
+    items.extend(sorted(p.name for p in project_dir.glob("*.v")))
+
+    return hashlib.sha1("\n".join(items).encode()).hexdigest()
+
+
+class _Session:
+    """A single 'scons --interactive' process for a given scons command
+    line. Each command line has its own session since the SConstruct file
+    evaluates COMMAND_LINE_TARGETS and the scons variables only once, when
+    it's loaded."""
+
+    def __init__(self, scons_argv: List[str], env: Dict[str, str]):
+        # -- Since the output is piped, make sure it's not buffered.
+        env = dict(env)
+        env["PYTHONUNBUFFERED"] = "1"
+
+        # pylint: disable=consider-using-with
+        self.proc = subprocess.Popen(
+            scons_argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            encoding="utf-8",
+            errors="replace",
+        )
+
+        # -- Lines from both pipes, as (pipe_name, line). line is None
+        # -- when the pipe is closed.
+        self.lines: Queue = Queue()
+        self._readers = [
+            Thread(target=self._read_pipe, args=("out", self.proc.stdout)),
+            Thread(target=self._read_pipe, args=("err", self.proc.stderr)),
+        ]
+        for reader in self._readers:
+            reader.daemon = True
+            reader.start()
+
+    def _read_pipe(self, pipe_name: str, pipe) -> None:
+        """Reader thread body. Forward the lines to the lines queue."""
+        for line in iter(pipe.readline, ""):
+            self.lines.put((pipe_name, line.rstrip("\r\n")))
+        self.lines.put((pipe_name, None))
+
+    def is_alive(self) -> bool:
+        """True if the scons process is still running."""
+        return self.proc.poll() is None
+
+    def run(self, target: str, emit: Callable[[str, str], None]) -> int:
+        """Build the given target and send the output lines to emit().
+        Returns the exit code."""
+
+        # -- A unique marker that we print to both pipes after the build.
+        # -- Since scons executes the interactive commands in order, once we
+        # -- see the two markers, all the build output was received.
+        marker = f"@@apio-done-{secrets.token_hex(8)}"
+        marker_cmd = (
+            f"import sys; print('{marker}'); "
+            f"print('{marker}', file=sys.stderr)"
+        )
+        python = sys.executable.replace("\\", "/")
+        self.proc.stdin.write(f'build {target}\nshell "{python}" -c ')
+        self.proc.stdin.write(f'"{marker_cmd}"\n')
+        self.proc.stdin.flush()
+
+        pending_pipes = {"out", "err"}
+        failed = False
+        while pending_pipes:
+            pipe_name, line = self.lines.get()
+
+            # -- The scons process exited, e.g. a fatal error in SConstruct.
+            if line is None:
+                pending_pipes.discard(pipe_name)
+                if not pending_pipes:
+                    return self.proc.wait() or 1
+                continue
+
+            line = PROMPT_REGEX.sub("", line)
+            if line == marker:
+                pending_pipes.discard(pipe_name)
+                continue
+
+            if pipe_name == "err" and ERROR_REGEX.match(line):
+                failed = True
+            emit(pipe_name, line)
+
+        return 1 if failed else 0
+
+    def close(self) -> None:
+        """Terminate the scons process."""
+        if self.is_alive():
+            try:
+                self.proc.stdin.write("exit\n")
+                self.proc.stdin.flush()
+                self.proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+
+
+def _build_env_items(env: Dict[str, str]) -> Tuple:
+    """Returns the sorted (name, value) items of the given client env vars
+    that affect the builds. The other vars, which differ between terminals,
+    don't require a session of their own."""
+    return tuple(
+        sorted(
+            (name, value)
+            for name, value in env.items()
+            if name.upper() == "PATH"
+            or name.upper().startswith("APIO_")
+            or name.upper() in TOOLCHAIN_ENV_VARS
+        )
+    )
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    """The build server. Holds the scons sessions of a single project."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, project_dir: Path, token: str):
+        super().__init__(("127.0.0.1", 0), _RequestHandler)
+        self.project_dir = project_dir
+        self.token = token
+        self.fingerprint = None
+        # -- The sessions by their key, the least recently used first.
+        self.sessions: OrderedDict[Tuple, _Session] = OrderedDict()
+        # -- Builds of the same project are executed one at a time.
+        self.build_lock = Lock()
+        self.last_activity = time.time()
+
+    def get_session(self, request: dict) -> Tuple[_Session, str]:
+        """Returns a live session for the given request, and the scons target
+        to build. Called with build_lock held."""
+
+        # -- If the project structure changed, the loaded graphs are stale.
+        fingerprint = compute_fingerprint(self.project_dir)
+        if fingerprint != self.fingerprint:
+            self.close_sessions()
+            self.fingerprint = fingerprint
+
+        command = request["command"]
+        variables = request["variables"]
+        env = request["env"]
+        key = (command, tuple(variables), _build_env_items(env))
+        session = self.sessions.get(key)
+        if session is None or not session.is_alive():
+            if session is not None:
+                del self.sessions[key]
+            scons_argv = (
+                ["scons", "-Q", "--interactive", command]
+                + variables
+                + ["force_colors=True"]
+            )
+            session = _Session(scons_argv, env)
+            self.sessions[key] = session
+            if len(self.sessions) > MAX_SESSIONS:
+                _, oldest = self.sessions.popitem(last=False)
+                oldest.close()
+        self.sessions.move_to_end(key)
+
+        return session, command
+
+    def close_sessions(self) -> None:
+        """Terminates all the scons sessions."""
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+    def idle_watchdog(self) -> None:
+        """Thread body. Shuts down the server when idle for too long."""
+        while True:
+            time.sleep(10)
+            if self.build_lock.locked():
+                continue
+            if time.time() - self.last_activity > IDLE_TIMEOUT_SECS:
+                self.shutdown()
+                return
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handles a single client connection."""
+
+    def _send(self, msg: dict) -> None:
+        self.wfile.write((json.dumps(msg) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        server: _Server = self.server
+        request = json.loads(self.rfile.readline())
+        if request.get("token") != server.token:
+            return
+
+        if request.get("op") == "stop":
+            self._send({"exit_code": 0})
+            Thread(target=server.shutdown, daemon=True).start()
+            return
+
+        with server.build_lock:
+            server.last_activity = time.time()
+            session, target = server.get_session(request)
+            exit_code = session.run(
+                target,
+                lambda pipe, line: self._send({"pipe": pipe, "line": line}),
+            )
+            server.last_activity = time.time()
+        self._send({"exit_code": exit_code})
+
+
+def serve(project_dir: Path) -> None:
+    """Run the build server of the given project until it's idle or
+    stopped. This is the entry point of the server process."""
+
+    project_dir = project_dir.resolve()
+    os.chdir(project_dir)
+
+    server = _Server(project_dir, secrets.token_hex(16))
+    state_file = get_state_file(project_dir)
+    state = {
+        "pid": os.getpid(),
+        "port": server.server_address[1],
+        "token": server.token,
+        "version": _apio_version(),
+    }
+
+    # -- Write the info file atomically, readable only by the user.
+    tmp_file = state_file.with_suffix(".tmp")
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf8") as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
+
+    Thread(target=server.idle_watchdog, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.close_sessions()
+        server.server_close()
+        # -- Remove the info file, unless a newer server replaced it.
+        if _read_state(project_dir) == state:
+            state_file.unlink(missing_ok=True)
+
+
+def _read_state(project_dir: Path) -> Optional[dict]:
+    """Returns the content of the server info file or None if not
+    available."""
+    try:
+        with get_state_file(project_dir).open(encoding="utf8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _connect(project_dir: Path) -> Optional[Tuple[socket.socket, dict]]:
+    """Connects to the running server of the project. Returns the socket and
+    the server info, or None if there is no usable server."""
+    state = _read_state(project_dir)
+    if not state:
+        return None
+    try:
+        sock = socket.create_connection(("127.0.0.1", state["port"]), 2)
+    except (OSError, KeyError):
+        return None
+    sock.settimeout(None)
+    return sock, state
+
+
+def _spawn(project_dir: Path) -> None:
+    """Starts a detached server process for the given project."""
+    flags = {}
+    if sys.platform == "win32":
+        flags["creationflags"] = (
+            subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        )
+    else:
+        flags["start_new_session"] = True
+
+    # pylint: disable=consider-using-with
+    subprocess.Popen(
+        [sys.executable, "-m", "apio.managers.scons_daemon", "serve"],
+        cwd=project_dir,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        **flags,
+    )
+
+
+def _request(
+    sock: socket.socket,
+    msg: dict,
+    on_stdout_line: Callable[[str], None],
+    on_stderr_line: Callable[[str], None],
+) -> Optional[int]:
+    """Send a request and dispatch the reply lines. Returns the exit code
+    or None if the connection failed before any reply was received."""
+    got_output = False
+    with sock, sock.makefile("rwb") as stream:
+        stream.write((json.dumps(msg) + "\n").encode())
+        stream.flush()
+        for raw_line in stream:
+            reply = json.loads(raw_line)
+            if "exit_code" in reply:
+                return reply["exit_code"]
+            got_output = True
+            if reply["pipe"] == "out":
+                on_stdout_line(reply["line"])
+            else:
+                on_stderr_line(reply["line"])
+    # -- The server went away in the middle of the build. If some of the
+    # -- output was already printed, don't let the caller run it again.
+    return 1 if got_output else None
+
+
+def stop(project_dir: Path) -> bool:
+    """Stops the server of the given project, if running. Returns True if a
+    server was stopped."""
+    connection = _connect(project_dir)
+    if not connection:
+        return False
+    sock, state = connection
+    try:
+        _request(
+            sock,
+            {"op": "stop", "token": state["token"]},
+            print,
+            print,
+        )
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def run(
+    command: str,
+    variables: List[str],
+    on_stdout_line: Callable[[str], None],
+    on_stderr_line: Callable[[str], None],
+) -> Optional[int]:
+    """Executes the given scons command on the build server of the project
+    in the current directory, starting the server if needed. The output
+    lines are passed to the given callbacks. Returns the scons exit code,
+    or None if the server is not usable, in which case the caller should
+    run scons directly.
+    """
+    if command not in DAEMON_COMMANDS:
+        return None
+
+    project_dir = Path.cwd()
+
+    # -- Connect to the server, (re)starting it if needed.
+    connection = _connect(project_dir)
+    if connection and connection[1].get("version") != _apio_version():
+        # -- A server from a different apio version, replace it.
+        connection[0].close()
+        stop(project_dir)
+        connection = None
+    if not connection:
+        _spawn(project_dir)
+        deadline = time.time() + SPAWN_TIMEOUT_SECS
+        while not connection and time.time() < deadline:
+            time.sleep(0.05)
+            connection = _connect(project_dir)
+    if not connection:
+        return None
+
+    sock, state = connection
+    msg = {
+        "op": "build",
+        "token": state["token"],
+        "command": command,
+        "variables": variables,
+        "env": dict(os.environ),
+    }
+    try:
+        return _request(sock, msg, on_stdout_line, on_stderr_line)
+    except (OSError, ValueError):
+        return None
+
+
+def main(argv: List[str]) -> None:
+    """Command line entry point, used to start the server process.
+    'serve' runs the server of the project in the current directory and
+    'stop' stops it."""
+    if argv == ["serve"]:
+        serve(Path.cwd())
+    elif argv == ["stop"]:
+        stop(Path.cwd())
+    else:
+        sys.exit("Usage: python -m apio.managers.scons_daemon serve|stop")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
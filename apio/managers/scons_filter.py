@@ -15,15 +15,78 @@
 # when writing to a pipe.
 
 import re
+import threading
 from enum import Enum
-from typing import List, Optional, Tuple
+from typing import Dict, Optional
 import click
+from apio import events
 
 
 # -- Terminal cursor commands.
 CURSOR_UP = "\033[F"
 ERASE_LINE = "\033[K"
 
+# -- The line color classifiers. Each is a single regex that is matched
+# -- at the beginning of a line, with an alternative per color, in the
+# -- order of their priority. The name of the matching group is the
+# -- color. Patterns that can match anywhere in the line are written as a
+# -- lookahead.
+PNR_COLORS = re.compile(r"(?P<yellow>warning:)|(?P<red>error:)", re.I)
+ICEPROG_COLORS = re.compile(r"(?P<green>done.|VERIFY OK)")
+STDOUT_COLORS = re.compile(
+    r"(?=.*?(?P<green>is up to date))|(?P<yellow>warning:)|(?P<red>error:)",
+    re.I,
+)
+STDERR_COLORS = re.compile(r"(?P<yellow>info:|warning:)|(?P<red>error:)", re.I)
+
+# -- Iceprog progress lines, e.g. "addr 0x001400  3%"
+# -- Regular expression remainder:
+# -- \s --> Match one blank space
+# -- [0-9A-F]+ one or more hexadecimal digit
+# -- \d{1,2} one or two decimal digits
+ICEPROG_PROGRESS = re.compile(r"addr\s0x[0-9A-F]+\s+\d{1,2}%")
+
+# -- Fumo progress lines.
+FUMO_PROGRESS = re.compile(r"Download\s*\[=*")
+
+# -- Tinyprog progress lines, e.g. " 97%|█████████▋| "
+# -- Regular expression remainder:
+# -- \s --> Match one blank space
+# -- \d{1,3} one, two or three decimal digits
+TINYPROG_PROGRESS = re.compile(r"\s\d{1,3}%\|█*")
+
+# -- The percent of a progress line.
+PERCENT = re.compile(r"(\d{1,3})%")
+
+# -- The prefix of the progress line of a parallel upload to several
+# -- devices, e.g. "Upload progress: ftdi 0: 45%, ftdi 1: done".
+UPLOAD_PROGRESS = "Upload progress: "
+
+# -- A device with a percent in the progress line of a parallel upload.
+DEVICE_PERCENT = re.compile(
+    r"(?:^|, )(?P<device>[^,]+): (?P<percent>\d{1,3})%"
+)
+
+# -- Diagnostics with a severity prefix, optionally followed by a source
+# -- location, e.g. of yosys and nextpnr "ERROR: Unable to place cell" and
+# -- verilator "%Warning-WIDTH: main.v:3:7: Operator ASSIGN expects 8 bits".
+PREFIXED_DIAGNOSTIC = re.compile(
+    r"%?(?P<severity>error|warning)(?:-\w+)?:\s*"
+    r"(?:(?P<file>[^\s:]+):(?P<line>\d+):(?:(?P<column>\d+):)?\s*)?"
+    r"(?P<message>.*)",
+    re.I,
+)
+
+# -- Diagnostics that start with a source location, optionally followed by
+# -- a severity, e.g. of yosys "main.v:5: ERROR: syntax error" and iverilog
+# -- "main.v:5: syntax error". Without a severity, it's an error of
+# -- iverilog, or of an unknown tool.
+LOCATED_DIAGNOSTIC = re.compile(
+    r"(?P<file>[^\s:]+\.\w+):(?P<line>\d+):(?:(?P<column>\d+):)?\s*"
+    r"(?:(?P<severity>error|warning)\w*:\s*)?(?P<message>.*)",
+    re.I,
+)
+
 
 class PipeId(Enum):
     """Represent the two output streams from the scons subprocess."""
@@ -44,7 +107,11 @@ class RangeEvents(Enum):
 
 class RangeDetector:
     """Base detector of a range of lines within the sequence of stdout/err
-    lines recieves from the scons subprocess."""
+    lines recieves from the scons subprocess. The start and end of a range
+    are emitted as the tool_start and tool_end events of its TOOL."""
+
+    # -- The name of the tool whose output is detected, set by subclasses.
+    TOOL: str = None
 
     def __init__(self):
         self._in_range = False
@@ -53,26 +120,29 @@ class RangeDetector:
         """Updates the range detector with the next stdout/err line.
         return True iff detector classified this line to be within a range."""
 
-        prev_state = self._in_range
         event = self.classify_line(pipe_id, line)
 
-        if event == RangeEvents.START_BEFORE:
-            self._in_range = True
+        # -- Fast path, most of the lines don't start or end a range.
+        if event is None:
             return self._in_range
 
-        if event == RangeEvents.START_AFTER:
+        prev_state = self._in_range
+        if event in (RangeEvents.START_BEFORE, RangeEvents.START_AFTER):
             self._in_range = True
-            return prev_state
-
-        if event == RangeEvents.END_BEFORE:
+        elif event in (RangeEvents.END_BEFORE, RangeEvents.END_AFTER):
             self._in_range = False
-            return self._in_range
+        else:
+            raise ValueError(f"Unexpected range event {event}")
 
-        if event == RangeEvents.END_AFTER:
-            self._in_range = False
-            return prev_state
+        if self._in_range != prev_state:
+            events.emit(
+                "tool_start" if self._in_range else "tool_end", tool=self.TOOL
+            )
 
-        assert event is None, event
+        # -- A range that starts or ends after the current line doesn't
+        # -- change the classification of the current line.
+        if event in (RangeEvents.START_AFTER, RangeEvents.END_AFTER):
+            return prev_state
         return self._in_range
 
     def classify_line(
@@ -89,16 +159,15 @@ class PnrRangeDetector(RangeDetector):
     """Implements a RangeDetector for the nextpnr command verbose
     log lines."""
 
-    def classify_line(self, pipe_id: PipeId, line: str) -> RangeEvents:
-        # -- Break line into words.
-        tokens = line.split()
+    TOOL = "nextpnr"
 
+    def classify_line(self, pipe_id: PipeId, line: str) -> RangeEvents:
         # -- Range start: A nextpnr command on stdout without
         # -- the -q (quiet) flag.
         if (
             pipe_id == PipeId.STDOUT
             and line.startswith("nextpnr")
-            and "-q" not in tokens
+            and "-q" not in line.split()
         ):
             return RangeEvents.START_AFTER
 
@@ -112,6 +181,8 @@ class PnrRangeDetector(RangeDetector):
 class IceProgRangeDetector(RangeDetector):
     """Implements a RangeDetector for the iceprog command output."""
 
+    TOOL = "iceprog"
+
     def __init__(self):
         super().__init__()
         # -- Indicates if the last line should be erased before printing the
@@ -132,15 +203,96 @@ class IceProgRangeDetector(RangeDetector):
         return None
 
 
+class IverilogRangeDetector(RangeDetector):
+    """Implements a RangeDetector for the iverilog command output."""
+
+    TOOL = "iverilog"
+
+    def classify_line(self, pipe_id: PipeId, line: str) -> RangeEvents:
+        # -- Range start: An iverilog command on stdout.
+        if pipe_id == PipeId.STDOUT and line.startswith("iverilog"):
+            return RangeEvents.START_AFTER
+
+        # -- Range end: iverilog writes only to stderr, the next stdout line
+        # -- is of the next command.
+        if pipe_id == PipeId.STDOUT:
+            return RangeEvents.END_BEFORE
+
+        return None
+
+
+class BatchWriter:
+    """Writes text to stdout in batches. The text is flushed when MAX_LINES
+    lines are pending, or FLUSH_INTERVAL seconds after the first pending
+    line was written, whatever comes first. Thread safe."""
+
+    MAX_LINES = 1000
+    FLUSH_INTERVAL = 0.1
+
+    def __init__(self):
+        self._lines = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def write(self, line: str) -> None:
+        """Writes a line, possibly with ansi colors. A newline is added."""
+        with self._lock:
+            self._lines.append(line)
+            if len(self._lines) >= self.MAX_LINES:
+                self._flush()
+            elif not self._timer:
+                self._timer = threading.Timer(self.FLUSH_INTERVAL, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def write_raw(self, text: str) -> None:
+        """Writes text as is, without a newline, e.g. cursor commands,
+        after the pending lines."""
+        with self._lock:
+            self._flush()
+            print(text, end="", flush=True)
+
+    def flush(self) -> None:
+        """Writes the pending lines."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Writes the pending lines. Called with the lock held."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._lines:
+            self._lines.append("")
+            click.echo("\n".join(self._lines), nl=False)
+            self._lines.clear()
+
+
 class SconsFilter:
     """Implements the filtering and printing of the stdout/err streams of the
     scons subprocess. Accepts a line one at a time, detects lines ranges of
     intereset, mutates and colors the lines where applicable, and print to
-    stdout."""
+    stdout. The output is written in batches, call flush() when done.
+
+    If the json events are enabled, the lines are emitted as events instead,
+    see apio/events.py."""
 
     def __init__(self):
         self._pnr_detector = PnrRangeDetector()
         self._iceprog_detector = IceProgRangeDetector()
+        self._iverilog_detector = IverilogRangeDetector()
+        self._writer = BatchWriter()
+        # -- True if the last line is an upload progress line that should
+        # -- be erased by the next one.
+        self._upload_progress_pending = False
+        # -- The last percent of each device of a parallel upload that was
+        # -- emitted as an event.
+        self._device_percents: Dict[str, int] = {}
+        self._events = events.enabled()
+
+    def flush(self) -> None:
+        """Writes the pending output lines."""
+        self._writer.flush()
 
     def on_stdout_line(self, line: str) -> None:
         """Stdout pipe calls this on each line."""
@@ -150,19 +302,89 @@ class SconsFilter:
         """Stderr pipe calls this on each line."""
         self.on_line(PipeId.STDERR, line)
 
+    def _write_line(self, line: str, colors: Optional[re.Pattern]) -> None:
+        """Writes a line, colored by the given color classifier, if any.
+        See PNR_COLORS."""
+        match = colors.match(line) if colors else None
+        if match:
+            line = click.style(line, fg=match.lastgroup)
+        self._writer.write(line)
+
     @staticmethod
-    def _assign_line_color(
-        line: str, patterns: List[Tuple[str, str]], default_color: str = None
-    ) -> Optional[str]:
-        """Assigns a color for a given line using a list of (regex, color)
-        pairs. Returns the color of the first matching regex or default_color
-        if none match.
-        """
-        for regex, color in patterns:
-            if re.search(regex, line):
-                return color
-        return default_color
+    def _progress_percent(pipe_id: PipeId, line: str) -> Optional[int]:
+        """Returns the percent of a progress line of a programmer, or None
+        if it's not a progress line."""
+        if pipe_id == PipeId.STDERR:
+            match = ICEPROG_PROGRESS.match(line) or TINYPROG_PROGRESS.search(
+                line
+            )
+        else:
+            match = FUMO_PROGRESS.match(line)
+        match = match and PERCENT.search(line)
+        return int(match.group(1)) if match else None
+
+    @staticmethod
+    def _emit_diagnostic(line: str, tool: Optional[str]) -> None:
+        """Emits a diagnostic event if the line is an error or a warning
+        message."""
+        match = PREFIXED_DIAGNOSTIC.match(line)
+        if not match:
+            match = LOCATED_DIAGNOSTIC.match(line)
+            # -- Only iverilog reports errors without a severity, a location
+            # -- in the output of other known tools is not a diagnostic.
+            if (
+                match
+                and not match.group("severity")
+                and tool not in (None, IverilogRangeDetector.TOOL)
+            ):
+                return
+        if not match:
+            return
+        fields = {
+            "severity": (match.group("severity") or "error").lower(),
+            "message": match.group("message"),
+            "tool": tool,
+        }
+        if match.group("file"):
+            fields["file"] = match.group("file")
+            fields["line"] = int(match.group("line"))
+        if match.group("column"):
+            fields["column"] = int(match.group("column"))
+        events.emit("diagnostic", **fields)
+
+    def _emit_line_events(
+        self, pipe_id: PipeId, line: str, tool: Optional[str]
+    ) -> None:
+        """Emits the events of an output line, instead of writing it."""
+        line = click.unstyle(line)
+        if pipe_id == PipeId.STDOUT and line.startswith(UPLOAD_PROGRESS):
+            # -- One event per device whose percent changed.
+            devices = line.removeprefix(UPLOAD_PROGRESS)
+            for match in DEVICE_PERCENT.finditer(devices):
+                device = match.group("device")
+                percent = int(match.group("percent"))
+                if self._device_percents.get(device) != percent:
+                    self._device_percents[device] = percent
+                    events.emit(
+                        "progress", tool=tool, percent=percent, device=device
+                    )
+            return
+        percent = self._progress_percent(pipe_id, line)
+        if percent is not None:
+            events.emit("progress", tool=tool, percent=percent)
+            return
+        self._emit_diagnostic(line, tool)
+        events.emit(
+            "output",
+            stream="stdout" if pipe_id == PipeId.STDOUT else "stderr",
+            tool=tool,
+            text=line,
+        )
 
+    # R0911: Too many return statements (7/6)
+    # pylint: disable=R0911
+    # R0912: Too many branches (13/12)
+    # pylint: disable=R0912
     def on_line(self, pipe_id: PipeId, line: str) -> None:
         """A shared handler for stdout/err lines from the scons sub process.
         The handler writes both stdout and stderr lines to stdout, possibly
@@ -178,6 +400,30 @@ class SconsFilter:
         # -- Update the range detectors.
         in_pnr_verbose_range = self._pnr_detector.update(pipe_id, line)
         in_iceprog_range = self._iceprog_detector.update(pipe_id, line)
+        in_iverilog_range = self._iverilog_detector.update(pipe_id, line)
+
+        # -- Emit the line as events, instead of writing it.
+        if self._events:
+            if in_pnr_verbose_range:
+                tool = PnrRangeDetector.TOOL
+            elif in_iceprog_range:
+                tool = IceProgRangeDetector.TOOL
+            elif in_iverilog_range:
+                tool = IverilogRangeDetector.TOOL
+            else:
+                tool = None
+            self._emit_line_events(pipe_id, line, tool)
+            return
+
+        # -- Special handling for the progress line of parallel uploads,
+        # -- which is updated in place.
+        if pipe_id == PipeId.STDOUT and line.startswith(UPLOAD_PROGRESS):
+            if self._upload_progress_pending:
+                self._writer.write_raw(CURSOR_UP + ERASE_LINE)
+            self._upload_progress_pending = True
+            self._writer.write(line)
+            return
+        self._upload_progress_pending = False
 
         # -- Handle the line while in the nextpnr verbose log range.
         if pipe_id == PipeId.STDERR and in_pnr_verbose_range:
@@ -187,15 +433,7 @@ class SconsFilter:
             if line.startswith("Info: "):
                 line = line[6:]
 
-            # -- Assign line color.
-            line_color = self._assign_line_color(
-                line.lower(),
-                [
-                    (r"^warning:", "yellow"),
-                    (r"^error:", "red"),
-                ],
-            )
-            click.secho(f"{line}", fg=line_color)
+            self._write_line(line, PNR_COLORS)
             return
 
         # -- Special handling for iceprog line range.
@@ -208,108 +446,60 @@ class SconsFilter:
             # -- If the last iceprog line was a to-be-erased line, erase it
             # -- now and clear the flag.
             if self._iceprog_detector.pending_erasure:
-                print(
-                    CURSOR_UP + ERASE_LINE,
-                    end="",
-                    flush=True,
-                )
+                self._writer.write_raw(CURSOR_UP + ERASE_LINE)
                 self._iceprog_detector.pending_erasure = False
 
             # -- Determine if the current line should be erased before we will
             # -- print the next line.
-            # --
-            # -- Match outputs like these "addr 0x001400  3%"
-            # -- Regular expression remainder:
-            # -- ^ --> Match the begining of the line
-            # -- \s --> Match one blank space
-            # -- [0-9A-F]+ one or more hexadecimal digit
-            # -- \d{1,2} one or two decimal digits
-            pattern = r"^addr\s0x[0-9A-F]+\s+\d{1,2}%"
-
-            # -- Calculate if there is a match!
-            match = re.search(pattern, line)
-
-            # -- If the line is to be erased set the flag.
-            if match:
+            if ICEPROG_PROGRESS.match(line):
                 self._iceprog_detector.pending_erasure = True
 
             # -- Determine line color by its content and print it.
-            line_color = self._assign_line_color(
-                line,
-                [
-                    (r"^done.", "green"),
-                    (r"^VERIFY OK", "green"),
-                ],
-            )
-            click.secho(line, fg=line_color)
+            self._write_line(line, ICEPROG_COLORS)
             return
 
         # -- Special handling for Fumo lines.
-        if pipe_id == PipeId.STDOUT:
-            pattern_fomu = r"^Download\s*\[=*"
-            match = re.search(pattern_fomu, line)
-            if match:
-                # -- Delete the previous line
-                #
-                # -- NOTE: If the progress line will scroll instead of
-                # -- overwriting each other, try to add erasure of a second
-                # -- line. This is due to the commit below which restored
-                # -- empty lines.
-                # -  Commit 93fc9bc4f3bfd21568e2d66f11976831467e3b97.
-                #
-                print(CURSOR_UP + ERASE_LINE, end="", flush=True)
-                click.secho(line, fg="green")
-                return
+        if pipe_id == PipeId.STDOUT and FUMO_PROGRESS.match(line):
+            # -- Delete the previous line
+            #
+            # -- NOTE: If the progress line will scroll instead of
+            # -- overwriting each other, try to add erasure of a second
+            # -- line. This is due to the commit below which restored
+            # -- empty lines.
+            # -  Commit 93fc9bc4f3bfd21568e2d66f11976831467e3b97.
+            #
+            self._writer.write_raw(CURSOR_UP + ERASE_LINE)
+            self._writer.write(click.style(line, fg="green"))
+            return
 
         # -- Special handling for tinyprog lines.
-        if pipe_id == PipeId.STDERR:
-            # -- Check if the line correspond to an output of
-            # -- the tinyprog programmer (TinyFPGA board)
-            # -- Match outputs like these " 97%|█████████▋| "
-            # -- Regular expression remainder:
-            # -- \s --> Match one blank space
-            # -- \d{1,3} one, two or three decimal digits
-            pattern_tinyprog = r"\s\d{1,3}%\|█*"
-
-            # -- Calculate if there is a match
-            match_tinyprog = re.search(pattern_tinyprog, line)
-
-            # -- Match all the progress bar lines except the
-            # -- initial one (when it is 0%)
-            if match_tinyprog and " 0%|" not in line:
-                # -- Delete the previous line.
-                #
-                # -- NOTE: If the progress line will scroll instead of
-                # -- overwriting each other, try to add erasure of a second
-                # -- line. This is due to the commit below which restored
-                # -- empty lines.
-                # -  Commit 93fc9bc4f3bfd21568e2d66f11976831467e3b97.
-                #
-                print(CURSOR_UP + ERASE_LINE, end="", flush=True)
-                click.secho(line)
-                return
+        # -- Check if the line correspond to an output of
+        # -- the tinyprog programmer (TinyFPGA board)
+        # -- Match all the progress bar lines except the
+        # -- initial one (when it is 0%)
+        if (
+            pipe_id == PipeId.STDERR
+            and "%|" in line
+            and TINYPROG_PROGRESS.search(line)
+            and " 0%|" not in line
+        ):
+            # -- Delete the previous line.
+            #
+            # -- NOTE: If the progress line will scroll instead of
+            # -- overwriting each other, try to add erasure of a second
+            # -- line. This is due to the commit below which restored
+            # -- empty lines.
+            # -  Commit 93fc9bc4f3bfd21568e2d66f11976831467e3b97.
+            #
+            self._writer.write_raw(CURSOR_UP + ERASE_LINE)
+            self._writer.write(line)
+            return
 
         # Handling the rest of the stdout lines.
         if pipe_id == PipeId.STDOUT:
             # Default stdout line coloring.
-            line_color = self._assign_line_color(
-                line.lower(),
-                [
-                    (r"is up to date", "green"),
-                    (r"^warning:", "yellow"),
-                    (r"^error:", "red"),
-                ],
-            )
-            click.secho(f"{line}", fg=line_color)
+            self._write_line(line, STDOUT_COLORS)
             return
 
         # Handling the rest of stderr the lines.
-        line_color = self._assign_line_color(
-            line.lower(),
-            [
-                (r"^info:", "yellow"),
-                (r"^warning:", "yellow"),
-                (r"^error:", "red"),
-            ],
-        )
-        click.secho(f"{line}", fg=line_color)
+        self._write_line(line, STDERR_COLORS)
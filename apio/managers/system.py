@@ -111,7 +111,9 @@ class System:  # pragma: no cover
 
          * OUTPUT:  A list of objects with the FTDI devices
         Ex. [{'index': '0', 'manufacturer': 'AlhambraBits',
-              'description': 'Alhambra II v1.0A - B07-095'}]
+              'description': 'Alhambra II v1.0A - B07-095',
+              'serial': None}]
+        The serial number is None if lsftdi doesn't report it.
 
         It raises an exception in case of not being able to
         execute the "lsftdi" command
@@ -170,9 +172,7 @@ class System:  # pragma: no cover
 
         # -- Execute the command!
         result = util.exec_command(
-            command,
-            stdout=util.AsyncPipe(on_stdout),
-            stderr=util.AsyncPipe(on_stderr),
+            command, on_stdout=on_stdout, on_stderr=on_stderr
         )
 
         # -- Return the result of the execution
@@ -239,13 +239,20 @@ class System:  # pragma: no cover
         pattern = r".*Description:\s(?P<n>.*?)\n.*"
         description = re.findall(pattern, text)
 
+        # -- The serial numbers, reported by some versions of lsftdi, are
+        # -- searched within the lines of each device.
+        pattern = r"Checking\sdevice:.*?(?=Checking\sdevice:|\Z)"
+        device_texts = re.findall(pattern, text, re.S)
+
         ftdi_devices = []
 
         for i in range(num):
+            serial = re.search(r"Serial:\s(?P<n>[^,\n]+)", device_texts[i])
             ftdi_device = {
                 "index": index[i],
                 "manufacturer": manufacturer[i],
                 "description": description[i],
+                "serial": serial.group("n").strip() if serial else None,
             }
             ftdi_devices.append(ftdi_device)
 
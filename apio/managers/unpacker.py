@@ -10,14 +10,32 @@
 # ---- (C) 2014-2016 Ivan Kravets <me@ikravets.com>
 # ---- Licence Apache v2
 
+import os
+import hashlib
+import threading
 from os import chmod
 from pathlib import Path
 from tarfile import open as tarfile_open
-from zipfile import ZipFile
+from typing import BinaryIO, Optional, Callable, List, Dict, Tuple, Set
+from zipfile import ZipFile, ZipInfo
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import click
 from apio import util
 
 
+def _read_umask() -> int:
+    """Returns the umask of the process. It can only be read by setting it,
+    so it's read once, at import time, before apio starts any threads, and
+    it's temporarily set to the most restrictive value."""
+    umask = os.umask(0o077)
+    os.umask(umask)
+    return umask
+
+
+# -- The umask, for detecting the permissions that it masks.
+UMASK = _read_umask()
+
+
 class ArchiveBase:
     """DOC: TODO"""
 
@@ -54,6 +72,32 @@ class TARArchive(ArchiveBase):
         return self._afo.getmembers()
 
 
+class TARStreamArchive(ArchiveBase):
+    """A tar.gz archive that is read sequentially from a stream, without
+    seeking, e.g. while it's downloaded."""
+
+    def __init__(self, fileobj: BinaryIO):
+        # R1732: Consider using 'with' for resource-allocating operations
+        # (consider-using-with)
+        # pylint: disable=R1732
+        ArchiveBase.__init__(self, tarfile_open(fileobj=fileobj, mode="r|gz"))
+
+    def get_items(self):
+        """Returns an iterator over the archive members. The members are
+        read lazily, one at a time, and must be extracted in order."""
+
+        return iter(self._afo)
+
+
+def unpack_tar_stream(fileobj: BinaryIO, dest_dir: Path) -> None:
+    """Unpacks the tar.gz content of the given stream in the dest_dir
+    directory, while it's read."""
+
+    unpacker = TARStreamArchive(fileobj)
+    for item in unpacker.get_items():
+        unpacker.extract_item(item, dest_dir)
+
+
 class ZIPArchive(ArchiveBase):
     """DOC: TODO"""
 
@@ -85,20 +129,335 @@ class ZIPArchive(ArchiveBase):
         self.preserve_permissions(item, dest_dir)
 
 
+def _member_path(dest_dir: Path, name: str) -> Optional[Path]:
+    """Returns the path to which a zip member with the given name is
+    extracted, or None if the name has no path. Like ZipFile.extract(),
+    drive letters and '.' and '..' components are dropped so members are
+    always extracted within dest_dir."""
+    name = os.path.splitdrive(name.replace("\\", "/"))[1]
+    parts = [p for p in name.split("/") if p not in ("", ".", "..")]
+    return dest_dir.joinpath(*parts) if parts else None
+
+
+# R0903: Too few public methods (1/2) (too-few-public-methods)
+# pylint: disable=R0903
+class ParallelZipExtractor:
+    """Extracts a zip archive with a pool of threads. Each thread reads the
+    archive members through its own ZipFile object, so members are read
+    and decompressed independently. This is much faster than ZIPArchive
+    for archives with many small files, where the time is dominated by per
+    file system calls."""
+
+    # -- The number of members that are extracted by a single task.
+    BATCH_SIZE = 64
+
+    # -- The size of the blocks we copy.
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(
+        self,
+        archpath: Path,
+        *,
+        jobs: Optional[int] = None,
+        hardlink_duplicates: bool = False,
+    ):
+        """Initialize the extractor.
+        * INPUT:
+          - archpath: the zip file to extract.
+          - jobs: the number of threads, or None for a default.
+          - hardlink_duplicates: if True, members with identical content and
+            permissions are extracted once and hardlinked.
+        """
+        self._archpath = archpath
+        self._jobs = jobs or min(32, (os.cpu_count() or 1) + 4)
+        self._hardlink_duplicates = hardlink_duplicates
+        self._local = threading.local()
+        self._zip_files: List[ZipFile] = []
+        self._lock = threading.Lock()
+
+    def _zip_file(self) -> ZipFile:
+        """Returns the ZipFile of the current thread."""
+        zip_file = getattr(self._local, "zip_file", None)
+        if zip_file is None:
+            # R1732: Consider using 'with' for resource-allocating operations
+            # pylint: disable=R1732
+            zip_file = ZipFile(self._archpath)
+            self._local.zip_file = zip_file
+            with self._lock:
+                self._zip_files.append(zip_file)
+        return zip_file
+
+    def _write_member(
+        self, info: ZipInfo, path: Path, want_sha256: bool
+    ) -> Optional[str]:
+        """Writes the content of the given member to path, with its
+        permissions. Returns the sha256 of the content if requested."""
+
+        # -- The permissions are set when the file is created. We change
+        # -- them explicitly only if they are masked by the umask.
+        mode = (info.external_attr >> 16) & 0o7777
+        flags = (
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+        )
+        digest = hashlib.sha256() if want_sha256 else None
+        fd = os.open(path, flags, mode or 0o666)
+        try:
+            with self._zip_file().open(info) as src:
+                while block := src.read(self.BLOCK_SIZE):
+                    os.write(fd, block)
+                    if digest:
+                        digest.update(block)
+            if mode & UMASK and hasattr(os, "fchmod"):
+                os.fchmod(fd, mode)
+        finally:
+            os.close(fd)
+        if mode and not hasattr(os, "fchmod"):
+            chmod(path, mode)
+        return digest.hexdigest() if digest else None
+
+    def _extract_batch(
+        self, batch: List[Tuple[ZipInfo, Path]], hashed_paths: Set[Path]
+    ) -> Dict[Path, str]:
+        """Extracts the given members. Returns the sha256 of the content of
+        the members whose path is in hashed_paths."""
+        result = {}
+        for info, path in batch:
+            sha256 = self._write_member(info, path, path in hashed_paths)
+            if sha256:
+                result[path] = sha256
+        return result
+
+    def _extract_duplicates_batch(
+        self,
+        batch: List[Tuple[ZipInfo, Path]],
+        primaries: Dict[Path, Path],
+        hashes: Dict[Path, str],
+    ) -> None:
+        """Extracts members that have a primary member with the same CRC,
+        size and permissions. A member is hardlinked to its primary if
+        their content is identical, and written otherwise."""
+        for info, path in batch:
+            primary = primaries[path]
+            digest = hashlib.sha256()
+            with self._zip_file().open(info) as src:
+                while block := src.read(self.BLOCK_SIZE):
+                    digest.update(block)
+            if digest.hexdigest() == hashes[primary]:
+                try:
+                    os.link(primary, path)
+                    continue
+                except OSError:
+                    pass
+            self._write_member(info, path, False)
+
+    def _run_batches(
+        self,
+        pool: ThreadPoolExecutor,
+        members: List[Tuple[ZipInfo, Path]],
+        func: Callable,
+        on_progress: Callable[[int], None],
+        *args,
+    ) -> list:
+        """Runs func on batches of the given members, in the pool. Returns
+        the list of the results."""
+        futures = {}
+        for i in range(0, len(members), self.BATCH_SIZE):
+            end = i + self.BATCH_SIZE
+            futures[pool.submit(func, members[i:end], *args)] = len(
+                members[i:end]
+            )
+        results = []
+        for future in as_completed(futures):
+            results.append(future.result())
+            on_progress(futures[future])
+        return results
+
+    def _plan(
+        self, dest_dir: Path
+    ) -> Tuple[Dict[Path, int], List[Tuple[ZipInfo, Path]], int]:
+        """Returns the directories to create, with their permissions or 0
+        for default, the (member, path) of the files to extract, and the
+        number of archive members that are not files."""
+        dirs: Dict[Path, int] = {}
+        files: List[Tuple[ZipInfo, Path]] = []
+        for info in self._zip_file().infolist():
+            path = _member_path(dest_dir, info.filename)
+            if path is None or info.filename.endswith(".gitignore"):
+                continue
+            if info.is_dir():
+                dirs[path] = (info.external_attr >> 16) & 0o7777
+            else:
+                files.append((info, path))
+            # -- Add the missing parent dirs.
+            parent = path.parent
+            while parent != dest_dir and parent not in dirs:
+                dirs[parent] = 0
+                parent = parent.parent
+        non_files = len(self._zip_file().infolist()) - len(files)
+        return (dirs, files, non_files)
+
+    def _find_duplicates(
+        self, files: List[Tuple[ZipInfo, Path]]
+    ) -> Dict[Path, Path]:
+        """Returns a dict that maps the path of each duplicate candidate to
+        the path of the first member with the same CRC, size and
+        permissions, its primary. Empty if duplicates are not
+        hardlinked."""
+        if not self._hardlink_duplicates:
+            return {}
+        groups: Dict[Tuple[int, int, int], Path] = {}
+        primaries: Dict[Path, Path] = {}
+        for info, path in files:
+            if info.file_size > 0:
+                key = (info.CRC, info.file_size, info.external_attr)
+                primary = groups.setdefault(key, path)
+                if primary != path:
+                    primaries[path] = primary
+        return primaries
+
+    def extract(
+        self, dest_dir: Path, on_progress: Callable[[int], None]
+    ) -> None:
+        """Extracts the archive in dest_dir. on_progress(n) is called, from
+        the calling thread, after each n members were extracted."""
+
+        dirs, files, non_files = self._plan(dest_dir)
+
+        # -- Create all the directories, parents first, before the files
+        # -- are extracted in parallel.
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        for path in sorted(dirs, key=lambda p: len(p.parts)):
+            path.mkdir(exist_ok=True)
+        on_progress(non_files)
+
+        # -- The duplicates are extracted after the other files, including
+        # -- their primaries that we hash while they are extracted.
+        primaries = self._find_duplicates(files)
+        duplicates = [m for m in files if m[1] in primaries]
+        files = [m for m in files if m[1] not in primaries]
+
+        try:
+            with ThreadPoolExecutor(max_workers=self._jobs) as pool:
+                hashes = {}
+                for result in self._run_batches(
+                    pool,
+                    files,
+                    self._extract_batch,
+                    on_progress,
+                    set(primaries.values()),
+                ):
+                    hashes.update(result)
+                self._run_batches(
+                    pool,
+                    duplicates,
+                    self._extract_duplicates_batch,
+                    on_progress,
+                    primaries,
+                    hashes,
+                )
+        finally:
+            for zip_file in self._zip_files:
+                zip_file.close()
+
+        # -- Apply the permissions of the directories last, in case they
+        # -- are not writable.
+        for path, mode in dirs.items():
+            if mode:
+                chmod(path, mode)
+
+
+def _write_file(src: BinaryIO, path: Path, mode: int) -> None:
+    """Writes the content of src to a new file with the given permissions,
+    replacing the file at path, if any."""
+    if path.is_symlink() or path.exists():
+        path.unlink()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        while block := src.read(ParallelZipExtractor.BLOCK_SIZE):
+            f.write(block)
+    if mode:
+        chmod(path, mode)
+
+
+def extract_members(
+    archpath: Path, dest_dir: Path, prefix: str, rel_paths: Set[str]
+) -> Set[str]:
+    """Extracts only the given files and symbolic links of a tar.gz or zip
+    archive, e.g. to repair damaged files of a package. rel_paths are
+    relative to the prefix dir in the archive, or to its root if prefix is
+    ''. Returns the relative paths that were extracted."""
+
+    prefix_parts = [p for p in prefix.split("/") if p]
+    depth = len(prefix_parts)
+    extracted = set()
+
+    def rel_path_of(name: str) -> Optional[str]:
+        path = _member_path(Path(), name)
+        if path is None or list(path.parts[:depth]) != prefix_parts:
+            return None
+        rel_path = "/".join(path.parts[depth:])
+        return rel_path if rel_path in rel_paths else None
+
+    if archpath.suffix == ".zip":
+        with ZipFile(archpath) as zip_file:
+            for info in zip_file.infolist():
+                rel_path = rel_path_of(info.filename)
+                if rel_path and not info.is_dir():
+                    with zip_file.open(info) as src:
+                        _write_file(
+                            src,
+                            dest_dir / rel_path,
+                            (info.external_attr >> 16) & 0o7777,
+                        )
+                    extracted.add(rel_path)
+        return extracted
+
+    with tarfile_open(archpath) as tar:
+        for member in tar:
+            rel_path = rel_path_of(member.name)
+            if not rel_path:
+                continue
+            path = dest_dir / rel_path
+            if member.issym():
+                if path.is_symlink() or path.exists():
+                    path.unlink()
+                os.symlink(member.linkname, path)
+            elif member.isfile() or member.islnk():
+                _write_file(tar.extractfile(member), path, member.mode)
+            else:
+                continue
+            extracted.add(rel_path)
+    return extracted
+
+
 # R0903: Too few public methods (1/2) (too-few-public-methods)
 # pylint: disable=R0903
 class FileUnpacker:
     """Class for unpacking compressed files"""
 
-    def __init__(self, archpath: Path, dest_dir=Path(".")):
+    def __init__(
+        self,
+        archpath: Path,
+        dest_dir=Path("."),
+        *,
+        hardlink_duplicates: bool = False,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ):
         """Initialize the unpacker object
         * INPUT:
           - archpath: filename with path to uncompress
           - des_dir: Destination folder
+          - hardlink_duplicates: if True, identical files of zip archives
+            are extracted once and hardlinked.
+          - on_progress: Optional callback that is called with the items
+            unpacked and the number of items instead of showing a
+            progress bar.
         """
 
         self._archpath = archpath
         self._dest_dir = dest_dir
+        self._hardlink_duplicates = hardlink_duplicates
+        self._on_progress = on_progress
         self._unpacker = None
 
         # -- Get the file extension
@@ -124,13 +483,25 @@ class FileUnpacker:
         # -- Build an array with all the files inside the tarball
         items = self._unpacker.get_items()
 
+        # -- Zip files are extracted in parallel.
+        if isinstance(self._unpacker, ZIPArchive):
+            with util.progressbar(
+                length=len(items),
+                label="Unpacking..",
+                on_progress=self._on_progress,
+            ) as pbar:
+                ParallelZipExtractor(
+                    self._archpath,
+                    hardlink_duplicates=self._hardlink_duplicates,
+                ).extract(Path(self._dest_dir), pbar.update)
+            return True
+
         # -- Progress bar...
-        with click.progressbar(
+        with util.progressbar(
             items,
             length=len(items),
-            label=click.style("Unpacking..", fg="yellow"),
-            fill_char=click.style("█", fg="blue"),
-            empty_char=click.style("░", fg="blue"),
+            label="Unpacking..",
+            on_progress=self._on_progress,
         ) as pbar:
 
             # -- Go though all the files in the archive...
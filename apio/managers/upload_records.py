@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+"""The hashes of the last bitstreams that apio uploaded to the flash of each
+device, used by 'apio upload --skip-unchanged' to skip the devices that
+already hold the bitstream.
+
+The hashes are kept in the json file ~/.apio/uploads.json by the USB id of
+the device, its vid:pid and serial number, e.g. '0403:6010 FT1A2B3C',
+which identifies the board rather than where it is connected. The devices
+without a known serial number are not recorded, and a skipped upload can
+be confirmed by reading back the flash of the board (--readback).
+
+A copy of each recorded bitstream is kept in ~/.apio/uploads, named by its
+hash, for 'apio upload --incremental', which writes only the flash sectors
+that differ from it.
+"""
+
+import os
+import json
+import shutil
+import time
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+from apio import util
+
+# -- The version of the records file format.
+RECORDS_FORMAT = 2
+
+# -- Serializes the access of threads to the records file.
+_lock = threading.Lock()
+
+
+def _records_file() -> Path:
+    """Returns the path of the records file."""
+    return util.get_home_dir() / "uploads.json"
+
+
+def _bitstream_file(bitstream_hash: str) -> Path:
+    """Returns the path of the copy of a recorded bitstream."""
+    return util.get_home_dir() / "uploads" / f"{bitstream_hash}.bin"
+
+
+def _load() -> Dict[str, dict]:
+    """Returns the upload records, or an empty dict if none."""
+    try:
+        with open(_records_file(), "r", encoding="utf8") as f:
+            data = json.load(f)
+        if data.get("format") == RECORDS_FORMAT:
+            return data["devices"]
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    return {}
+
+
+def get_uploaded_hash(device_id: str) -> Optional[str]:
+    """Returns the hash of the last bitstream uploaded to the device with
+    the given USB id, or None if unknown."""
+    with _lock:
+        record = _load().get(device_id)
+    return record["hash"] if record else None
+
+
+def get_uploaded_bitstream(device_id: str) -> Optional[bytes]:
+    """Returns the last bitstream uploaded to the device with the given
+    USB id, or None if unknown."""
+    bitstream_hash = get_uploaded_hash(device_id)
+    if not bitstream_hash:
+        return None
+    try:
+        return _bitstream_file(bitstream_hash).read_bytes()
+    except OSError:
+        return None
+
+
+def set_uploaded_bitstream(
+    device_id: str, bitstream_file: str, bitstream_hash: str
+) -> None:
+    """Records the bitstream that was uploaded to the device with the given
+    USB id, with the given hash, and keeps a copy of it, ignoring errors.
+    The copies of bitstreams that are no longer recorded are deleted."""
+    with _lock:
+        records = _load()
+        records[device_id] = {"hash": bitstream_hash, "time": time.time()}
+        records_file = _records_file()
+        tmp_file = records_file.with_name(
+            f"{records_file.name}.{os.getpid()}.tmp"
+        )
+        try:
+            copy_file = _bitstream_file(bitstream_hash)
+            copy_file.parent.mkdir(exist_ok=True)
+            shutil.copyfile(bitstream_file, copy_file)
+            with open(tmp_file, "w", encoding="utf8") as f:
+                json.dump({"format": RECORDS_FORMAT, "devices": records}, f)
+            os.replace(tmp_file, records_file)
+            hashes = {record["hash"] for record in records.values()}
+            for path in copy_file.parent.glob("*.bin"):
+                if path.stem not in hashes:
+                    path.unlink()
+        except OSError:
+            pass
@@ -15,7 +15,6 @@ from dataclasses import dataclass
 import os
 import sys
 import click
-import semantic_version
 from apio.resources import Resources
 from apio import util
 
@@ -226,6 +225,9 @@ def _version_matches(current_version: str, spec_version: str) -> bool:
       - False: Version not ok! or incorrect version number
     """
 
+    # pylint: disable=import-outside-toplevel
+    import semantic_version
+
     # -- Build a semantic version object
     spec = semantic_version.SimpleSpec(spec_version)
 
@@ -329,8 +331,12 @@ def scan_packages(resources: Resources) -> PackageScanResults:
             result.orphan_package_ids.append(package_id)
 
     # -- Scan the packages directory and identify orphan dirs and files.
+    # -- Hidden dirs and files, such as the staging and rollback dirs of the
+    # -- installer, are ignored.
     for path in util.get_packages_dir().glob("*"):
         base_name = os.path.basename(path)
+        if base_name.startswith("."):
+            continue
         if path.is_dir():
             if base_name not in platform_folder_names:
                 result.orphan_dir_names.append(base_name)
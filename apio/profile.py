@@ -8,7 +8,6 @@
 import json
 from pathlib import Path
 import click
-import semantic_version
 from apio import util
 
 
@@ -51,6 +50,9 @@ class Profile:
             # -- Get the current version
             pkg_version = self.get_package_installed_version(name)
 
+            # pylint: disable=import-outside-toplevel
+            import semantic_version
+
             # -- Compare versions: current vs version to install
             current_ver = semantic_version.Version(pkg_version)
             to_install_ver = semantic_version.Version(version)
@@ -6,15 +6,19 @@
 # -- Author Jesús Arroyo
 # -- Licence GPLv2
 
+import os
 import sys
 import json
+import marshal
+import hashlib
 import platform
 from collections import OrderedDict
+from functools import cached_property
 import shutil
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, Callable, List
 import click
-from apio import util, env_options
+from apio import util, env_options, __version__
 from apio.profile import Profile
 
 
@@ -73,6 +77,10 @@ PROGRAMMERS_JSON = "programmers.json"
 # -- Information about all the supported apio and pip packages
 DISTRIBUTION_JSON = "distribution.json"
 
+# -- The processed resources are saved as marshal snapshots in the apio home
+# -- dir. Increment when changing the snapshots format or content.
+SNAPSHOT_FORMAT = 1
+
 
 # pylint: disable=too-many-instance-attributes
 class Resources:
@@ -83,6 +91,7 @@ class Resources:
         *,
         project_scope: bool,
         project_dir: Optional[Path] = None,
+        notices_to_stderr: bool = False,
     ):
         """Initializes the Resources object. 'project dir' is an optional path
         to the project dir, otherwise, the current directory is used.
@@ -90,7 +99,9 @@ class Resources:
         boards.json should be loaded, if available' or that the global
         default resources should be used instead.  Some commands such as
         'apio packages' uses the global scope while commands such as
-        'apio build' use the project scope.
+        'apio build' use the project scope. 'notices_to_stderr' indicates
+        if to print the notices to stderr, for commands whose stdout is
+        parsed, e.g. json.
         """
 
         # -- Inform as soon as possible about the list of apio env options
@@ -98,64 +109,106 @@ class Resources:
         defined_env_options = env_options.get_defined()
         if defined_env_options:
             click.secho(
-                f"Active env options {defined_env_options}.", fg="yellow"
+                f"Active env options {defined_env_options}.",
+                fg="yellow",
+                err=notices_to_stderr,
             )
 
         # -- Maps the optional project_dir option to a path.
         self.project_dir: Path = util.get_project_dir(project_dir)
 
-        # -- Profile information, from ~/.apio/profile.json
-        self.profile = Profile()
-
-        # -- Read the platforms information.
-        self.platforms = self._load_resource(PLATFORMS_JSON)
-
-        # -- Determine the platform_id for this APIO session.
-        self.platform_id = self._determine_platform_id(self.platforms)
-
-        # -- Read the apio packages information
-        self.all_packages = self._load_resource(PACKAGES_JSON)
-
-        # -- Expand in place the env templates in all_packages.
-        Resources._resolve_package_envs(self.all_packages)
+        # -- Indicates if project specific resource files are allowed.
+        self._project_scope = project_scope
+
+        # -- The resources are loaded lazily on first access, so a command
+        # -- pays only for the resources it uses. See the properties below.
+
+    @cached_property
+    def profile(self) -> Profile:
+        """Profile information, from ~/.apio/profile.json"""
+        return Profile()
+
+    @cached_property
+    def platforms(self) -> Dict[str, Dict]:
+        """The platforms information."""
+        return self._load_resource(PLATFORMS_JSON)
+
+    @cached_property
+    def platform_id(self) -> str:
+        """The platform_id for this APIO session."""
+        return self._determine_platform_id(self.platforms)
+
+    @cached_property
+    def all_packages(self) -> Dict[str, Dict]:
+        """The apio packages information, with the env templates expanded.
+        Since the expanded values depend on the packages dir, it's part of
+        the snapshot's stamp."""
+        return self._load_resource(
+            PACKAGES_JSON,
+            transform=Resources._resolve_package_envs,
+            stamp_extra=str(util.get_packages_dir()),
+        )
 
-        # The subset of packages that are applicable to this platform.
-        self.platform_packages = self._select_packages_for_platform(
+    @cached_property
+    def platform_packages(self) -> Dict[str, Dict]:
+        """The subset of packages that are applicable to this platform."""
+        return self._select_packages_for_platform(
             self.all_packages, self.platform_id, self.platforms
         )
 
-        # -- Read the boards information
-        self.boards = self._load_resource(
-            BOARDS_JSON, allow_custom=project_scope
+    # -- Sort resources for consistency and intunitiveness.
+    # --
+    # -- We don't sort the all_packages and platform_packages dictionaries
+    # -- because that will affect the order of the env path items.
+    # -- Instead we preserve the order from the packages.json file.
+
+    @cached_property
+    def boards(self) -> Dict[str, Dict]:
+        """The boards information, sorted by board name."""
+        return OrderedDict(
+            self._load_resource(
+                BOARDS_JSON,
+                allow_custom=self._project_scope,
+                transform=Resources._sort_by_key,
+            )
         )
 
-        # -- Read the FPGAs information
-        self.fpgas = self._load_resource(
-            FPGAS_JSON, allow_custom=project_scope
+    @cached_property
+    def fpgas(self) -> Dict[str, Dict]:
+        """The FPGAs information, sorted by fpga name."""
+        return OrderedDict(
+            self._load_resource(
+                FPGAS_JSON,
+                allow_custom=self._project_scope,
+                transform=Resources._sort_by_key,
+            )
         )
 
-        # -- Read the programmers information
-        self.programmers = self._load_resource(
-            PROGRAMMERS_JSON, allow_custom=project_scope
+    @cached_property
+    def programmers(self) -> Dict[str, Dict]:
+        """The programmers information."""
+        return self._load_resource(
+            PROGRAMMERS_JSON, allow_custom=self._project_scope
         )
 
-        # -- Read the distribution information
-        self.distribution = self._load_resource(DISTRIBUTION_JSON)
-
-        # -- Sort resources for consistency and intunitiveness.
-        # --
-        # -- We don't sort the all_packages and platform_packages dictionaries
-        # -- because that will affect the order of the env path items.
-        # -- Instead we preserve the order from the packages.json file.
+    @cached_property
+    def distribution(self) -> Dict[str, Dict]:
+        """The distribution information."""
+        return self._load_resource(DISTRIBUTION_JSON)
 
-        self.boards = OrderedDict(
-            sorted(self.boards.items(), key=lambda t: t[0])
-        )
-        self.fpgas = OrderedDict(
-            sorted(self.fpgas.items(), key=lambda t: t[0])
-        )
+    @staticmethod
+    def _sort_by_key(resource: dict) -> dict:
+        """Returns a copy of the given dict, sorted by key."""
+        return dict(sorted(resource.items(), key=lambda t: t[0]))
 
-    def _load_resource(self, name: str, allow_custom: bool = False) -> dict:
+    def _load_resource(
+        self,
+        name: str,
+        *,
+        allow_custom: bool = False,
+        transform: Optional[Callable[[dict], dict]] = None,
+        stamp_extra: str = "",
+    ) -> dict:
         """Load the resources from a given json file
         * INPUTS:
           * Name: Name of the json file
@@ -167,20 +220,104 @@ class Resources:
               * DISTRIBUTION_JSON
             * Allow_custom: if true, look first in the project dir for
               a project specific resource file of same name.
+            * transform: optional function that post processes the
+              loaded data.
+            * stamp_extra: optional string with additional values the
+              transformed data depends on.
         * OUTPUT: A dictionary with the json file data
           In case of error it raises an exception and finish
         """
         # -- Try loading a custom resource file from the project directory.
         filepath = self.project_dir / name
 
-        if filepath.exists():
-            if allow_custom:
-                click.secho(f"Loading project's custom '{name}' file.")
-                return self._load_resource_file(filepath)
+        if filepath.exists() and allow_custom:
+            click.secho(f"Loading project's custom '{name}' file.")
+        else:
+            # -- Load the stock resource file from the APIO package.
+            filepath = util.get_path_in_apio_package(RESOURCES_DIR) / name
+
+        # -- Use the snapshot of the resource if it's up to date.
+        stamp = Resources._snapshot_stamp(filepath, stamp_extra)
+        snapshot_path = Resources._snapshot_path(filepath)
+        resource = Resources._read_snapshot(snapshot_path, stamp)
+        if resource is not None:
+            return resource
+
+        # -- Load and process the json file and update the snapshot.
+        resource = self._load_resource_file(filepath)
+        if transform:
+            resource = transform(resource)
+        Resources._write_snapshot(snapshot_path, stamp, resource)
+        return resource
+
+    @staticmethod
+    def _snapshot_path(filepath: Path) -> Path:
+        """Returns the path of the snapshot file of the given resource file.
+        Project custom files have their own snapshots, since the name
+        includes a hash of the resource file path."""
+        path_hash = hashlib.sha1(str(filepath.absolute()).encode()).hexdigest()
+        return (
+            util.get_home_dir()
+            / "cache"
+            / "resources"
+            / f"{filepath.stem}-{path_hash[:12]}.marshal"
+        )
 
-        # -- Load the stock resource file from the APIO package.
-        filepath = util.get_path_in_apio_package(RESOURCES_DIR) / name
-        return self._load_resource_file(filepath)
+    @staticmethod
+    def _snapshot_stamp(filepath: Path, stamp_extra: str) -> Optional[list]:
+        """Returns the values that a snapshot of the given resource file
+        depends on. A snapshot is valid only if its stamp is identical.
+        Returns None if the file is not available."""
+        try:
+            stat = filepath.stat()
+        except OSError:
+            # -- Reported later, when loading the json file.
+            return None
+        return [
+            SNAPSHOT_FORMAT,
+            __version__,
+            sys.version,
+            str(filepath.absolute()),
+            stat.st_mtime_ns,
+            stat.st_size,
+            stamp_extra,
+        ]
+
+    @staticmethod
+    def _read_snapshot(
+        snapshot_path: Path, stamp: Optional[list]
+    ) -> Optional[dict]:
+        """Returns the data of the given snapshot file, or None if the
+        snapshot doesn't exist, is invalid or has a different stamp."""
+        if stamp is None:
+            return None
+        try:
+            with snapshot_path.open("rb") as f:
+                snapshot = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get("stamp") != stamp:
+            return None
+        return snapshot["data"]
+
+    @staticmethod
+    def _write_snapshot(
+        snapshot_path: Path, stamp: Optional[list], data: dict
+    ) -> None:
+        """Writes the given resource data in a snapshot file. Failures are
+        ignored since the snapshots are only an optimization."""
+        if stamp is None:
+            return
+        try:
+            snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = snapshot_path.with_name(
+                f"{snapshot_path.name}.{os.getpid()}.tmp"
+            )
+            with tmp_path.open("wb") as f:
+                marshal.dump({"stamp": stamp, "data": data}, f)
+            os.replace(tmp_path, snapshot_path)
+        except (OSError, ValueError):
+            pass
 
     @staticmethod
     def _load_resource_file(filepath: Path) -> dict:
@@ -271,10 +408,10 @@ class Resources:
         raise RuntimeError(f"Invalid env template: [{template}]")
 
     @staticmethod
-    def _resolve_package_envs(packages: Dict[str, Dict]) -> None:
+    def _resolve_package_envs(packages: Dict[str, Dict]) -> Dict[str, Dict]:
         """Resolve in place the path and var value templates in the
         given packages dictionary. For example, %p is replaced with
-        the package's absolute path."""
+        the package's absolute path. Returns the packages dictionary."""
 
         packages_dir = util.get_packages_dir()
         for _, package_config in packages.items():
@@ -303,6 +440,8 @@ class Resources:
                     val_template, package_path
                 )
 
+        return packages
+
     def get_package_info(self, package_name: str) -> str:
         """Returns the information of the package with given name.
         The information is a JSON dict originated at packages.jsnon().
@@ -454,9 +593,9 @@ class Resources:
 
     # R0914: Too many local variables (17/15)
     # pylint: disable=R0914
-    def list_boards(self):
-        """Print all the supported boards and the information of
-        their FPGAs
+    def list_boards(self, board_names: Optional[List[str]] = None):
+        """Print the given boards, or all the supported boards if None, and
+        the information of their FPGAs
         """
         # Get terminal configuration. It will help us to adapt the format
         # to a terminal vs a pipe.
@@ -480,11 +619,12 @@ class Resources:
             click.secho(seperator_line)
 
         # -- Sort boards names by case insentive alphabetical order.
-        board_names = list(self.boards.keys())
-        board_names.sort(key=lambda x: x.lower())
+        if board_names is None:
+            board_names = list(self.boards.keys())
+        board_names = sorted(board_names, key=lambda x: x.lower())
 
         # -- For a pipe, determine the max example name length.
-        max_board_name_len = max(len(x) for x in board_names)
+        max_board_name_len = max((len(x) for x in board_names), default=0)
 
         # -- Print all the boards!
         for board in board_names:
@@ -531,13 +671,13 @@ class Resources:
         if config.terminal_mode():
             # -- Print the Footer
             click.secho(seperator_line)
-            click.secho(f"Total: {len(self.boards)} boards")
+            click.secho(f"Total: {len(board_names)} boards")
 
             # -- Help message
             click.secho(BOARDS_MSG, fg="green")
 
-    def list_fpgas(self):
-        """Print all the supported FPGAs"""
+    def list_fpgas(self, fpga_names: Optional[List[str]] = None):
+        """Print the given FPGAs, or all the supported FPGAs if None"""
 
         # Get terminal configuration. It will help us to adapt the format
         # to a terminal vs a pipe.
@@ -560,7 +700,9 @@ class Resources:
             click.secho(seperator_line)
 
         # -- Print all the fpgas!
-        for fpga in self.fpgas:
+        if fpga_names is None:
+            fpga_names = list(self.fpgas.keys())
+        for fpga in fpga_names:
 
             # -- Get information about the FPGA
             arch = self.fpgas[fpga]["arch"]
@@ -582,7 +724,7 @@ class Resources:
         # -- Print the Footer
         if config.terminal_mode():
             click.secho(seperator_line)
-            click.secho(f"Total: {len(self.fpgas)} fpgas\n")
+            click.secho(f"Total: {len(fpga_names)} fpgas\n")
 
     @staticmethod
     def _determine_platform_id(platforms: Dict[str, Dict]) -> str:
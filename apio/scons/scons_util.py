@@ -19,19 +19,31 @@ be called only from the SConstruct.py files.
 
 import os
 import re
+import atexit
+import time
+import subprocess
+import tempfile
+import threading
 from enum import Enum
 import json
-from typing import Dict, Tuple, List, Optional
-from dataclasses import dataclass
+from typing import Dict, Tuple, List, Optional, Callable
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
 import click
 from SCons import Scanner
 from SCons.Node import NodeList
 from SCons.Node.FS import File
 from SCons.Node.Alias import Alias
-from SCons.Script import DefaultEnvironment
+from SCons.Script import DefaultEnvironment, AlwaysBuild
 from SCons.Script.SConscript import SConsEnvironment
 from SCons.Action import FunctionAction, Action
 from SCons.Builder import Builder
+from SCons.CacheDir import CacheDir, CacheRetrieveSilent
+from apio.util import PROJECT_STATE_DIR
+from apio.managers.build_stats import make_timed_spawn, record_action
+from apio.managers.scons_filter import UPLOAD_PROGRESS, PERCENT
+from apio.managers.package_manifest import file_hash
+from apio.managers import upload_records, flash_diff
 
 
 # -- Target name. This is the base file name for various build artifacts.
@@ -39,6 +51,9 @@ TARGET = "hardware"
 
 SUPPORTED_GRAPH_TYPES = ["svg", "pdf", "png"]
 
+# -- The file extensions that the verilog scanner scans for includes.
+VERILOG_SCANNED_EXTS = (".v", ".vh", ".sv", ".svh")
+
 
 class SConstructId(Enum):
     """Identifies the SConstruct script that is running. Used to select
@@ -124,6 +139,10 @@ def create_construction_env(args: Dict[str, str]) -> SConsEnvironment:
     assert env.get("IS_WINDOWS") is None
     env.Replace(IS_WINDOWS=flag)  # Tentative.
 
+    # -- Measure the time and resources of the action commands, for
+    # -- 'apio build --profile' and 'apio report --history'.
+    env.Replace(SPAWN=make_timed_spawn(env["SPAWN"]))
+
     # For debugging.
     # dump_env_vars(env)
 
@@ -172,6 +191,23 @@ def arg_str(env: SConsEnvironment, name: str, default: str) -> str:
     return value
 
 
+def arg_int(env: SConsEnvironment, name: str, default: int) -> int:
+    """Parse and return an integer arg."""
+    args = get_args(env)
+    raw_value = args.get(name, None)
+    if raw_value is None:
+        value = default
+    else:
+        try:
+            value = int(raw_value)
+        except ValueError:
+            fatal_error(
+                env, f"Invalid integer argument '{name} = '{raw_value}'."
+            )
+    __dump_parsed_arg(env, name, value, from_default=raw_value is None)
+    return value
+
+
 def force_colors(env: SConsEnvironment) -> bool:
     """Test if click.secho should be forced, even if piped.
 
@@ -282,32 +318,100 @@ def get_verilator_warning_params(env: SConsEnvironment) -> str:
     return result
 
 
-def get_programmer_cmd(env: SConsEnvironment) -> str:
-    """Return the programmer command as derived from the scons "prog" arg."""
-
-    # Get the programer command template arg.
-    prog_arg = arg_str(env, "prog", "")
+def _get_device_cmds_arg(env: SConsEnvironment, name: str) -> Dict[str, str]:
+    """Return the programmer commands, by device name, of the given json
+    scons arg, or an empty dict if not given."""
 
-    # If empty then return as is. This must be an apio command that doesn't use
-    # the programmer.
-    if not prog_arg:
-        return prog_arg
+    arg = arg_str(env, name, "")
+    if not arg:
+        return {}
 
-    # It's an error if the programmer command doesn't have the $SOURCE
+    # It's an error if a programmer command doesn't have the $SOURCE
     # placeholder when scons inserts the binary file name.
-    if "$SOURCE" not in prog_arg:
-        fatal_error(
-            env,
-            "[Internal] 'prog' argument does not contain "
-            f"the '$SOURCE' marker. [{prog_arg}]",
-        )
+    device_cmds = json.loads(arg)
+    for cmd in device_cmds.values():
+        if "$SOURCE" not in cmd:
+            fatal_error(
+                env,
+                f"[Internal] '{name}' argument does not contain "
+                f"the '$SOURCE' marker. [{cmd}]",
+            )
+
+    return device_cmds
+
+
+@dataclass(frozen=True)
+class UploadConfig:
+    """The configuration of the upload target, see make_upload_action().
+    The commands are by device name and refer to the bitstream file as
+    $SOURCE."""
+
+    # -- The programmer commands of the devices to upload to.
+    device_cmds: Dict[str, str]
+    # -- The commands that compare the flash with the bitstream.
+    check_cmds: Dict[str, str]
+    # -- The programmer commands that write at the flash offset ${OFFSET}.
+    partial_cmds: Dict[str, str]
+    # -- Skip the devices that already have the bitstream.
+    skip_unchanged: bool
+    # -- Confirm skip_unchanged with the check commands.
+    readback: bool
+    # -- Record the bitstream uploaded to each device.
+    record: bool
+    # -- The USB ids of the devices with a known USB serial number, which
+    # -- key their upload records. Ex. {'ftdi 0': '0403:6010 FT1A2B3C'}
+    device_ids: Dict[str, str]
+
+
+def get_upload_config(env: SConsEnvironment) -> UploadConfig:
+    """Return the configuration of the upload target, as derived from the
+    scons "progs", "prog_checks", "prog_partials", "skip_unchanged",
+    "readback", "record_upload" and "prog_ids" args. The device_cmds are
+    empty if this is an apio command that doesn't use the programmer."""
+    return UploadConfig(
+        device_cmds=_get_device_cmds_arg(env, "progs"),
+        check_cmds=_get_device_cmds_arg(env, "prog_checks"),
+        partial_cmds=_get_device_cmds_arg(env, "prog_partials"),
+        device_ids=json.loads(arg_str(env, "prog_ids", "") or "{}"),
+        skip_unchanged=arg_bool(env, "skip_unchanged", False),
+        readback=arg_bool(env, "readback", False),
+        record=arg_bool(env, "record_upload", False),
+    )
+
 
-    return prog_arg
+def _load_scanner_index(index_file: str) -> Dict[str, list]:
+    """Loads the verilog scanner index file. Returns an empty index if the
+    file doesn't exist or is not valid."""
+    try:
+        with open(index_file, "r", encoding="utf8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != 1:
+        return {}
+    return data["files"]
+
+
+def _save_scanner_index(index_file: str, index: Dict[str, list]) -> None:
+    """Saves the verilog scanner index file, dropping the entries of files
+    that no longer exist."""
+    files = {
+        path: entry for path, entry in index.items() if os.path.isfile(path)
+    }
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+    tmp_file = index_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf8") as f:
+        json.dump({"version": 1, "files": files}, f)
+    os.replace(tmp_file, index_file)
 
 
 def make_verilog_src_scanner(env: SConsEnvironment) -> Scanner:
     """Creates and returns a scons Scanner object for scanning verilog
-    files for dependencies.
+    files for dependencies. The includes of each file are cached in an
+    index file in the project's .apio dir, keyed by the file's path, mtime
+    and size, so only new or modified files are read. The scanner is
+    recursive, so includes of included files, such as .vh headers, are
+    also tracked.
     """
     # A Regex to icestudio propriaetry references for *.list files.
     # Example:
@@ -323,6 +427,19 @@ def make_verilog_src_scanner(env: SConsEnvironment) -> Scanner:
         r'`\s*include\s+["]([a-zA-Z_./]+)["]', re.M
     )
 
+    # -- The index of scanned files. Maps a file path to a list
+    # -- [mtime_ns, size, includes].
+    index_file = os.path.join(PROJECT_STATE_DIR, "scanner-index.json")
+    index = _load_scanner_index(index_file)
+    index_changed = False
+
+    def save_index() -> None:
+        """Called on exit. Saves the index if it was changed."""
+        if index_changed:
+            _save_scanner_index(index_file, index)
+
+    atexit.register(save_index)
+
     def verilog_src_scanner_func(
         file_node: File, env: SConsEnvironment, ignored_path
     ) -> List[str]:
@@ -333,10 +450,25 @@ def make_verilog_src_scanner(env: SConsEnvironment) -> Scanner:
 
         Returns a list of files.
         """
-        # Sanity check. Should be called only to scan verilog files.
-        assert file_node.name.lower().endswith(
-            ".v"
-        ), f"Not a .v file: {file_node.name}"
+        nonlocal index_changed
+
+        # Only verilog sources and headers can have includes. Other files,
+        # such as icestudio .list files, or missing files have none.
+        _, ext = os.path.splitext(file_node.name.lower())
+        if ext not in VERILOG_SCANNED_EXTS:
+            return []
+        path = str(file_node)
+        try:
+            stat = os.stat(file_node.get_abspath())
+        except OSError:
+            return []
+
+        # Use the cached includes if the file didn't change.
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        entry = index.get(path)
+        if entry and entry[:2] == stamp:
+            return env.File(entry[2])
+
         includes_set = set()
         file_text = file_node.get_text_contents()
         # Get IceStudio includes.
@@ -349,9 +481,11 @@ def make_verilog_src_scanner(env: SConsEnvironment) -> Scanner:
         includes_list = sorted(list(includes_set))
         # For debugging
         # info(env, f"*** {file_node.name} includes {includes_list}")
+        index[path] = stamp + [includes_list]
+        index_changed = True
         return env.File(includes_list)
 
-    return env.Scanner(function=verilog_src_scanner_func)
+    return env.Scanner(function=verilog_src_scanner_func, recursive=True)
 
 
 def make_verilator_config_builder(env: SConsEnvironment, config_text: str):
@@ -500,7 +634,7 @@ def get_tests_configs(
     source and test file lists as returned by get_source_files()."""
     # List of testbenches to be tested.
     if testbench:
-        testbenches = testbench
+        testbenches = [testbench]
     else:
         testbenches = test_srcs
 
@@ -518,6 +652,136 @@ def get_tests_configs(
     return configs
 
 
+@dataclass(frozen=True)
+class TestbenchResult:
+    """The result of a single testbench run of an 'apio test' command."""
+
+    name: str  # Testbench name, e.g. "main_tb".
+    passed: bool  # True if compiled and simulated with no errors.
+    duration: float  # Compilation and simulation time, in seconds.
+
+
+# -- Serializes the output of the testbenches, which can run in parallel.
+_test_output_lock = threading.Lock()
+
+
+def _run_commands(
+    env: SConsEnvironment, commands: List[str]
+) -> Tuple[bool, List[str]]:
+    """Runs the given shell commands, stopping at the first failure.
+    Returns a passed flag and the output lines, each command line followed
+    by its stdout and stderr output. The output is captured, so they are
+    not run by the scons SPAWN function, and their statistics are
+    recorded here instead."""
+    lines = []
+    for command in commands:
+        lines.append(command)
+        start = time.time()
+        result = subprocess.run(
+            command,
+            shell=True,
+            env=env["ENV"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            encoding="utf-8",
+            errors="replace",
+            check=False,
+        )
+        lines.extend(result.stdout.splitlines())
+        tool = command.split()[0].strip('"') if command.split() else ""
+        record_action(tool, start, result.returncode)
+        if result.returncode != 0:
+            return False, lines
+    return True, lines
+
+
+def make_tests_target(
+    env: SConsEnvironment,
+    configs: List[SimulationConfig],
+    iverilog_generator: Callable,
+    vvp_action: str,
+) -> Alias:
+    """Construct the targets of the 'apio test' command and return the
+    'test' alias target. Each testbench is compiled and simulated by a
+    single python action, so scons can run the testbenches in parallel
+    (scons -j) while the output of each one stays grouped. Once all the
+    testbenches were run, the 'test' alias prints a summary table and fails
+    if any of them failed. 'iverilog_generator' is the action generator of
+    the IVerilogTestbench builder and 'vvp_action' is the action string
+    of the VCD builder.
+    """
+
+    # -- The results of the testbenches run so far.
+    results: List[TestbenchResult] = []
+
+    def run_testbench(
+        source: List[File], target: List[File], env: SConsEnvironment
+    ) -> int:
+        """Action function. Compiles and simulates a single testbench,
+        target is [testbench.out, testbench.vcd]."""
+        out_file, vcd_file = target
+        iverilog_cmd = env.subst(
+            iverilog_generator(source, [out_file], env, False),
+            target=[out_file],
+            source=source,
+        )
+        vvp_cmd = env.subst(vvp_action, target=[vcd_file], source=[out_file])
+
+        start_time = time.time()
+        passed, lines = _run_commands(env, [iverilog_cmd, vvp_cmd])
+        result = TestbenchResult(
+            basename(env, out_file.name), passed, time.time() - start_time
+        )
+
+        with _test_output_lock:
+            for line in lines:
+                msg(env, line)
+            results.append(result)
+
+        # -- Always succeed, so the remaining testbenches are run. The
+        # -- failures are reported by the 'test' alias.
+        return 0
+
+    def report_results(
+        source: List[File], target: List[Alias], env: SConsEnvironment
+    ) -> int:
+        """Action function. Prints the summary of the testbenches run."""
+        msg(env, "")
+        msg(env, "TESTS:", fg="cyan")
+        for result in sorted(results, key=lambda r: r.name):
+            status = (
+                click.style("PASSED", fg="green")
+                if result.passed
+                else click.style("FAILED", fg="red")
+            )
+            msg(env, f"{result.name:>20}: {status} {result.duration:7.2f} sec")
+        failures = sum(not result.passed for result in results)
+        total = len(results)
+        # -- With the build server, the same graph is used for the next run.
+        results.clear()
+        msg(env, "")
+        if failures:
+            error(env, f"{failures} of {total} testbenches failed.")
+            return 1
+        return 0
+
+    tests_targets = []
+    for config in configs:
+        test_target = env.Command(
+            [config.top_module + ".out", config.top_module + ".vcd"],
+            config.srcs,
+            Action(run_testbench, None),
+        )
+        AlwaysBuild(test_target)
+        tests_targets.append(test_target)
+
+    tests_target = env.Alias(
+        "test", tests_targets, Action(report_results, None)
+    )
+    AlwaysBuild(tests_target)
+    return tests_target
+
+
 def make_waves_target(
     env: SConsEnvironment,
     vcd_file_target: NodeList,
@@ -774,3 +1038,451 @@ def set_up_cleanup(env: SConsEnvironment, targets) -> None:
 
     # -- Tell SCons to cleanup the given targets and all of their dependencies.
     env.Default(targets)
+
+
+@dataclass(frozen=True)
+class PnrSeedResult:
+    """The result of a single placement of a multi seed pnr."""
+
+    seed: int  # The nextpnr --seed value.
+    files: List[str]  # The output files, in the same order as the targets.
+    passed: bool  # True if nextpnr succeeded.
+    margin: Optional[float]  # Worst fmax margin in Mhz, None if unknown.
+    lines: List[str]  # The command line and its output.
+
+
+def get_pnr_fmax_margin(report_file: str) -> Optional[float]:
+    """Returns the worst case fmax margin, in Mhz, from a nextpnr json
+    report. That is, the min over the clocks of the achieved fmax minus the
+    constraint. Returns None if the report has no clock constraints, or
+    if it is missing or invalid."""
+    try:
+        with open(report_file, "r", encoding="utf8") as f:
+            report: Dict[str, any] = json.load(f)
+        margins = [
+            vals["achieved"] - vals["constraint"]
+            for vals in report.get("fmax", {}).values()
+            if "constraint" in vals
+        ]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    return min(margins) if margins else None
+
+
+def make_pnr_action(env: SConsEnvironment, pnr_cmd: str, seeds: int):
+    """Returns the action of the pnr builder. 'pnr_cmd' is the nextpnr
+    command string which should refer to its output files as $TARGETS.
+    If 'seeds' is more than one, returns instead an action that runs
+    that many placements with different seeds in parallel, each in its own
+    scratch dir, and keeps the one with the best worst case fmax margin.
+    """
+    if seeds <= 1:
+        return pnr_cmd
+
+    def multi_seed_pnr(
+        source: List[File], target: List[File], env: SConsEnvironment
+    ) -> int:
+        """Action function. Runs the placements and promotes the best."""
+        # -- Construct the commands in this thread since creating scons
+        # -- nodes is not thread safe.
+        runs = []
+        for seed in range(1, seeds + 1):
+            seed_dir = os.path.join(PROJECT_STATE_DIR, "seeds", str(seed))
+            os.makedirs(seed_dir, exist_ok=True)
+            seed_targets = [
+                env.File(os.path.join(seed_dir, t.name)) for t in target
+            ]
+            cmd = env.subst(pnr_cmd, target=seed_targets, source=source)
+            runs.append((seed, [str(t) for t in seed_targets], cmd))
+
+        def run_seed(seed: int, files: List[str], cmd: str) -> PnrSeedResult:
+            passed, lines = _run_commands(env, [f"{cmd} --seed {seed}"])
+            margin = get_pnr_fmax_margin(files[1]) if passed else None
+            return PnrSeedResult(seed, files, passed, margin, lines)
+
+        max_workers = min(seeds, os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda run: run_seed(*run), runs))
+
+        # -- Select the best placement. Ties go to the lower seed.
+        passed = [r for r in results if r.passed]
+        if not passed:
+            for line in results[0].lines:
+                msg(env, line)
+            error(env, f"All the {seeds} placements failed.")
+            return 1
+        best = max(
+            passed,
+            key=lambda r: (r.margin is not None, r.margin or 0, -r.seed),
+        )
+
+        # -- Show the output of the selected placement and a summary.
+        for line in best.lines:
+            msg(env, line)
+        msg(env, "")
+        msg(env, "PLACEMENTS:", fg="cyan")
+        for result in results:
+            if not result.passed:
+                status = click.style("FAILED", fg="red")
+            elif result.margin is None:
+                status = "no timing constraints"
+            else:
+                status = f"{result.margin:+8.2f} Mhz worst fmax margin"
+            selected = "  <- selected" if result is best else ""
+            msg(env, f"{'seed ' + str(result.seed):>20}: {status}{selected}")
+        msg(env, "")
+
+        # -- Promote the output files of the selected placement.
+        for src, dst in zip(best.files, target):
+            os.replace(src, str(dst))
+        return 0
+
+    return Action(multi_seed_pnr, f"Running {seeds} placements in parallel.")
+
+
+@dataclass
+class DeviceUpload:
+    """The state of the upload to a single device of a multi device
+    upload."""
+
+    device: str  # The device name, e.g. "ftdi 0".
+    status: str = "waiting"  # The progress shown to the user, e.g. "45%".
+    duration: float = 0  # Upload time, in seconds.
+    lines: List[str] = field(default_factory=list)  # The programmer output.
+
+
+@dataclass(frozen=True)
+class DeviceCommands:
+    """The commands of an upload to a device, with the bitstream file name
+    substituted, see UploadConfig."""
+
+    cmd: str
+    check_cmd: Optional[str]
+    # -- With the ${OFFSET} and ${CHUNK} placeholders for the flash offset
+    # -- and the file to write.
+    partial_cmd: Optional[str]
+
+
+def _upload_changed_sectors(
+    device_cmds: DeviceCommands,
+    bitstream_file: str,
+    previous: bytes,
+    run: Callable[[str], bool],
+) -> bool:
+    """Writes the sectors of the bitstream that differ from the previous
+    one, which is in the flash, and verifies the flash. Returns True if
+    ok."""
+    with open(bitstream_file, "rb") as f:
+        bitstream = f.read()
+    for offset, length in flash_diff.changed_ranges(previous, bitstream):
+        fd, chunk_file = tempfile.mkstemp(".bin", "upload-", PROJECT_STATE_DIR)
+        try:
+            end = offset + length
+            with os.fdopen(fd, "wb") as f:
+                f.write(bitstream[offset:end])
+            cmd = device_cmds.partial_cmd.replace("${OFFSET}", str(offset))
+            if not run(cmd.replace("${CHUNK}", chunk_file)):
+                return False
+        finally:
+            os.unlink(chunk_file)
+    return run(device_cmds.check_cmd)
+
+
+def _upload_to_device(
+    config: UploadConfig,
+    device: str,
+    device_cmds: DeviceCommands,
+    bitstream_file: str,
+    run: Callable[[str], bool],
+) -> str:
+    """Uploads the bitstream to a device, running the commands with the
+    given function, and returns the status: 'unchanged', 'incremental',
+    'done' or 'FAILED'."""
+
+    # -- The records are kept by the USB id of the device, if known.
+    # -- Without a record, only a readback can tell that the flash already
+    # -- has the bitstream.
+    device_id = config.device_ids.get(device)
+    bitstream_hash = file_hash(bitstream_file)
+    if config.skip_unchanged:
+        if device_id:
+            recorded_hash = upload_records.get_uploaded_hash(device_id)
+            unchanged = recorded_hash == bitstream_hash and (
+                not config.readback or run(device_cmds.check_cmd)
+            )
+        else:
+            unchanged = config.readback and run(device_cmds.check_cmd)
+        if unchanged:
+            return "unchanged"
+
+    # -- Write only the changed sectors, if we know what is in the flash,
+    # -- and fall back to a full upload.
+    previous = (
+        device_cmds.partial_cmd
+        and device_id
+        and upload_records.get_uploaded_bitstream(device_id)
+    )
+    if previous and _upload_changed_sectors(
+        device_cmds, bitstream_file, previous, run
+    ):
+        status = "incremental"
+    elif run(device_cmds.cmd):
+        status = "done"
+    else:
+        return "FAILED"
+
+    if config.record and device_id:
+        upload_records.set_uploaded_bitstream(
+            device_id, bitstream_file, bitstream_hash
+        )
+    return status
+
+
+def make_upload_action(env: SConsEnvironment, config: UploadConfig):
+    """Returns the action of the upload target, see UploadConfig. The
+    programmers of several devices are run in parallel, showing their
+    progress in a single line, followed by a summary.
+
+    If config.record is True, the bitstream is recorded for each device it
+    was uploaded to, by its USB id. If config.skip_unchanged is True, the
+    devices with a recorded bitstream that matches the current one are
+    skipped, and with config.readback, only if their flash also matches it
+    when compared by their check command. The devices without a USB id
+    are skipped only by their check command, with config.readback. If the
+    devices have partial commands, only the flash sectors that differ from
+    the recorded bitstream are written, and then the flash is compared by
+    their check command.
+    """
+    if not config.device_cmds:
+        return None
+
+    def subst(cmd: Optional[str], source: List[File]) -> Optional[str]:
+        # -- The placeholders of the partial commands are escaped.
+        cmd = cmd and cmd.replace("${OFFSET}", "$${OFFSET}")
+        cmd = cmd and cmd.replace("$SOURCE", "$${CHUNK}")
+        return cmd and env.subst(cmd, source=source)
+
+    def get_device_cmds(device: str, source: List[File]) -> DeviceCommands:
+        """Returns the commands of a device. Creating scons nodes is not
+        thread safe, so this is called before running the threads."""
+        return DeviceCommands(
+            env.subst(config.device_cmds[device], source=source),
+            env.subst(config.check_cmds.get(device, ""), source=source),
+            subst(config.partial_cmds.get(device), source),
+        )
+
+    def single_device_upload(
+        source: List[File], target: List[Alias], env: SConsEnvironment
+    ) -> int:
+        """Action function. Runs the programmer of a single device, with
+        its output going to the scons output as with a command action."""
+        device = next(iter(config.device_cmds))
+        device_cmds = get_device_cmds(device, source)
+
+        def run(cmd: str) -> bool:
+            # -- The checks and the partial writes fail normally, e.g. when
+            # -- the flash differs, and are followed by a full upload, so
+            # -- they are not reported as scons errors.
+            if cmd == device_cmds.cmd:
+                return env.Execute(cmd) == 0
+            passed, lines = _run_commands(env, [cmd])
+            for line in lines:
+                msg(env, line)
+            return passed
+
+        status = _upload_to_device(
+            config, device, device_cmds, str(source[0]), run
+        )
+        if status == "unchanged":
+            msg(env, "The board already has this bitstream, skipping.")
+        elif status == "incremental":
+            msg(env, "Only the changed flash sectors were written.")
+        return 1 if status == "FAILED" else 0
+
+    def multi_device_upload(
+        source: List[File], target: List[Alias], env: SConsEnvironment
+    ) -> int:
+        """Action function. Runs the programmers and prints a summary."""
+        uploads = [DeviceUpload(device) for device in config.device_cmds]
+        all_cmds = [get_device_cmds(u.device, source) for u in uploads]
+        lock = threading.Lock()
+        last_progress = [""]
+
+        def update_status(upload: DeviceUpload, status: str) -> None:
+            """Sets the status of a device and prints the progress line if
+            it changed."""
+            with lock:
+                upload.status = status
+                progress = UPLOAD_PROGRESS + ", ".join(
+                    f"{u.device}: {u.status}" for u in uploads
+                )
+                if progress != last_progress[0]:
+                    last_progress[0] = progress
+                    msg(env, progress)
+
+        def run_upload(upload: DeviceUpload, device_cmds: DeviceCommands):
+            def run(cmd: str) -> bool:
+                upload.lines.append(f"$ {cmd}")
+                with subprocess.Popen(
+                    cmd,
+                    shell=True,
+                    env=env["ENV"],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    encoding="utf-8",
+                    errors="replace",
+                ) as proc:
+                    # -- The progress meters end their lines with '\r',
+                    # -- which the universal newlines mode splits as lines.
+                    for line in proc.stdout:
+                        line = line.rstrip("\n")
+                        upload.lines.append(line)
+                        match = PERCENT.search(line)
+                        if match:
+                            update_status(upload, f"{match.group(1)}%")
+                return proc.returncode == 0
+
+            start_time = time.time()
+            update_status(upload, "running")
+            status = _upload_to_device(
+                config, upload.device, device_cmds, str(source[0]), run
+            )
+            upload.duration = time.time() - start_time
+            update_status(upload, status)
+
+        msg(env, "")
+        with ThreadPoolExecutor(max_workers=len(uploads)) as executor:
+            list(executor.map(run_upload, uploads, all_cmds))
+
+        # -- Show the output of the failed uploads, indented so it's not
+        # -- taken for the output of a single programmer, and a summary.
+        for upload in uploads:
+            if upload.status == "FAILED":
+                msg(env, "")
+                msg(env, f"Upload to {upload.device} failed:", fg="red")
+                for line in upload.lines:
+                    msg(env, f"  {line}")
+        msg(env, "")
+        msg(env, "UPLOADS:", fg="cyan")
+        for upload in uploads:
+            status = {
+                "FAILED": click.style("FAILED", fg="red"),
+                "unchanged": "unchanged, skipped",
+                "incremental": click.style("OK", fg="green")
+                + " (changed sectors)",
+            }.get(upload.status, click.style("OK", fg="green"))
+            msg(
+                env,
+                f"{upload.device:>20}: {status} {upload.duration:7.2f} sec",
+            )
+        msg(env, "")
+        failures = sum(upload.status == "FAILED" for upload in uploads)
+        if failures:
+            error(env, f"{failures} of {len(uploads)} uploads failed.")
+            return 1
+        return 0
+
+    if len(config.device_cmds) == 1:
+        return Action(single_device_upload, None)
+    return Action(
+        multi_device_upload,
+        f"Uploading to {len(config.device_cmds)} devices in parallel.",
+    )
+
+
+class ArtifactsCacheDir(CacheDir):
+    """A scons CacheDir that caches only the nodes marked by
+    set_up_artifacts_cache(), reports the cache hits and misses and keeps
+    the cache size under the limit by evicting the least recently used
+    files. Scons already touches a cache file when it's retrieved.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        # -- True once the prune at exit was registered.
+        self._prune_registered = False
+
+    def retrieve(self, node) -> bool:
+        """Called by scons before building a node. Returns True if the node
+        was restored from the cache."""
+        if not self.is_enabled() or not is_cached_artifact(node):
+            return False
+        env = node.get_build_env()
+        self._register_prune(env)
+        if CacheRetrieveSilent(node, [], env, execute=1) == 0:
+            msg(env, f"Build cache hit: {node.name}", fg="green")
+            return True
+        msg(env, f"Build cache miss: {node.name}")
+        return False
+
+    def push(self, node):
+        """Called by scons after building a node."""
+        if not is_cached_artifact(node):
+            return None
+        self._register_prune(node.get_build_env())
+        return super().push(node)
+
+    def _register_prune(self, env: SConsEnvironment) -> None:
+        """Walking the cache is slow, so when scons uses the cache, it's
+        pruned once, when scons exits."""
+        if not self._prune_registered:
+            self._prune_registered = True
+            atexit.register(self.prune, env["BUILD_CACHE_MAX_BYTES"])
+
+    def prune(self, max_bytes: int) -> None:
+        """Deletes the least recently used cache files until the total
+        size of the cache is at most max_bytes."""
+        files = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            # -- Skip scons's 'config' file in the cache's root dir.
+            if dirpath == self.path:
+                continue
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        # -- Oldest first.
+        files.sort()
+        for _, size, path in files:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def is_cached_artifact(node) -> bool:
+    """Returns True if the node was marked by set_up_artifacts_cache()."""
+    return getattr(node.attributes, "apio_cached", False)
+
+
+def set_up_artifacts_cache(env: SConsEnvironment, targets: List) -> None:
+    """Enables the shared build artifacts cache for the given targets, if
+    requested by the scons args 'cache_dir', 'cache_max_mb' and
+    'toolchain_version'.
+
+    The scons cache key of a target is a hash of its build action (which
+    includes the FPGA parameters) and of the content of its dependencies
+    (verilog and constraint files), to which we add the version of the
+    toolchain packages.
+    """
+    cache_dir = arg_str(env, "cache_dir", "")
+    if not cache_dir:
+        return
+
+    max_mb = arg_int(env, "cache_max_mb", 1024)
+    env.Replace(BUILD_CACHE_MAX_BYTES=max_mb * 1024 * 1024)
+    env.CacheDir(cache_dir, custom_class=ArtifactsCacheDir)
+
+    toolchain_version = env.Value(arg_str(env, "toolchain_version", ""))
+    for node in env.Flatten(targets):
+        env.Depends(node, toolchain_version)
+        node.attributes.apio_cached = True
@@ -9,71 +9,33 @@
 # ---- Licence Apache v2
 """Misc utility functions and classes."""
 
+import io
 import sys
-import os
 import json
+import codecs
 import shutil
 from enum import Enum
+from collections import deque
+from contextlib import nullcontext
 from dataclasses import dataclass
-from typing import Optional, Any
+from typing import Optional, Any, Callable, Iterable, List, Union
 import subprocess
-from threading import Thread
 from pathlib import Path
 import click
-from serial.tools.list_ports import comports
-import requests
 from apio import env_options
 
 # ----------------------------------------
 # -- Constants
 # ----------------------------------------
 
+# -- Name of the per project folder with apio's internal state files.
+PROJECT_STATE_DIR = ".apio"
+
 
 class ApioException(Exception):
     """Apio error"""
 
 
-class AsyncPipe(Thread):
-    """DOC: TODO"""
-
-    def __init__(self, outcallback=None):
-        Thread.__init__(self)
-        self.outcallback = outcallback
-
-        self._fd_read, self._fd_write = os.pipe()
-        self._pipe_reader = os.fdopen(self._fd_read, encoding="UTF-8")
-        self._buffer = []
-
-        self.start()
-
-    def get_buffer(self):
-        """DOC: TODO"""
-
-        return self._buffer
-
-    def fileno(self):
-        """DOC: TODO"""
-
-        return self._fd_write
-
-    def run(self):
-        """DOC: TODO"""
-
-        for line in iter(self._pipe_reader.readline, ""):
-            # We do preserve trailing whitespace and indentation.
-            line = line.rstrip()
-            self._buffer.append(line)
-            if self.outcallback:
-                self.outcallback(line)
-        self._pipe_reader.close()
-
-    def close(self):
-        """DOC: TODO"""
-
-        os.close(self._fd_write)
-        self.join()
-
-
 class TerminalMode(Enum):
     """Represents to two modes of stdout/err."""
 
@@ -215,6 +177,27 @@ def get_packages_dir() -> Path:
     return pkg_home_dir
 
 
+def get_project_state_dir(project_dir: Path = None) -> Path:
+    """Return the folder where apio keeps its per project state, such as
+    the scons build server info. It is the '.apio' folder in the project
+    dir and it is created if it doesn't exist.
+      * INPUT:
+        - project_dir: The project folder. Current dir if None.
+      * OUTPUT:
+        - The state folder (Ex. 'my_project/.apio')
+    """
+
+    # -- Default to the current directory.
+    if not project_dir:
+        project_dir = Path(".")
+
+    # -- Create the folder if needed.
+    state_dir = Path(project_dir) / PROJECT_STATE_DIR
+    state_dir.mkdir(parents=True, exist_ok=True)
+
+    return state_dir
+
+
 def call(cmd):
     """Execute the given command."""
 
@@ -238,134 +221,138 @@ class CommandResult:
     exit_code: Optional[int] = None  # Exit code, 0 = OK.
 
 
-def exec_command(*args, **kwargs) -> CommandResult:
+async def _read_lines(
+    stream, on_line: Callable[[str], None], block_size: int = 64 * 1024
+) -> None:
+    """Reads the given asyncio stream and calls on_line with each of its
+    lines, without the line terminator and trailing whitespace. Like text
+    files, CR LF and CR are line terminators too."""
+
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder("utf-8")(errors="replace"),
+        translate=True,
+    )
+    pending = ""
+    while True:
+        block = await stream.read(block_size)
+        text = pending + decoder.decode(block, final=not block)
+        lines = text.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            on_line(line.rstrip())
+        if not block:
+            break
+    if pending:
+        on_line(pending.rstrip())
+
+
+async def _run_command(
+    command: List[str],
+    on_stdout_line: Callable[[str], None],
+    on_stderr_line: Callable[[str], None],
+) -> int:
+    """Runs the command and passes its stdout and stderr lines to the
+    callbacks. Returns the exit code."""
+
+    # pylint: disable=import-outside-toplevel
+    import asyncio
+
+    proc = await asyncio.create_subprocess_exec(
+        *command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        await asyncio.gather(
+            _read_lines(proc.stdout, on_stdout_line),
+            _read_lines(proc.stderr, on_stderr_line),
+        )
+        return await proc.wait()
+    finally:
+        # -- E.g. if aborted by the user.
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+
+
+def exec_command(
+    command: Union[str, List[str]],
+    *,
+    on_stdout: Optional[Callable[[str], None]] = None,
+    on_stderr: Optional[Callable[[str], None]] = None,
+    tail_lines: Optional[int] = None,
+    spill_file: Optional[Path] = None,
+) -> CommandResult:
     """Execute the given command.
 
+    Both stdout and stderr are read by a single asyncio loop, in the calling
+    thread, and their lines are passed to the callbacks in the order they
+    are read, without the line terminators.
+
     NOTE: When running on windows, this function does not support
     privilege elevation, to achieve that, use os.system() instead.
 
     INPUTS:
-     *args: List with the command and its arguments to execute
-     **kwargs: Key arguments when calling subprocess.Popen()
-       * stdout
-       * stdin
-       * shell
-
-    OUTPUT: A dictionary with the following properties:
-      * out: String with the output
-      * err: String with the error output
-      * returncode: Number with the code returned by the command
-        * 0: Sucess
-        * Another number different from 0: Error!
+     command: The command and its arguments.
+     on_stdout: An optional callback that is called with each stdout line.
+     on_stderr: An optional callback that is called with each stderr line.
+     tail_lines: If not None, only the last tail_lines lines of stdout and
+       stderr are kept in the result, e.g. 0 if the text is not needed.
+     spill_file: An optional file to which all the stdout and stderr
+       lines are written, in the order they are read.
+
+    OUTPUT: A CommandResult with the captured stdout and stderr text and
+      the exit code of the command, 0 for success.
 
     Example:  exec_command(['scons', '-Q', '-c', '-f', 'SConstruct'])
     """
 
-    # -- Set the default arguments to pass to subprocess.Popen()
-    # -- for executing the command
-    flags = {
-        # -- Capture the command output
-        "stdout": subprocess.PIPE,
-        "stderr": subprocess.PIPE,
-        # -- Execute it directly, without using the shell
-        "shell": False,
-    }
-
-    # -- Include the flags given by the user
-    # -- It overrides the default flags
-    flags.update(kwargs)
-
-    # -- Execute the command!
-    try:
-        with subprocess.Popen(*args, **flags) as proc:
-
-            # -- Run the command.
-            out_text, err_text = proc.communicate()
-            exit_code = proc.returncode
-
-            # -- Close the pipes
-            for std in ("stdout", "stderr"):
-                if isinstance(flags[std], AsyncPipe):
-                    flags[std].close()
-
-    # -- User has pressed the Ctrl-C for aborting the command
-    except KeyboardInterrupt:
-        click.secho("Aborted by user", fg="red")
-        sys.exit(1)
-
-    # -- The command does not exist!
-    except FileNotFoundError:
-        click.secho(f"Command not found:\n{args}", fg="red")
-        sys.exit(1)
+    # pylint: disable=import-outside-toplevel
+    import asyncio
+
+    if isinstance(command, str):
+        command = [command]
+
+    # -- The captured lines. A deque with maxlen is a ring buffer.
+    out_lines = deque(maxlen=tail_lines)
+    err_lines = deque(maxlen=tail_lines)
+
+    with (
+        open(spill_file, "w", encoding="utf8") if spill_file else nullcontext()
+    ) as spill:
+
+        def handler(lines: deque, callback: Optional[Callable[[str], None]]):
+            def on_line(line: str) -> None:
+                lines.append(line)
+                if spill:
+                    spill.write(line + "\n")
+                if callback:
+                    callback(line)
+
+            return on_line
+
+        # -- Execute the command!
+        try:
+            exit_code = asyncio.run(
+                _run_command(
+                    command,
+                    handler(out_lines, on_stdout),
+                    handler(err_lines, on_stderr),
+                )
+            )
 
-    # -- If stdout pipe is an AsyncPipe, extract its text.
-    pipe = flags["stdout"]
-    if isinstance(pipe, AsyncPipe):
-        lines = pipe.get_buffer()
-        text = "\n".join(lines)
-        out_text = text
+        # -- User has pressed the Ctrl-C for aborting the command
+        except KeyboardInterrupt:
+            click.secho("Aborted by user", fg="red")
+            sys.exit(1)
 
-    # -- If stderr pipe is an AsyncPipe, extract its text.
-    pipe = flags["stderr"]
-    if isinstance(pipe, AsyncPipe):
-        lines = pipe.get_buffer()
-        text = "\n".join(lines)
-        err_text = text
+        # -- The command does not exist!
+        except FileNotFoundError:
+            click.secho(f"Command not found:\n{command}", fg="red")
+            sys.exit(1)
 
     # -- All done.
-    result = CommandResult(out_text, err_text, exit_code)
-    return result
-
-
-def get_pypi_latest_version() -> str:
-    """Get the latest stable version of apio from Pypi
-    Internet connection is required
-    Returns: A string with the version (Ex: "0.9.0")
-      In case of error, it returns None
-    """
-
-    # -- Error message common to all exceptions
-    error_msg = "Error: could not connect to Pypi\n"
-
-    # -- Read the latest apio version from pypi
-    # -- More information: https://warehouse.pypa.io/api-reference/json.html
-    try:
-        req = requests.get(
-            "https://pypi.python.org/pypi/apio/json", timeout=10
-        )
-        req.raise_for_status()
-
-    # -- Connection error
-    except requests.exceptions.ConnectionError as e:
-        click.secho(
-            f"\n{error_msg}" "Check your internet connection and try again\n",
-            fg="red",
-        )
-        print_exception_developers(e)
-        return None
-
-    # -- HTTP Error
-    except requests.exceptions.HTTPError as e:
-        click.secho(f"\nHTTP ERROR\n{error_msg}", fg="red")
-        print_exception_developers(e)
-        return None
-
-    # -- Timeout!
-    except requests.exceptions.Timeout as e:
-        click.secho(f"\nTIMEOUT!\n{error_msg}", fg="red")
-        print_exception_developers(e)
-        return None
-
-    # -- Another error
-    except requests.exceptions.RequestException as e:
-        click.secho(f"\nFATAL ERROR!\n{error_msg}", fg="red")
-        print_exception_developers(e)
-        return None
-
-    # -- Get the version field from the json response
-    version = req.json()["info"]["version"]
-
-    return version
+    return CommandResult("\n".join(out_lines), "\n".join(err_lines), exit_code)
 
 
 def print_exception_developers(e):
@@ -421,9 +408,14 @@ def get_serial_ports() -> list:
     * OUTPUT: A list with the devides
          Ex: [{'port': '/dev/ttyACM0',
                'description': 'ttyACM0',
-               'hwid': 'USB VID:PID=1D50:6130 LOCATION=1-5:1.0'}]
+               'hwid': 'USB VID:PID=1D50:6130 LOCATION=1-5:1.0',
+               'serial_number': 'A1B2C3'}]
+         The serial number is None if the device doesn't have one.
     """
 
+    # pylint: disable=import-outside-toplevel
+    from serial.tools.list_ports import comports
+
     # -- Initial empty device list
     result = []
 
@@ -435,7 +427,8 @@ def get_serial_ports() -> list:
 
     # -- Only the USB serial ports are included
     # -- in the final list
-    for port, description, hwid in list_port_info:
+    for port_info in list_port_info:
+        port, description, hwid = port_info
 
         # -- Not a serial port: ignore. Proceed to the
         # -- next device
@@ -447,7 +440,12 @@ def get_serial_ports() -> list:
 
             # -- Add to the final list
             result.append(
-                {"port": port, "description": description, "hwid": hwid}
+                {
+                    "port": port,
+                    "description": description,
+                    "hwid": hwid,
+                    "serial_number": port_info.serial_number,
+                }
             )
 
     # -- Return the list of serial ports
@@ -580,3 +578,57 @@ def count(obj: Any, singular: str, plural: str = None) -> str:
     if plural is None:
         plural = singular + "s"
     return f"{n} {plural}"
+
+
+class _CallbackProgressBar:
+    """A replacement of click.progressbar() that reports the progress to
+    a callback instead of printing it."""
+
+    def __init__(
+        self,
+        iterable: Optional[Iterable],
+        length: int,
+        on_progress: Callable[[int, int], None],
+    ):
+        self._iterable = iterable
+        self._length = length
+        self._on_progress = on_progress
+        self._done = 0
+
+    def __enter__(self):
+        self._on_progress(0, self._length)
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def __iter__(self):
+        for item in self._iterable:
+            yield item
+            self.update(1)
+
+    def update(self, n: int) -> None:
+        """Advances the progress by n steps."""
+        self._done += n
+        self._on_progress(self._done, self._length)
+
+
+def progressbar(
+    iterable: Optional[Iterable] = None,
+    *,
+    length: int,
+    label: str,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+):
+    """Returns the apio progress bar, a click.progressbar() context. If
+    on_progress is given, the progress is reported by calling it with the
+    number of steps done and the length, instead of being printed."""
+    if on_progress:
+        return _CallbackProgressBar(iterable, length, on_progress)
+    return click.progressbar(
+        iterable,
+        length=length,
+        label=click.style(label, fg="yellow"),
+        fill_char=click.style("█", fg="blue"),
+        empty_char=click.style("░", fg="blue"),
+    )
@@ -0,0 +1,86 @@
+"""Apio scons output filter benchmark.
+
+Feeds a nextpnr verbose log, such as the output of 'apio build
+--verbose-pnr', through the filter of the scons output and measures its
+throughput. The filter output is discarded. Without a log file, a
+synthetic log with typical nextpnr lines is used.
+
+Usage:
+  python benchmarks/scons_filter.py [--log FILE] [--lines N]
+"""
+
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+
+import io
+import time
+import argparse
+import contextlib
+from pathlib import Path
+from typing import List
+from apio.managers.scons_filter import SconsFilter
+
+# -- The nextpnr command line that starts the verbose log range.
+NEXTPNR_COMMAND = "nextpnr-ice40 --hx8k --package ct256 --json hardware.json"
+
+# -- Typical nextpnr log lines, repeated to make the synthetic log.
+SAMPLE_LINES = [
+    "Info: Placed 1024 cells based on constraints.",
+    "Info:   at initial placer iter 0, wirelen = 4571",
+    "Info:   at iteration #5: temp = 1.000000, timing cost = 312, "
+    "wirelen = 4012",
+    "Info: Routing..",
+    "Info:            |   (re-)routed arcs  |   delta    | remaining|"
+    "       time spent     |",
+    "Info:     IterCnt |  w/ripup   wo/ripup |  w/r  wo/r |      arcs|"
+    " batch(sec) total(sec)|",
+    "Info:        2000 |       12       1987 |   12  1987 |      4711|"
+    "       0.12       0.12|",
+    "Warning: unable to find a placement location for cell 'x'",
+    "Info: Critical path report for clock 'CLK$SB_IO_IN_$glb_clk' "
+    "(posedge -> posedge):",
+    "Info: curr total",
+    "Info:  0.5  0.5  Source counter_SB_DFF_Q_D_SB_LUT4_O.Q",
+    "",
+]
+
+
+def make_log(num_lines: int) -> List[str]:
+    """Returns a synthetic nextpnr verbose log with num_lines lines."""
+    return [SAMPLE_LINES[i % len(SAMPLE_LINES)] for i in range(num_lines)]
+
+
+def main() -> None:
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n", maxsplit=1)[0]
+    )
+    parser.add_argument("--log", type=Path, default=None, help="Log file.")
+    parser.add_argument("--lines", type=int, default=500000, help="Lines.")
+    args = parser.parse_args()
+
+    if args.log:
+        lines = args.log.read_text(encoding="utf8").splitlines()
+    else:
+        lines = make_log(args.lines)
+    print(f"Filtering {len(lines)} nextpnr log lines...")
+
+    output = io.StringIO()
+    scons_filter = SconsFilter()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        scons_filter.on_stdout_line(NEXTPNR_COMMAND)
+        for line in lines:
+            scons_filter.on_stderr_line(line)
+        scons_filter.on_stderr_line("Program finished normally.")
+        scons_filter.flush()
+    elapsed = time.perf_counter() - start
+
+    print(f"  {elapsed:7.2f} s, {len(lines) / elapsed:,.0f} lines/s")
+    print(f"  {len(output.getvalue()) / 1e6:.1f} MB of output")
+
+
+if __name__ == "__main__":
+    main()
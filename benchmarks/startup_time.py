@@ -0,0 +1,91 @@
+"""Apio startup time benchmark.
+
+Measures the wall time and the python import time of apio commands that
+do little more than starting apio, using 'python -X importtime'.
+
+Usage:
+  python benchmarks/startup_time.py [--runs N] [--top N]
+"""
+
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from typing import List, Tuple
+
+# -- The apio command lines to benchmark.
+BENCHMARKS = [
+    ["--version"],
+    ["build", "-h"],
+]
+
+# -- Python code that runs apio with the args in sys.argv.
+APIO_MAIN = "import sys; from apio.__main__ import cli; sys.exit(cli())"
+
+# -- A line of the -X importtime output.
+# -- Example: 'import time:       288 |       3341 |   apio.util'
+IMPORTTIME_REGEX = re.compile(
+    r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$"
+)
+
+
+def run_once(apio_args: List[str]) -> Tuple[float, List[Tuple[int, str]]]:
+    """Runs apio once with the given args. Returns the wall time in seconds
+    and a list of (cumulative import time in usecs, module) of the top level
+    imports."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", APIO_MAIN] + apio_args,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        encoding="utf-8",
+        check=True,
+    )
+    wall_time = time.perf_counter() - start
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_REGEX.match(line)
+        # -- Top level imports only, their time includes their own imports.
+        if match and len(match.group(3)) == 1:
+            imports.append((int(match.group(2)), match.group(4)))
+    return wall_time, imports
+
+
+def main() -> None:
+    """Runs the benchmarks and prints the results."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n", maxsplit=1)[0]
+    )
+    parser.add_argument("--runs", type=int, default=10, help="Runs per test.")
+    parser.add_argument("--top", type=int, default=5, help="Imports to show.")
+    args = parser.parse_args()
+
+    for apio_args in BENCHMARKS:
+        wall_times = []
+        import_times = []
+        imports = []
+        for _ in range(args.runs):
+            wall_time, imports = run_once(apio_args)
+            wall_times.append(wall_time)
+            import_times.append(sum(usecs for usecs, _ in imports))
+
+        print(f"apio {' '.join(apio_args)}")
+        print(f"  wall time:   {statistics.median(wall_times) * 1000:7.1f} ms")
+        print(
+            f"  import time: {statistics.median(import_times) / 1000:7.1f} ms"
+        )
+        for usecs, module in sorted(imports, reverse=True)[: args.top]:
+            print(f"    {usecs / 1000:7.1f} ms  {module}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
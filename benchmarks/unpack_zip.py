@@ -0,0 +1,100 @@
+"""Apio zip unpacking benchmark.
+
+Creates a synthetic zip archive with many small files, similar to the
+Windows oss-cad-suite package, and measures the time it takes to extract
+it sequentially, as apio did before, and with the parallel extractor.
+
+Usage:
+  python benchmarks/unpack_zip.py [--files N] [--jobs N]
+"""
+
+# -*- coding: utf-8 -*-
+# -- This file is part of the Apio project
+# -- (C) 2016-2024 FPGAwars
+# -- Licence GPLv2
+
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+from apio.managers.unpacker import ZIPArchive, ParallelZipExtractor
+
+# -- Files per directory in the synthetic archive.
+FILES_PER_DIR = 200
+
+# -- Every Nth file is a copy of an earlier file, like the duplicated dlls
+# -- of the oss-cad-suite package.
+DUPLICATE_EVERY = 10
+
+
+def create_archive(path: Path, num_files: int) -> None:
+    """Creates a zip archive with num_files small files."""
+    rand = random.Random(0)
+    contents = []
+    with ZipFile(path, "w", ZIP_DEFLATED) as zip_file:
+        for i in range(num_files):
+            if i % DUPLICATE_EVERY == DUPLICATE_EVERY - 1:
+                data = rand.choice(contents)
+            else:
+                size = rand.randint(100, 8000)
+                data = rand.randbytes(size // 4) * 4
+                contents.append(data)
+            info = ZipInfo(f"pkg/dir{i // FILES_PER_DIR}/file{i}.dat")
+            info.external_attr = (0o100755 if i % 7 == 0 else 0o100644) << 16
+            info.compress_type = ZIP_DEFLATED
+            zip_file.writestr(info, data)
+
+
+def extract_sequential(archive: Path, dest_dir: Path) -> None:
+    """Extracts the archive one member at a time, as apio did before."""
+    unpacker = ZIPArchive(archive)
+    for item in unpacker.get_items():
+        unpacker.extract_item(item, dest_dir)
+
+
+def main() -> None:
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n", maxsplit=1)[0]
+    )
+    parser.add_argument("--files", type=int, default=50000, help="Files.")
+    parser.add_argument("--jobs", type=int, default=None, help="Threads.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        archive = tmp_dir / "package.zip"
+        print(f"Creating an archive with {args.files} files...")
+        create_archive(archive, args.files)
+        print(f"Archive size: {archive.stat().st_size / 1e6:.1f} MB")
+        print()
+
+        runs = [
+            ("sequential", lambda d: extract_sequential(archive, d)),
+            (
+                "parallel",
+                lambda d: ParallelZipExtractor(
+                    archive, jobs=args.jobs
+                ).extract(d, lambda n: None),
+            ),
+            (
+                "parallel + hardlinks",
+                lambda d: ParallelZipExtractor(
+                    archive, jobs=args.jobs, hardlink_duplicates=True
+                ).extract(d, lambda n: None),
+            ),
+        ]
+        for name, func in runs:
+            dest_dir = tmp_dir / "out"
+            start = time.perf_counter()
+            func(dest_dir)
+            elapsed = time.perf_counter() - start
+            shutil.rmtree(dest_dir)
+            print(f"  {name:22} {elapsed:7.2f} s")
+
+
+if __name__ == "__main__":
+    main()
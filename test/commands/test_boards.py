@@ -2,13 +2,21 @@
   Test for the "apio boards" command
 """
 
+import json
+from click.testing import CliRunner
+
 # -- apio boards entry point
 from apio.commands.boards import cli as cmd_boards
+from apio.managers.device_inventory import DeviceInventory
 
 
-def test_boards(clirunner, configenv, validate_cliresult):
+def test_boards(clirunner, configenv, validate_cliresult, monkeypatch):
     """Test "apio boards" with different parameters"""
 
+    # -- A runner that keeps stderr, where the notices go, out of the json
+    # -- output.
+    json_runner = CliRunner(mix_stderr=False)
+
     with clirunner.isolated_filesystem():
 
         # -- Config the environment (conftest.configenv())
@@ -25,3 +33,58 @@ def test_boards(clirunner, configenv, validate_cliresult):
         # -- Execute "apio boards --fpga"
         result = clirunner.invoke(cmd_boards, ["--fpga"])
         validate_cliresult(result)
+
+        # -- Execute "apio boards --filter arch=ecp5,size=85k --json"
+        result = json_runner.invoke(
+            cmd_boards, ["--filter", "arch=ecp5,size=85k", "--json"]
+        )
+        validate_cliresult(result)
+        boards = json.loads(result.stdout)
+        assert boards
+        assert {(b["arch"], b["size"]) for b in boards} == {("ecp5", "85k")}
+
+        # -- Execute "apio boards --fpga --filter arch=gowin --json"
+        result = json_runner.invoke(
+            cmd_boards, ["--fpga", "--filter", "arch=gowin", "--json"]
+        )
+        validate_cliresult(result)
+        fpgas = json.loads(result.stdout)
+        assert {f["arch"] for f in fpgas} == {"gowin"}
+
+        # -- Execute "apio boards --filter usb=0403:6010"
+        result = clirunner.invoke(cmd_boards, ["--filter", "usb=0403:6010"])
+        validate_cliresult(result)
+        assert "alhambra-ii" in result.output
+
+        # -- Execute "apio boards --filter color=red"
+        result = clirunner.invoke(cmd_boards, ["--filter", "color=red"])
+        assert result.exit_code == 1
+        assert "unknown filter field 'color'" in result.output
+
+        # -- Execute "apio boards --connected --json", with a fake device.
+        monkeypatch.setattr(
+            DeviceInventory,
+            "usb_devices",
+            lambda _: [{"hwid": "1D50:6130"}, {"hwid": "1234:5678"}],
+        )
+        result = json_runner.invoke(cmd_boards, ["--connected", "--json"])
+        validate_cliresult(result)
+        boards = json.loads(result.stdout)
+        assert boards
+        assert {b["usb"] for b in boards} == {"1d50:6130"}
+
+        # -- A custom boards.json with an unknown FPGA.
+        custom_boards = {
+            "my-board": {
+                "name": "My board",
+                "fpga": "no-such-fpga",
+                "programmer": {"type": "iceprog"},
+            }
+        }
+        with open("boards.json", "w", encoding="utf8") as f:
+            json.dump(custom_boards, f)
+        result = clirunner.invoke(cmd_boards, ["--json"])
+        assert result.exit_code == 1
+        assert "board 'my-board' has an unknown fpga 'no-such-fpga'" in (
+            result.output
+        )
@@ -2,6 +2,10 @@
   Test for the "apio packages" command
 """
 
+import os
+import json
+from pathlib import Path
+
 # -- apio packages entry point
 from apio.commands.packages import cli as cmd_packages
 
@@ -18,8 +22,8 @@ def test_packages(clirunner, configenv):
         result = clirunner.invoke(cmd_packages)
         assert result.exit_code == 1, result.output
         assert (
-            "One of [--list, --install, --uninstall, --fix] "
-            "must be specified" in result.output
+            "One of [--list, --install, --uninstall, --rollback, --verify, "
+            "--gc, --fix] must be specified" in result.output
         )
 
         # -- Execute "apio packages --list"
@@ -40,3 +44,37 @@ def test_packages(clirunner, configenv):
         )
         assert result.exit_code == 1, result.output
         assert "Error: no such package 'missing_package'" in result.output
+
+
+def test_packages_rollback(clirunner, configenv):
+    """Test "apio packages --rollback" """
+
+    with clirunner.isolated_filesystem():
+
+        # -- Config the environment (conftest.configenv())
+        configenv()
+
+        # -- Execute "apio packages --rollback examples" with no previous
+        # -- version.
+        result = clirunner.invoke(cmd_packages, ["--rollback", "examples"])
+        assert result.exit_code == 1, result.output
+        assert "has no previous version" in result.output
+
+        # -- Create a previous version of the examples package.
+        packages_dir = Path(os.environ["APIO_PACKAGES_DIR"])
+        (packages_dir / ".examples.rollback").mkdir(parents=True)
+        (packages_dir / ".examples.rollback.json").write_text(
+            json.dumps({"version": "0.0.1"})
+        )
+
+        # -- Execute "apio packages --rollback examples"
+        result = clirunner.invoke(cmd_packages, ["--rollback", "examples"])
+        assert result.exit_code == 0, result.output
+        assert "rolled back successfully" in result.output
+        assert (packages_dir / "examples").is_dir()
+        assert not (packages_dir / ".examples.rollback").exists()
+
+        # -- The hidden dirs are not reported as errors.
+        result = clirunner.invoke(cmd_packages, ["--list"])
+        assert result.exit_code == 0, result.output
+        assert "No errors" in result.output
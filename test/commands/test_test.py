@@ -4,6 +4,7 @@
 
 # -- apio test entry point
 from apio.commands.sim import cli as cmd_test
+from apio.commands.test import cli as cmd_test_jobs
 
 
 def test_test(clirunner, configenv):
@@ -21,3 +22,17 @@ def test_test(clirunner, configenv):
         result = clirunner.invoke(cmd_test)
         assert result.exit_code != 0, result.output
         # -- TODO
+
+
+def test_test_jobs(clirunner, configenv):
+    """Test: apio test --jobs 0"""
+
+    with clirunner.isolated_filesystem():
+
+        # -- Config the environment (conftest.configenv())
+        configenv()
+
+        # -- Execute "apio test --jobs 0"
+        result = clirunner.invoke(cmd_test_jobs, ["--jobs", "0"])
+        assert result.exit_code == 2, result.output
+        assert "Invalid value for '-j' / '--jobs'" in result.output
@@ -98,3 +98,8 @@ def test_upload_complete(clirunner, configenv):
         assert (
             "Error: package 'oss-cad-suite' is not installed" in result.output
         )
+
+        # -- Execute "apio upload --readback"
+        result = clirunner.invoke(cmd_upload, ["--readback"])
+        assert result.exit_code != 0, result.output
+        assert "--readback requires --skip-unchanged" in result.output
@@ -0,0 +1,86 @@
+"""
+Pytest fixtures of the managers tests.
+"""
+
+import re
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """A file server with HTTP ranges and ETag support that serves
+    'content' at any path, except for the paths that end with
+    '/missing.tar.gz', which are not found."""
+
+    # -- The served content and its ETag.
+    content = b""
+    etag = '"v1"'
+    # -- The status of the HEAD requests, e.g. 405 if not allowed.
+    head_status = 200
+    # -- The number of bytes sent and of the GET requests that were not
+    # -- answered with 304 (Not Modified).
+    sent_bytes = 0
+    full_responses = 0
+
+    def _send_headers(self, status: int, start: int, end: int) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", self.etag)
+        if status == 206:
+            self.send_header(
+                "Content-Range", f"bytes {start}-{end - 1}/{len(self.content)}"
+            )
+        self.end_headers()
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        """Handles a HEAD request."""
+        if self.head_status != 200:
+            self.send_error(self.head_status)
+            return
+        self._send_headers(200, 0, len(self.content))
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handles a GET request, with an optional range or
+        If-None-Match."""
+        if self.path.endswith("/missing.tar.gz"):
+            self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        type(self).full_responses += 1
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if match:
+            start, end = int(match.group(1)), int(match.group(2)) + 1
+            self._send_headers(206, start, end)
+        else:
+            start, end = 0, len(self.content)
+            self._send_headers(200, start, end)
+        self.wfile.write(self.content[start:end])
+        type(self).sent_bytes += end - start
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keeps the test output quiet."""
+
+
+@pytest.fixture(name="http_handler")
+def fixture_http_handler():
+    """Starts a local HTTP server and returns its handler class, a subclass
+    of FileHandler of this test only, to set the served content and read
+    the counters. The url of the server is in its 'url' attribute."""
+
+    handler = type("Handler", (FileHandler,), {})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    handler.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(
+        target=server.serve_forever,
+        kwargs={"poll_interval": 0.05},
+        daemon=True,
+    )
+    thread.start()
+    yield handler
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,40 @@
+"""
+  Tests of the build statistics.
+"""
+
+import os
+import time
+from pathlib import Path
+import pytest
+from apio.managers import build_stats
+
+
+def test_build_stats(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test recording the actions of a command and loading its record."""
+
+    monkeypatch.chdir(tmp_path)
+
+    def spawn(*_):
+        return 0
+
+    timed_spawn = build_stats.make_timed_spawn(spawn)
+
+    start_time = time.time()
+    build_stats.start_command()
+    env = dict(os.environ)
+    assert timed_spawn("sh", None, "true", ["true"], env) == 0
+    assert timed_spawn("sh", None, "false", ["false", "x"], env) == 1
+    record = build_stats.end_command(
+        command="build",
+        board="alhambra-ii",
+        toolchain="0.1.0",
+        start_time=start_time,
+        duration=time.time() - start_time,
+        exit_code=1,
+    )
+
+    assert [a["tool"] for a in record["actions"]] == ["true", "false"]
+    assert [a["exit_code"] for a in record["actions"]] == [0, 1]
+    assert record["startup"] >= 0
+    assert build_stats.load_records("build") == [record]
+    assert not build_stats.load_records("upload")
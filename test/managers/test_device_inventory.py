@@ -0,0 +1,67 @@
+"""
+  Tests of the connected devices inventory.
+"""
+
+from pathlib import Path
+import pytest
+from apio.managers import device_inventory
+from apio.managers.device_inventory import DeviceInventory
+
+
+def _add_usb_device(
+    sysfs_dir: Path, name: str, hwid: str, devnum: int, serial: str = None
+):
+    """Adds a fake USB device to the fake sysfs dir."""
+    device_dir = sysfs_dir / name
+    device_dir.mkdir(parents=True)
+    vid, pid = hwid.split(":")
+    (device_dir / "idVendor").write_text(f"{vid}\n")
+    (device_dir / "idProduct").write_text(f"{pid}\n")
+    (device_dir / "busnum").write_text("1\n")
+    (device_dir / "devnum").write_text(f"{devnum}\n")
+    if serial:
+        (device_dir / "serial").write_text(f"{serial}\n")
+    # -- An interface of the device, which has no ids.
+    (sysfs_dir / f"{name}:1.0").mkdir()
+
+
+def test_device_inventory(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test the sysfs USB scan and the caching of the other scans."""
+
+    sysfs_dir = tmp_path / "sysfs"
+    monkeypatch.setattr(device_inventory, "SYSFS_USB_DIR", sysfs_dir)
+    monkeypatch.setattr(device_inventory.sys, "platform", "linux")
+    monkeypatch.setenv("APIO_HOME_DIR", str(tmp_path / "home"))
+    _add_usb_device(sysfs_dir, "1-1", "0403:6010", 5, "FT1A2B3C")
+    _add_usb_device(sysfs_dir, "1-2", "1d50:6130", 7)
+
+    ports = [{"port": "/dev/ttyUSB0", "hwid": "USB VID:PID=0403:6010"}]
+    scans = []
+
+    def get_serial_ports():
+        scans.append("serial")
+        return ports
+
+    monkeypatch.setattr(
+        device_inventory.util, "get_serial_ports", get_serial_ports
+    )
+
+    # -- The USB devices are read from sysfs and the serial ports are
+    # -- scanned once, and then cached while the bus doesn't change.
+    devices = DeviceInventory(None)
+    assert devices.usb_devices() == [
+        {"hwid": "0403:6010"},
+        {"hwid": "1d50:6130"},
+    ]
+    assert devices.usb_serial_numbers("0403:6010") == ["FT1A2B3C"]
+    assert devices.usb_serial_numbers("1D50:6130") == [None]
+    assert devices.usb_serial_numbers("1209:2100") == []
+    assert devices.serial_ports() == ports
+    assert devices.serial_ports() == ports
+    assert DeviceInventory(None).serial_ports() == ports
+    assert len(scans) == 1
+
+    # -- Replugging the device changes its device number.
+    (sysfs_dir / "1-1/devnum").write_text("6\n")
+    assert DeviceInventory(None).serial_ports() == ports
+    assert len(scans) == 2
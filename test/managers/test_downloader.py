@@ -0,0 +1,140 @@
+"""
+  Tests of the package file downloader, against a local HTTP server.
+"""
+
+import io
+import json
+import tarfile
+import hashlib
+import threading
+from pathlib import Path
+import pytest
+from apio import util
+from apio.managers.downloader import (
+    FileDownloader,
+    DownloadNotFoundError,
+    DownloadCancelledError,
+    STATE_FORMAT,
+    cancel_downloads,
+)
+from apio.managers import downloader as downloader_module
+from apio.managers.unpacker import unpack_tar_stream
+
+# -- The content of the test file, 1MB of pseudo random bytes.
+CONTENT = bytes((i * 7919 + i // 251) % 256 for i in range(1024 * 1024))
+
+
+@pytest.fixture(name="file_url")
+def fixture_file_url(http_handler, monkeypatch):
+    """Serves the test file from a local HTTP server and returns its url.
+    Files larger than 256KB are downloaded in 4 segments."""
+
+    monkeypatch.setattr(FileDownloader, "MIN_SEGMENT_SIZE", 256 * 1024)
+    monkeypatch.setattr(FileDownloader, "MIN_CHUNK_SIZE", 16 * 1024)
+    http_handler.content = CONTENT
+    return f"{http_handler.url}/package.tar.gz"
+
+
+def test_download(file_url: str, tmp_path: Path):
+    """Test a parallel download with a checksum."""
+
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    downloader = FileDownloader(file_url, tmp_path, sha256=sha256)
+    assert downloader.get_size() == len(CONTENT)
+    downloader.start()
+
+    assert downloader.destination == tmp_path / "package.tar.gz"
+    assert downloader.destination.read_bytes() == CONTENT
+    assert not downloader.part_file.exists()
+    assert not downloader.state_file.exists()
+
+
+def test_download_without_head(file_url: str, http_handler, tmp_path: Path):
+    """Test a download from a server that doesn't allow HEAD requests, and
+    of a missing file."""
+
+    http_handler.head_status = 405
+    downloader = FileDownloader(file_url, tmp_path)
+    assert downloader.get_size() == len(CONTENT)
+    downloader.start()
+    assert downloader.destination.read_bytes() == CONTENT
+
+    missing_url = file_url.replace("package", "missing")
+    with pytest.raises(DownloadNotFoundError):
+        FileDownloader(missing_url, tmp_path)
+
+
+def test_download_resume(file_url: str, http_handler, tmp_path: Path):
+    """Test the resume of an interrupted download. Only the missing bytes
+    should be downloaded."""
+
+    # -- Simulate a download that was interrupted after the first 100KB of
+    # -- each of its 4 segments.
+    size = len(CONTENT)
+    part = bytearray(size)
+    segments = []
+    for i in range(4):
+        start, end = size * i // 4, size * (i + 1) // 4
+        done_end = start + 100000
+        part[start:done_end] = CONTENT[start:done_end]
+        segments.append({"start": start, "end": end, "done": 100000})
+    (tmp_path / "package.tar.gz.part").write_bytes(part)
+    state = {
+        "format": STATE_FORMAT,
+        "url": file_url,
+        "size": size,
+        "validator": '"v1"',
+        "segments": segments,
+    }
+    (tmp_path / "package.tar.gz.part.json").write_text(json.dumps(state))
+
+    downloader = FileDownloader(file_url, tmp_path)
+    downloader.start()
+
+    assert downloader.destination.read_bytes() == CONTENT
+    assert http_handler.sent_bytes == size - 400000
+
+
+def test_cancel_downloads(
+    file_url: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    """Test that a cancelled download stops and is kept for resuming."""
+
+    monkeypatch.setattr(downloader_module, "_cancel_event", threading.Event())
+    downloader = FileDownloader(file_url, tmp_path)
+    cancel_downloads()
+    with pytest.raises(DownloadCancelledError):
+        downloader.start()
+
+    assert downloader.state_file.exists()
+    assert not downloader.destination.exists()
+
+
+def test_download_bad_checksum(file_url: str, tmp_path: Path):
+    """Test that a download with a wrong checksum fails and leaves no
+    files behind."""
+
+    downloader = FileDownloader(file_url, tmp_path, sha256="00" * 32)
+    with pytest.raises(util.ApioException):
+        downloader.start()
+
+    assert not list(tmp_path.iterdir())
+
+
+def test_stream_tar_gz(file_url: str, http_handler, tmp_path: Path):
+    """Test the unpacking of a tar.gz file while it's downloaded."""
+
+    # -- Serve a tar.gz file with a single file.
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        info = tarfile.TarInfo("pkg/bin/tool")
+        info.size = len(CONTENT)
+        tar.addfile(info, io.BytesIO(CONTENT))
+    http_handler.content = buffer.getvalue()
+
+    sha256 = hashlib.sha256(http_handler.content).hexdigest()
+    downloader = FileDownloader(file_url, tmp_path, sha256=sha256)
+    downloader.stream(lambda fileobj: unpack_tar_stream(fileobj, tmp_path))
+
+    assert (tmp_path / "pkg/bin/tool").read_bytes() == CONTENT
+    assert not downloader.destination.exists()
@@ -0,0 +1,32 @@
+"""
+  Tests of the flash sector diff.
+"""
+
+from apio.managers.flash_diff import changed_ranges
+
+
+def test_changed_ranges():
+    """Test the ranges to write for different bitstream changes."""
+
+    old = bytes(10 * 16)
+
+    # -- Nothing changed.
+    assert not changed_ranges(old, old, sector_size=16)
+
+    # -- A single byte in the third sector.
+    new = bytearray(old)
+    new[40] = 1
+    assert changed_ranges(old, bytes(new), sector_size=16) == [(32, 16)]
+
+    # -- A longer bitstream, with a partial last sector.
+    new = old + b"\x01" * 20
+    assert changed_ranges(old, new, sector_size=16) == [(160, 20)]
+
+    # -- Too many changed sectors, the nearest are merged.
+    new = bytearray(old)
+    for i in (0, 2, 3, 8):
+        new[i * 16] = 1
+    assert changed_ranges(old, bytes(new), sector_size=16, max_ranges=2) == [
+        (0, 64),
+        (128, 16),
+    ]
@@ -0,0 +1,28 @@
+"""
+  Tests of the package installer helpers.
+"""
+
+import pytest
+from apio.managers.installer import _dedup_package_specs
+
+# -- The tests exercise the installer internals directly.
+# pylint: disable=protected-access
+
+
+def test_dedup_package_specs():
+    """Test that a package given more than once is installed once."""
+
+    specs = [
+        ("oss-cad-suite", ""),
+        ("examples", "0.0.35"),
+        ("oss-cad-suite", ""),
+        ("examples", ""),
+    ]
+    assert _dedup_package_specs(specs) == [
+        ("oss-cad-suite", ""),
+        ("examples", "0.0.35"),
+    ]
+
+    # -- Conflicting versions are an error.
+    with pytest.raises(SystemExit):
+        _dedup_package_specs([("examples", "0.0.34"), ("examples", "0.0.35")])
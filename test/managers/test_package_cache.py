@@ -0,0 +1,50 @@
+"""
+  Tests of the package files cache and mirror.
+"""
+
+import hashlib
+from pathlib import Path
+import pytest
+from apio.managers import package_cache
+from apio.managers.package_cache import PackageCache
+
+FILE_NAME = "tools-oss-cad-suite-linux_x86_64-0.0.9.tar.gz"
+
+
+def test_package_cache(tmp_path: Path):
+    """Test adding and looking up package files."""
+
+    cache = PackageCache(tmp_path / "cache")
+    assert cache.lookup(FILE_NAME, None) is None
+
+    # -- An aborted write is not added.
+    with pytest.raises(KeyboardInterrupt):
+        with cache.writer(FILE_NAME) as writer:
+            writer.write(b"partial")
+            raise KeyboardInterrupt()
+    assert cache.lookup(FILE_NAME, None) is None
+
+    # -- Add a file, it's found by name and by content.
+    sha256 = hashlib.sha256(b"content").hexdigest()
+    with cache.lock(FILE_NAME):
+        with cache.writer(FILE_NAME) as writer:
+            writer.write(b"content")
+    blob = cache.lookup(FILE_NAME, None)
+    assert blob == cache.blobs_dir / f"{sha256}.tar.gz"
+    assert blob.read_bytes() == b"content"
+    assert cache.lookup("other-name.tar.gz", sha256) is not None
+    assert not list(cache.tmp_dir.iterdir())
+
+
+def test_package_mirror(tmp_path: Path, monkeypatch):
+    """Test finding package files in a file:// mirror."""
+
+    (tmp_path / FILE_NAME).write_bytes(b"content")
+    sha256 = hashlib.sha256(b"content").hexdigest()
+    (tmp_path / f"{FILE_NAME}.sha256").write_text(f"{sha256}  {FILE_NAME}\n")
+    monkeypatch.setenv("APIO_PACKAGES_MIRROR", tmp_path.as_uri())
+
+    mirror_file = package_cache.get_mirror_file(FILE_NAME)
+    assert mirror_file == tmp_path / FILE_NAME
+    assert package_cache.get_mirror_sha256(mirror_file) == sha256
+    assert package_cache.get_mirror_file("missing.zip") is None
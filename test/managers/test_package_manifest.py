@@ -0,0 +1,57 @@
+"""
+  Tests of the package manifests.
+"""
+
+import os
+from pathlib import Path
+from zipfile import ZipFile
+from apio.managers import package_manifest
+from apio.managers.unpacker import extract_members
+
+
+def test_verify_and_repair(tmp_path: Path):
+    """Test the detection and repair of damaged package files."""
+
+    # -- A package file and the package dir that was installed from it.
+    archive = tmp_path / "package.zip"
+    with ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("pkg/bin/tool", b"tool content")
+        zip_file.writestr("pkg/share/data.txt", b"data")
+    package_dir = tmp_path / "package"
+    with ZipFile(archive) as zip_file:
+        zip_file.extractall(tmp_path / "staging")
+    (tmp_path / "staging" / "pkg").rename(package_dir)
+
+    manifest = package_manifest.create_manifest(
+        package_dir, version="0.0.1", package_file=archive.name, prefix="pkg"
+    )
+    assert package_manifest.read_manifest(package_dir) == manifest
+    assert sorted(manifest.files) == ["bin/tool", "share/data.txt"]
+    for deep in (False, True):
+        assert not package_manifest.verify_package(
+            package_dir, manifest, deep=deep
+        )
+
+    # -- Damage a file without changing its size and modification time,
+    # -- only the deep check detects it, and delete another one.
+    tool = package_dir / "bin/tool"
+    stat = tool.stat()
+    tool.write_bytes(b"tool CONTENT")
+    os.utime(tool, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    (package_dir / "share/data.txt").unlink()
+    assert package_manifest.verify_package(
+        package_dir, manifest, deep=False
+    ) == ["share/data.txt"]
+    damaged = package_manifest.verify_package(package_dir, manifest, deep=True)
+    assert damaged == ["bin/tool", "share/data.txt"]
+
+    # -- Repair the damaged files from the package file.
+    assert extract_members(archive, package_dir, "pkg", set(damaged)) == set(
+        damaged
+    )
+    assert not package_manifest.update_manifest(package_dir, manifest, damaged)
+    assert tool.read_bytes() == b"tool content"
+    manifest = package_manifest.read_manifest(package_dir)
+    assert not package_manifest.verify_package(
+        package_dir, manifest, deep=False
+    )
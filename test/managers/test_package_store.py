@@ -0,0 +1,64 @@
+"""
+  Tests of the package files store.
+"""
+
+from pathlib import Path
+import shutil
+from apio.managers import package_manifest
+from apio.managers.package_store import PackageStore
+
+
+def test_package_store(tmp_path: Path):
+    """Test sharing files between package versions and the gc."""
+
+    store = PackageStore(tmp_path / "store")
+
+    # -- Two versions of a package that share a file.
+    for version, content in (("1", b"old"), ("2", b"new")):
+        package_dir = tmp_path / version
+        (package_dir / "bin").mkdir(parents=True)
+        (package_dir / "bin/shared").write_bytes(b"shared content")
+        (package_dir / "bin/tool").write_bytes(b"tool " + content)
+        manifest = package_manifest.create_manifest(
+            package_dir, version=version, package_file="", prefix=""
+        )
+        store.intern(package_dir, manifest)
+        assert not package_manifest.verify_package(
+            package_dir, manifest, deep=False
+        )
+
+    assert (tmp_path / "1/bin/shared").samefile(tmp_path / "2/bin/shared")
+    assert not (tmp_path / "1/bin/tool").samefile(tmp_path / "2/bin/tool")
+    assert store.gc() == (0, 0)
+
+    # -- After a version is deleted, only its own files are deleted.
+    shutil.rmtree(tmp_path / "1")
+    assert store.gc() == (1, len(b"tool old"))
+    assert (tmp_path / "2/bin/shared").read_bytes() == b"shared content"
+
+
+def test_package_store_damaged_object(tmp_path: Path):
+    """Test that an object that was edited in place, without changing its
+    size, is not reused."""
+
+    store = PackageStore(tmp_path / "store")
+
+    def install(version: str) -> Path:
+        package_dir = tmp_path / version
+        package_dir.mkdir()
+        (package_dir / "tool").write_bytes(b"tool content")
+        manifest = package_manifest.create_manifest(
+            package_dir, version=version, package_file="", prefix=""
+        )
+        store.intern(package_dir, manifest)
+        return package_dir / "tool"
+
+    # -- Editing the file of version 1 edits its object too.
+    tool1 = install("1")
+    tool1.write_bytes(b"tool CONTENT")
+
+    # -- Version 2 keeps its own good file, which replaces the object.
+    tool2 = install("2")
+    assert tool2.read_bytes() == b"tool content"
+    assert not tool2.samefile(tool1)
+    assert install("3").samefile(tool2)
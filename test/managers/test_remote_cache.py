@@ -0,0 +1,34 @@
+"""
+  Tests of the remote metadata cache.
+"""
+
+import time
+from pathlib import Path
+import pytest
+from apio.managers import remote_cache
+
+
+def test_remote_cache(tmp_path: Path, http_handler, monkeypatch):
+    """Test the caching, revalidation and offline mode."""
+
+    monkeypatch.setenv("APIO_HOME_DIR", str(tmp_path))
+    http_handler.content = b"0.0.9\n"
+    url = f"{http_handler.url}/VERSION"
+
+    def extract(text):
+        return text.rstrip("\n")
+
+    # -- Not cached yet.
+    with pytest.raises(IOError):
+        remote_cache.fetch(url, offline=True)
+
+    # -- Fetched once, then served from the cache.
+    assert remote_cache.fetch(url, offline=False, extract=extract) == "0.0.9"
+    assert remote_cache.fetch(url, offline=False) == "0.0.9"
+    assert remote_cache.fetch(url, offline=True) == "0.0.9"
+    assert http_handler.full_responses == 1
+
+    # -- Once expired, it's revalidated with a conditional request.
+    monkeypatch.setattr(time, "time", lambda: 1e12)
+    assert remote_cache.fetch(url, offline=False) == "0.0.9"
+    assert http_handler.full_responses == 1
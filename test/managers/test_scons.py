@@ -0,0 +1,209 @@
+"""
+  Tests of the selection of the devices to upload to.
+"""
+
+import json
+from types import SimpleNamespace
+import pytest
+from apio.managers import scons as scons_module
+from apio.managers.scons import (
+    SCons,
+    SERIAL_PORT,
+    FTDI_ID,
+    ALL_CONNECTED,
+    SRAM,
+    SKIP_UNCHANGED,
+    READBACK,
+    INCREMENTAL,
+)
+
+# -- The tests exercise the device selection internals directly.
+# pylint: disable=protected-access
+
+# -- The info of a board with an FTDI programmer, as in boards.json.
+FTDI_BOARD_INFO = {
+    "ftdi": {"desc": "Alhambra II"},
+    "programmer": {"type": "iceprog"},
+}
+
+
+def _make_scons(**attrs) -> SCons:
+    """Returns an SCons manager with the given attributes, without
+    loading the resources."""
+    scons = SCons.__new__(SCons)
+    for name, value in attrs.items():
+        setattr(scons, name, value)
+    return scons
+
+
+def test_split_devices():
+    """Test the parsing of the comma separated device lists."""
+
+    assert SCons._split_devices(None) is None
+    assert SCons._split_devices("") is None
+    assert SCons._split_devices("1") == ["1"]
+    assert SCons._split_devices("0, 2") == ["0", "2"]
+
+
+def test_select_devices():
+    """Test the selection of the connected devices."""
+
+    devices = ["0", "1", "2"]
+    assert SCons._select_devices("b", devices, None, False) == ["0"]
+    assert SCons._select_devices("b", devices, None, True) == devices
+    assert SCons._select_devices("b", devices, ["2", "0"], False) == [
+        "2",
+        "0",
+    ]
+
+    with pytest.raises(ConnectionError, match="not connected at 3, 4"):
+        SCons._select_devices("b", devices, ["1", "3", "4"], False)
+    with pytest.raises(ConnectionError, match="board b not connected"):
+        SCons._select_devices("b", [], None, True)
+
+
+def test_get_ftdi_ids():
+    """Test the selection of the FTDI devices that match the board."""
+
+    ftdi_devices = [
+        {"index": "0", "description": "Alhambra II"},
+        {"index": "1", "description": "Dual RS232-HS"},
+        {"index": "2", "description": "Alhambra II"},
+    ]
+    scons = _make_scons(
+        devices=SimpleNamespace(ftdi_devices=lambda: ftdi_devices)
+    )
+
+    def get_ftdi_ids(ext_ftdi_ids, all_connected):
+        return scons._get_ftdi_ids(
+            "alhambra-ii", FTDI_BOARD_INFO, ext_ftdi_ids, all_connected
+        )
+
+    assert get_ftdi_ids(None, False) == ["0"]
+    assert get_ftdi_ids(None, True) == ["0", "2"]
+    assert get_ftdi_ids(["2"], False) == ["2"]
+
+    # -- Device 1 is connected but it's not an Alhambra II.
+    with pytest.raises(ConnectionError, match="not connected at 1"):
+        get_ftdi_ids(["0", "1"], False)
+
+
+def test_tinyprog_libusb_devices(monkeypatch: pytest.MonkeyPatch):
+    """Test that tinyprog on macOS, which selects the device by itself,
+    rejects an upload to several devices."""
+
+    board_info = {"tinyprog": {"desc": "TinyFPGA BX"}}
+    scons = _make_scons(
+        resources=SimpleNamespace(
+            boards={"TinyFPGA-BX": board_info},
+            platform_id="darwin_arm64",
+            is_darwin=lambda: True,
+        )
+    )
+    monkeypatch.setattr(scons, "_check_pip_packages", lambda _: None)
+
+    prog = {SERIAL_PORT: None, FTDI_ID: None, ALL_CONNECTED: False}
+    assert scons._get_programmer("TinyFPGA-BX", prog) == {
+        "": "tinyprog --libusb --program"
+    }
+
+    for prog_changes in ({ALL_CONNECTED: True}, {SERIAL_PORT: "/dev/a,b"}):
+        with pytest.raises(ValueError, match="several TinyFPGA boards"):
+            scons._get_programmer("TinyFPGA-BX", dict(prog, **prog_changes))
+
+
+def test_get_device_ids():
+    """Test the USB ids of the devices, which key their upload records."""
+
+    ftdi_devices = [
+        {"index": "0", "description": "Alhambra II", "serial": "FT01"},
+        {"index": "1", "description": "Alhambra II", "serial": None},
+    ]
+    usb_serials = {"0403:6010": ["FT01", None]}
+    board_info = dict(FTDI_BOARD_INFO, usb={"vid": "0403", "pid": "6010"})
+    scons = _make_scons(
+        resources=SimpleNamespace(boards={"alhambra-ii": board_info}),
+        devices=SimpleNamespace(
+            ftdi_devices=lambda: ftdi_devices,
+            usb_serial_numbers=usb_serials.get,
+        ),
+    )
+    programmers = {"ftdi 0": "iceprog -d 0", "ftdi 1": "iceprog -d 1"}
+    assert scons._get_device_ids("alhambra-ii", programmers) == {
+        "ftdi 0": "0403:6010 FT01"
+    }
+
+    # -- Without a serial number from lsftdi, a device is identified only
+    # -- if it's the only one with the vid:pid of the board.
+    programmers = {"ftdi 1": "iceprog -d 1"}
+    assert not scons._get_device_ids("alhambra-ii", programmers)
+    usb_serials["0403:6010"] = ["FT02"]
+    assert scons._get_device_ids("alhambra-ii", programmers) == {
+        "ftdi 1": "0403:6010 FT02"
+    }
+
+
+def test_upload_flags(monkeypatch: pytest.MonkeyPatch, capsys):
+    """Test the scons flags of the flash checks and partial writes of an
+    upload."""
+
+    boards = {
+        "alhambra-ii": {"programmer": {"type": "iceprog"}},
+        "ulx3s-85f": {"programmer": {"type": "openfpgaloader_ft2232"}},
+    }
+    programmers = {
+        "iceprog": {"check_args": "-c", "offset_args": "-o ${OFFSET}"},
+        "openfpgaloader_ft2232": {},
+    }
+    scons = _make_scons(
+        resources=SimpleNamespace(boards=boards, programmers=programmers),
+        project=None,
+    )
+    monkeypatch.setattr(
+        scons_module,
+        "process_arguments",
+        lambda config, *_: ([], config["board"], "ice40"),
+    )
+    monkeypatch.setattr(
+        scons, "_get_programmer", lambda *_: {"": "prog $SOURCE"}
+    )
+    monkeypatch.setattr(scons, "_get_device_ids", lambda *_: {})
+    flags = []
+    monkeypatch.setattr(
+        scons, "_run", lambda *_, variables, **__: flags.extend(variables)
+    )
+
+    def get_prog(**prog_changes) -> dict:
+        prog = {SRAM: False, SKIP_UNCHANGED: False, READBACK: False}
+        prog[INCREMENTAL] = False
+        return dict(prog, **prog_changes)
+
+    def upload(board: str, **prog_changes) -> dict:
+        flags.clear()
+        scons.upload({"board": board}, get_prog(**prog_changes))
+        return dict(flag.split("=", 1) for flag in flags)
+
+    # -- The checks are passed once, also when both need them.
+    changes = {SKIP_UNCHANGED: True, READBACK: True, INCREMENTAL: True}
+    result = upload("alhambra-ii", **changes)
+    assert [f for f in flags if f.startswith("prog_checks=")] == [
+        'prog_checks={"": "prog -c $SOURCE"}'
+    ]
+    assert json.loads(result["prog_partials"]) == {
+        "": "prog -o ${OFFSET} $SOURCE"
+    }
+    assert "prog_checks" not in upload("alhambra-ii")
+
+    # -- The SRAM is never written incrementally.
+    result = upload("alhambra-ii", **{INCREMENTAL: True, SRAM: True})
+    assert "prog_checks" not in result and "prog_partials" not in result
+    assert "--incremental is ignored when programming the SRAM" in (
+        capsys.readouterr().out
+    )
+
+    # -- openFPGALoader can't compare the flash without writing it.
+    prog = get_prog(**{INCREMENTAL: True})
+    flags.clear()
+    assert scons.upload({"board": "ulx3s-85f"}, prog) == 1
+    assert "--incremental is not supported" in capsys.readouterr().out
+    assert not flags
@@ -0,0 +1,172 @@
+"""
+  Tests of the scons build server.
+"""
+
+import sys
+import socket
+from pathlib import Path
+from threading import Thread
+import pytest
+from apio.managers import scons_daemon
+
+# -- The tests exercise the server internals directly.
+# pylint: disable=protected-access
+
+# -- A stand in for 'scons --interactive' that understands the 'build',
+# -- 'shell' and 'exit' commands that the server sends. Building the target
+# -- 'bad' fails like scons does.
+FAKE_SCONS = """
+import sys, subprocess
+while True:
+    sys.stdout.write("scons>>> ")
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+    cmd, _, arg = line.strip().partition(" ")
+    if cmd == "build" and arg == "bad":
+        print("scons: *** [bad] Error 1", file=sys.stderr, flush=True)
+    elif cmd == "build":
+        print(f"built {arg}", flush=True)
+    elif cmd == "shell":
+        subprocess.run(arg, shell=True, check=False)
+    else:
+        break
+"""
+
+
+def test_fingerprint(tmp_path: Path):
+    """Test that the fingerprint changes only with the files that affect
+    the SConstruct graph."""
+
+    (tmp_path / "apio.ini").write_text("[env]\nboard = icezum\n")
+    (tmp_path / "main.v").write_text("module main(); endmodule\n")
+    fingerprint = scons_daemon.compute_fingerprint(tmp_path)
+
+    # -- Editing a verilog file is handled by scons itself.
+    (tmp_path / "main.v").write_text("module main(); wire x; endmodule\n")
+    assert scons_daemon.compute_fingerprint(tmp_path) == fingerprint
+
+    # -- Adding a verilog file or changing apio.ini invalidates it.
+    (tmp_path / "lib.v").write_text("module lib(); endmodule\n")
+    fingerprint2 = scons_daemon.compute_fingerprint(tmp_path)
+    assert fingerprint2 != fingerprint
+    (tmp_path / "apio.ini").write_text("[env]\nboard = alhambra-ii\n")
+    assert scons_daemon.compute_fingerprint(tmp_path) != fingerprint2
+
+
+def test_session_exit_code(tmp_path: Path):
+    """Test the output and exit code of the builds of a session."""
+
+    fake_scons = tmp_path / "fake_scons.py"
+    fake_scons.write_text(FAKE_SCONS)
+    session = scons_daemon._Session(
+        [sys.executable, str(fake_scons)], {"PATH": ""}
+    )
+    try:
+        lines = []
+        assert session.run("good", lambda *x: lines.append(x)) == 0
+        assert lines == [("out", "built good")]
+
+        lines.clear()
+        assert session.run("bad", lambda *x: lines.append(x)) == 1
+        assert lines == [("err", "scons: *** [bad] Error 1")]
+    finally:
+        session.close()
+    assert not session.is_alive()
+
+
+class FakeSession:
+    """A session that doesn't run scons."""
+
+    def __init__(self, scons_argv, env):
+        self.scons_argv = scons_argv
+        self.env = env
+        self.closed = False
+
+    def is_alive(self):
+        """The session is alive until closed."""
+        return not self.closed
+
+    def close(self):
+        """Closes the session."""
+        self.closed = True
+
+
+def test_session_reuse(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that the sessions are reused by command line and discarded when
+    the project files change."""
+
+    monkeypatch.setattr(scons_daemon, "_Session", FakeSession)
+    (tmp_path / "apio.ini").write_text("[env]\nboard = icezum\n")
+    server = scons_daemon._Server(tmp_path, "token")
+    try:
+        request = {"command": "build", "variables": ["a=1"], "env": {}}
+        session, target = server.get_session(request)
+        assert target == "build"
+        assert server.get_session(request)[0] is session
+
+        # -- A different command line has its own session.
+        other = dict(request, variables=["a=2"])
+        assert server.get_session(other)[0] is not session
+
+        # -- Only the env vars that affect the build select the session.
+        env = {"PATH": "/bin", "APIO_HOME_DIR": "/h", "TERM": "xterm"}
+        with_env = dict(request, env=env)
+        session = server.get_session(with_env)[0]
+        env2 = dict(env, TERM="vt100", WINDOWID="7")
+        assert server.get_session(dict(request, env=env2))[0] is session
+        for name in ("PATH", "APIO_HOME_DIR", "YOSYS_LIB"):
+            other_env = dict(env, **{name: "/other"})
+            other = server.get_session(dict(request, env=other_env))[0]
+            assert other is not session
+
+        # -- A new verilog file discards all the sessions.
+        (tmp_path / "main.v").write_text("module main(); endmodule\n")
+        assert server.get_session(request)[0] is not session
+        assert session.closed
+    finally:
+        server.server_close()
+
+
+def test_sessions_limit(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that the least recently used session is closed when there are
+    too many sessions."""
+
+    monkeypatch.setattr(scons_daemon, "_Session", FakeSession)
+    monkeypatch.setattr(scons_daemon, "MAX_SESSIONS", 2)
+    server = scons_daemon._Server(tmp_path, "token")
+    try:
+
+        def get_session(variable: str) -> FakeSession:
+            request = {"command": "build", "variables": [variable], "env": {}}
+            return server.get_session(request)[0]
+
+        session1 = get_session("a=1")
+        session2 = get_session("a=2")
+        assert get_session("a=1") is session1
+
+        # -- Session 2 is now the least recently used one.
+        session3 = get_session("a=3")
+        assert session2.closed
+        assert not session1.closed and not session3.closed
+        assert list(server.sessions.values()) == [session1, session3]
+    finally:
+        server.server_close()
+
+
+def test_token_check(tmp_path: Path):
+    """Test that the server ignores requests with a wrong token."""
+
+    server = scons_daemon._Server(tmp_path, "token")
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        port = server.server_address[1]
+        with socket.create_connection(("127.0.0.1", port), 2) as sock:
+            request = {"op": "stop", "token": "wrong"}
+            assert scons_daemon._request(sock, request, print, print) is None
+
+        with socket.create_connection(("127.0.0.1", port), 2) as sock:
+            request = {"op": "stop", "token": "token"}
+            assert scons_daemon._request(sock, request, print, print) == 0
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,152 @@
+"""
+  Tests of the scons output filter.
+"""
+
+import json
+from apio import events
+from apio.managers.scons_filter import SconsFilter
+
+
+def test_scons_filter(capsys):
+    """Test the filtering of a nextpnr verbose log."""
+
+    scons_filter = SconsFilter()
+    scons_filter.on_stdout_line("nextpnr-ice40 --hx1k --json hardware.json")
+    scons_filter.on_stderr_line("Info: Packing constants..")
+    scons_filter.on_stderr_line("Warning: unused net")
+    scons_filter.on_stderr_line("Program finished normally.")
+    scons_filter.on_stdout_line("hardware.bin is up to date.")
+    scons_filter.flush()
+
+    assert capsys.readouterr().out.splitlines() == [
+        "nextpnr-ice40 --hx1k --json hardware.json",
+        "Packing constants..",
+        "Warning: unused net",
+        "Program finished normally.",
+        "hardware.bin is up to date.",
+    ]
+
+
+def test_scons_filter_events(capsys):
+    """Test the json events of the filter."""
+
+    events.enable()
+    try:
+        scons_filter = SconsFilter()
+        scons_filter.on_stdout_line("nextpnr-ice40 --hx1k --json x.json")
+        scons_filter.on_stderr_line("Info: Packing constants..")
+        scons_filter.on_stderr_line("ERROR: Unable to place cell 'x'")
+        scons_filter.on_stderr_line("Program finished normally.")
+        scons_filter.on_stderr_line("main.v:5: syntax error")
+        scons_filter.flush()
+    finally:
+        events.disable()
+
+    records = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ]
+    for record in records:
+        del record["time"]
+    assert records[0] == {"event": "tool_start", "tool": "nextpnr"}
+    assert records[1] == {
+        "event": "output",
+        "stream": "stdout",
+        "tool": None,
+        "text": "nextpnr-ice40 --hx1k --json x.json",
+    }
+    assert {
+        "event": "diagnostic",
+        "severity": "error",
+        "message": "Unable to place cell 'x'",
+        "tool": "nextpnr",
+    } in records
+    assert {"event": "tool_end", "tool": "nextpnr"} in records
+    assert records[-2] == {
+        "event": "diagnostic",
+        "severity": "error",
+        "message": "syntax error",
+        "tool": None,
+        "file": "main.v",
+        "line": 5,
+    }
+
+
+def test_scons_filter_located_diagnostics(capsys):
+    """Test that a location without a severity is an error only in the
+    output of iverilog or of an unknown tool."""
+
+    events.enable()
+    try:
+        scons_filter = SconsFilter()
+        scons_filter.on_stdout_line("iverilog -o main.out main.v")
+        scons_filter.on_stderr_line("main.v:5: syntax error")
+        scons_filter.on_stdout_line("nextpnr-ice40 --hx1k --json x.json")
+        scons_filter.on_stderr_line("Info: constrained 'x' to bel 'X0/Y0'")
+        scons_filter.on_stderr_line("main.pcf:3: ignored")
+        scons_filter.on_stderr_line("Program finished normally.")
+        scons_filter.flush()
+    finally:
+        events.disable()
+
+    records = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ]
+    diagnostics = [r for r in records if r["event"] == "diagnostic"]
+    for record in diagnostics:
+        del record["time"]
+    assert diagnostics == [
+        {
+            "event": "diagnostic",
+            "severity": "error",
+            "message": "syntax error",
+            "tool": "iverilog",
+            "file": "main.v",
+            "line": 5,
+        }
+    ]
+    tools = [r["tool"] for r in records if r["event"] == "tool_start"]
+    assert tools == ["iverilog", "nextpnr"]
+
+
+def test_scons_filter_upload_progress(capsys):
+    """Test the in place update of the parallel upload progress line."""
+
+    scons_filter = SconsFilter()
+    scons_filter.on_stdout_line("Upload progress: ftdi 0: 10%, ftdi 1: done")
+    scons_filter.on_stdout_line("Upload progress: ftdi 0: done, ftdi 1: done")
+    scons_filter.on_stdout_line("")
+    scons_filter.flush()
+
+    assert capsys.readouterr().out == (
+        "Upload progress: ftdi 0: 10%, ftdi 1: done\n"
+        "\033[F\033[K"
+        "Upload progress: ftdi 0: done, ftdi 1: done\n"
+        "\n"
+    )
+
+
+def test_scons_filter_upload_progress_events(capsys):
+    """Test the progress events of a parallel upload to several devices."""
+
+    events.enable()
+    try:
+        scons_filter = SconsFilter()
+        for line in (
+            "Upload progress: ftdi 0: waiting, ftdi 1: waiting",
+            "Upload progress: ftdi 0: 5%, ftdi 1: waiting",
+            "Upload progress: ftdi 0: 5%, ftdi 1: 40%",
+            "Upload progress: ftdi 0: 100%, ftdi 1: done",
+        ):
+            scons_filter.on_stdout_line(line)
+        scons_filter.flush()
+    finally:
+        events.disable()
+
+    records = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ]
+    assert [(r["event"], r["device"], r["percent"]) for r in records] == [
+        ("progress", "ftdi 0", 5),
+        ("progress", "ftdi 1", 40),
+        ("progress", "ftdi 0", 100),
+    ]
@@ -0,0 +1,55 @@
+"""
+  Tests of the package files unpacker.
+"""
+
+import os
+import sys
+from pathlib import Path
+from zipfile import ZipFile, ZipInfo
+from apio.managers.unpacker import ParallelZipExtractor
+
+
+def _add(zip_file: ZipFile, name: str, data: bytes, mode: int) -> None:
+    """Adds a file with the given permissions to the zip file."""
+    info = ZipInfo(name)
+    info.external_attr = (0o100000 | mode) << 16
+    zip_file.writestr(info, data)
+
+
+def test_parallel_zip_extractor(tmp_path: Path):
+    """Test the parallel extraction of a zip file."""
+
+    archive = tmp_path / "package.zip"
+    with ZipFile(archive, "w") as zip_file:
+        _add(zip_file, "pkg/bin/tool", b"tool", 0o755)
+        _add(zip_file, "pkg/lib/a.dll", b"dll", 0o644)
+        _add(zip_file, "pkg/bin/a.dll", b"dll", 0o644)
+        _add(zip_file, "pkg/.gitignore", b"", 0o644)
+        _add(zip_file, "../outside", b"x", 0o644)
+        for i in range(200):
+            _add(zip_file, f"pkg/share/file{i}", str(i).encode(), 0o644)
+
+    progress = []
+    dest_dir = tmp_path / "out"
+    ParallelZipExtractor(archive, jobs=4, hardlink_duplicates=True).extract(
+        dest_dir, progress.append
+    )
+
+    # -- All the members are reported.
+    assert sum(progress) == 205
+    assert (dest_dir / "pkg/bin/tool").read_bytes() == b"tool"
+    assert (dest_dir / "pkg/share/file123").read_bytes() == b"123"
+    assert not (dest_dir / "pkg/.gitignore").exists()
+
+    # -- Members with '..' are extracted within the dest dir.
+    assert (dest_dir / "outside").is_file()
+    assert not (tmp_path / "outside").exists()
+
+    # -- Identical files are hardlinked.
+    assert (dest_dir / "pkg/bin/a.dll").read_bytes() == b"dll"
+    assert os.path.samefile(
+        dest_dir / "pkg/bin/a.dll", dest_dir / "pkg/lib/a.dll"
+    )
+
+    if sys.platform != "win32":
+        assert (dest_dir / "pkg/bin/tool").stat().st_mode & 0o777 == 0o755
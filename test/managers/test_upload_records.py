@@ -0,0 +1,49 @@
+"""
+  Tests of the records of the uploaded bitstreams.
+"""
+
+from pathlib import Path
+import pytest
+from apio.managers import upload_records
+
+
+def test_upload_records(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test the records and that only the copies of the recorded
+    bitstreams are kept."""
+
+    monkeypatch.setenv("APIO_HOME_DIR", str(tmp_path))
+    bitstreams = {}
+    for name in ("a", "b", "c"):
+        bitstreams[name] = tmp_path / f"{name}.bin"
+        bitstreams[name].write_bytes(name.encode() * 100)
+    copies_dir = tmp_path / "uploads"
+
+    def record(device_id: str, name: str) -> None:
+        upload_records.set_uploaded_bitstream(
+            device_id, str(bitstreams[name]), f"hash-{name}"
+        )
+
+    assert upload_records.get_uploaded_hash("dev1") is None
+    assert upload_records.get_uploaded_bitstream("dev1") is None
+
+    record("dev1", "a")
+    record("dev2", "a")
+    assert upload_records.get_uploaded_hash("dev1") == "hash-a"
+    assert upload_records.get_uploaded_bitstream("dev2") == b"a" * 100
+    assert sorted(p.name for p in copies_dir.iterdir()) == ["hash-a.bin"]
+
+    # -- The copy of 'a' is kept while a device still has it.
+    record("dev1", "b")
+    assert sorted(p.name for p in copies_dir.iterdir()) == [
+        "hash-a.bin",
+        "hash-b.bin",
+    ]
+
+    # -- Once no device has 'a', its copy is deleted.
+    record("dev2", "c")
+    assert sorted(p.name for p in copies_dir.iterdir()) == [
+        "hash-b.bin",
+        "hash-c.bin",
+    ]
+    assert upload_records.get_uploaded_bitstream("dev1") == b"b" * 100
+    assert upload_records.get_uploaded_bitstream("dev2") == b"c" * 100
@@ -0,0 +1,486 @@
+"""
+  Tests of the scons utilities, run in scons processes.
+"""
+
+import os
+import json
+import re
+import dataclasses
+import sys
+import subprocess
+from pathlib import Path
+import pytest
+from SCons.Environment import Environment
+from apio.managers import flash_diff
+from apio.scons.scons_util import (
+    make_pnr_action,
+    make_upload_action,
+    UploadConfig,
+    DeviceCommands,
+    _upload_to_device,
+)
+
+# -- Some tests exercise the upload internals directly.
+# pylint: disable=protected-access
+
+# -- A project that copies a file, with the copy in the artifacts cache.
+CACHE_SCONSTRUCT = """
+from SCons.Script import ARGUMENTS
+from apio.scons.scons_util import (
+    create_construction_env,
+    set_up_artifacts_cache,
+)
+
+env = create_construction_env(ARGUMENTS)
+out = env.Command("out.txt", "in.txt", "cp $SOURCE $TARGET")
+set_up_artifacts_cache(env, out)
+"""
+
+
+def run_scons(project_dir: Path, sconstruct: str, *args: str) -> str:
+    """Runs scons with the given SConstruct in the given dir and returns
+    its output."""
+    (project_dir / "SConstruct").write_text(sconstruct)
+    result = subprocess.run(
+        [sys.executable, "-m", "SCons", "-Q", "platform_id=linux_x86_64"]
+        + list(args),
+        cwd=project_dir,
+        capture_output=True,
+        encoding="utf-8",
+        check=True,
+    )
+    return result.stdout
+
+
+def test_artifacts_cache(tmp_path: Path):
+    """Test the retrieve, push and prune of the build artifacts cache."""
+
+    cache_dir = tmp_path / "cache"
+    cache_arg = f"cache_dir={cache_dir}"
+    project1 = tmp_path / "project1"
+    project2 = tmp_path / "project2"
+    for project_dir in (project1, project2):
+        project_dir.mkdir()
+        (project_dir / "in.txt").write_text("content")
+
+    # -- The first build pushes the output, a second project retrieves it.
+    output = run_scons(
+        project1, CACHE_SCONSTRUCT, cache_arg, "toolchain_version=1"
+    )
+    assert "Build cache miss: out.txt" in output
+    assert list(cache_dir.glob("*/*"))
+    output = run_scons(
+        project2, CACHE_SCONSTRUCT, cache_arg, "toolchain_version=1"
+    )
+    assert "Build cache hit: out.txt" in output
+    assert (project2 / "out.txt").read_text() == "content"
+
+    # -- A different toolchain is a different key.
+    output = run_scons(
+        project2, CACHE_SCONSTRUCT, cache_arg, "toolchain_version=2"
+    )
+    assert "Build cache miss: out.txt" in output
+    assert len(list(cache_dir.glob("*/*"))) == 2
+
+    # -- With a zero size, the cache is pruned when scons exits.
+    (project1 / "out.txt").unlink()
+    output = run_scons(
+        project1,
+        CACHE_SCONSTRUCT,
+        cache_arg,
+        "toolchain_version=1",
+        "cache_max_mb=0",
+    )
+    assert "Build cache hit: out.txt" in output
+    assert not list(cache_dir.glob("*/*"))
+
+
+# -- A stand in for nextpnr that writes its output file and a report with
+# -- a fmax margin that depends on the seed. Seed 3 fails and seed 4 writes
+# -- a corrupt report.
+FAKE_NEXTPNR = """
+import sys, json
+out_file, report_file, _, seed = sys.argv[1:]
+if seed == "3":
+    sys.exit(1)
+with open(out_file, "w") as f:
+    f.write(f"seed {seed}")
+with open(report_file, "w") as f:
+    if seed == "4":
+        f.write("{")
+    else:
+        margin = {"1": 1.0, "2": 5.0}[seed]
+        fmax = {"clk": {"achieved": 10 + margin, "constraint": 10}}
+        json.dump({"fmax": fmax}, f)
+"""
+
+
+def test_multi_seed_pnr(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys
+):
+    """Test the selection of the best placement and the promotion of its
+    files."""
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "fake_nextpnr.py").write_text(FAKE_NEXTPNR)
+    env = Environment(ENV=os.environ, tools=[], FORCE_COLORS=False)
+    action = make_pnr_action(
+        env, f'"{sys.executable}" fake_nextpnr.py $TARGETS', 4
+    )
+    target = [env.File("hardware.asc"), env.File("hardware.pnr")]
+    assert action.execute(target, [env.File("hardware.json")], env) == 0
+
+    # -- Seed 2 has the best margin, the failed and corrupt ones are shown.
+    assert (tmp_path / "hardware.asc").read_text() == "seed 2"
+    output = capsys.readouterr().out
+    assert "+5.00 Mhz worst fmax margin  <- selected" in output
+    assert "seed 3: FAILED" in output
+    assert "seed 4: no timing constraints" in output
+
+
+# -- A project with three testbenches, run with fake iverilog and vvp
+# -- commands. The fake vvp prints its lines slowly, so the lines of the
+# -- testbenches that run in parallel would interleave if not grouped.
+TESTS_SCONSTRUCT = """
+import sys
+from SCons.Script import ARGUMENTS
+from apio.scons.scons_util import (
+    create_construction_env,
+    make_tests_target,
+    SimulationConfig,
+)
+
+env = create_construction_env(ARGUMENTS)
+python = f'"{sys.executable}"'
+
+
+def iverilog_generator(source, target, env, for_signature):
+    return f"{python} fake_iverilog.py $TARGET $SOURCES"
+
+
+configs = [
+    SimulationConfig(name, [name + ".v"])
+    for name in ("bad_tb", "good1_tb", "good2_tb")
+]
+make_tests_target(
+    env, configs, iverilog_generator, f"{python} fake_vvp.py $SOURCE"
+)
+"""
+
+FAKE_IVERILOG = """
+import sys, shutil
+shutil.copyfile(sys.argv[2], sys.argv[1])
+"""
+
+FAKE_VVP = """
+import sys, time
+name = open(sys.argv[1]).read().strip()
+for i in range(3):
+    print(f"{name} line {i}", flush=True)
+    time.sleep(0.1)
+if name == "bad_tb":
+    print("bad_tb assertion failed")
+    sys.exit(1)
+"""
+
+
+def test_parallel_tests(tmp_path: Path):
+    """Test the grouped output, the summary and the exit code of testbenches
+    that run in parallel, one of them failing."""
+
+    (tmp_path / "fake_iverilog.py").write_text(FAKE_IVERILOG)
+    (tmp_path / "fake_vvp.py").write_text(FAKE_VVP)
+    for name in ("bad_tb", "good1_tb", "good2_tb"):
+        (tmp_path / f"{name}.v").write_text(name)
+    (tmp_path / ".apio").mkdir()
+    (tmp_path / "SConstruct").write_text(TESTS_SCONSTRUCT)
+    result = subprocess.run(
+        [sys.executable, "-m", "SCons", "-Q", "-j", "2"]
+        + ["platform_id=linux_x86_64", "test"],
+        cwd=tmp_path,
+        capture_output=True,
+        encoding="utf-8",
+        check=False,
+    )
+    # -- The 'test' alias fails with status 1, scons exits with 2 on any
+    # -- build error.
+    assert "scons: *** [test] Error 1" in result.stderr
+    assert result.returncode == 2
+    lines = result.stdout.splitlines()
+
+    # -- The lines of each testbench are consecutive.
+    for name in ("bad_tb", "good1_tb", "good2_tb"):
+        first = lines.index(f"{name} line 0")
+        end = first + 3
+        assert lines[first:end] == [f"{name} line {i}" for i in range(3)]
+    assert "bad_tb assertion failed" in lines
+
+    # -- The testbenches after the failed one were run too.
+    assert "TESTS:" in lines
+    assert any(re.match(r" +bad_tb: FAILED +[\d.]+ sec", s) for s in lines)
+    assert any(re.match(r" +good1_tb: PASSED", s) for s in lines)
+    assert any(re.match(r" +good2_tb: PASSED", s) for s in lines)
+    assert "Error: 1 of 3 testbenches failed." in lines
+
+    # -- The iverilog and vvp runs are in the build statistics.
+    actions_file = tmp_path / ".apio" / "build-actions.jsonl"
+    records = [json.loads(s) for s in actions_file.read_text().splitlines()]
+    assert len(records) == 6
+    assert sorted(r["exit_code"] for r in records) == [0, 0, 0, 0, 0, 1]
+
+
+# -- A project with a target that depends on a verilog file and on its
+# -- includes, as found by the verilog scanner.
+SCANNER_SCONSTRUCT = """
+from SCons.Script import Environment
+from apio.scons.scons_util import make_verilog_src_scanner
+
+env = Environment(tools=[], FORCE_COLORS=False)
+scanner = make_verilog_src_scanner(env)
+env.Command(
+    "out.txt", "main.v", "cat $SOURCE > $TARGET", source_scanner=scanner
+)
+"""
+
+
+def test_verilog_scanner(tmp_path: Path):
+    """Test that the verilog scanner follows includes transitively and
+    rescans the files that changed."""
+
+    (tmp_path / "main.v").write_text('`include "a.vh"\n')
+    (tmp_path / "a.vh").write_text('`include "b.vh"\n')
+    (tmp_path / "b.vh").write_text("// b\n")
+    index_file = tmp_path / ".apio" / "scanner-index.json"
+
+    # -- The first build indexes the files.
+    assert "cat main.v" in run_scons(tmp_path, SCANNER_SCONSTRUCT)
+    index = json.loads(index_file.read_text())["files"]
+    assert index["main.v"][2] == ["a.vh"]
+    assert index["a.vh"][2] == ["b.vh"]
+    assert "cat main.v" not in run_scons(tmp_path, SCANNER_SCONSTRUCT)
+
+    # -- A change in an include of an include rebuilds the target.
+    (tmp_path / "b.vh").write_text("// b changed\n")
+    assert "cat main.v" in run_scons(tmp_path, SCANNER_SCONSTRUCT)
+
+    # -- A modified file is rescanned, so its new include is tracked.
+    (tmp_path / "c.vh").write_text("// c\n")
+    (tmp_path / "main.v").write_text('`include "a.vh"\n`include "c.vh"\n')
+    assert "cat main.v" in run_scons(tmp_path, SCANNER_SCONSTRUCT)
+    index = json.loads(index_file.read_text())["files"]
+    assert index["main.v"][2] == ["a.vh", "c.vh"]
+    (tmp_path / "c.vh").write_text("// c changed\n")
+    assert "cat main.v" in run_scons(tmp_path, SCANNER_SCONSTRUCT)
+
+
+# -- A stand in for a programmer that reports its progress and fails for
+# -- the device 'bad'.
+FAKE_PROGRAMMER = """
+import sys
+bitstream, device = sys.argv[1:]
+print("50%", flush=True)
+if device == "bad":
+    print("Can't find the device", flush=True)
+    sys.exit(1)
+print("100%", flush=True)
+"""
+
+
+def test_multi_device_upload(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys
+):
+    """Test the summary and the exit code of an upload to several
+    devices."""
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "fake_prog.py").write_text(FAKE_PROGRAMMER)
+    (tmp_path / "hardware.bin").write_bytes(b"bitstream")
+    env = Environment(ENV=os.environ, tools=[], FORCE_COLORS=False)
+
+    def upload(*devices: str):
+        config = UploadConfig(
+            device_cmds={
+                f"dev {d}": f'"{sys.executable}" fake_prog.py $SOURCE {d}'
+                for d in devices
+            },
+            check_cmds={},
+            partial_cmds={},
+            skip_unchanged=False,
+            readback=False,
+            record=False,
+            device_ids={},
+        )
+        action = make_upload_action(env, config)
+        target = [env.Alias("upload")]
+        return action.execute(target, [env.File("hardware.bin")], env)
+
+    # -- All the uploads succeed.
+    assert upload("a", "b") == 0
+    output = capsys.readouterr().out
+    assert "UPLOADS:" in output
+    assert "dev a: OK" in output
+    assert "dev b: OK" in output
+    assert "failed" not in output
+
+    # -- A failed upload is reported with its output and fails the action.
+    # -- Scons wraps the exit code in a BuildError.
+    assert upload("a", "bad", "c").status == 1
+    output = capsys.readouterr().out
+    assert "Upload to dev bad failed:" in output
+    assert "  Can't find the device" in output
+    assert "dev bad: FAILED" in output
+    assert "dev c: OK" in output
+    assert "Error: 1 of 3 uploads failed." in output
+
+
+def test_single_device_readback(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capfd
+):
+    """Test that a readback of a flash that differs is not reported as a
+    scons error before the upload."""
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("APIO_HOME_DIR", str(tmp_path / "home"))
+    (tmp_path / "fake_prog.py").write_text(FAKE_PROGRAMMER)
+    (tmp_path / "hardware.bin").write_bytes(b"bitstream")
+    env = Environment(ENV=os.environ, tools=[], FORCE_COLORS=False)
+    prog = f'"{sys.executable}" fake_prog.py $SOURCE'
+    config = UploadConfig(
+        device_cmds={"dev a": f"{prog} a"},
+        check_cmds={"dev a": f"{prog} bad"},
+        partial_cmds={},
+        skip_unchanged=True,
+        readback=True,
+        record=True,
+        device_ids={},
+    )
+    action = make_upload_action(env, config)
+    target = [env.Alias("upload")]
+    assert action.execute(target, [env.File("hardware.bin")], env) == 0
+
+    # -- The output of the check is shown, followed by the upload.
+    output = capfd.readouterr()
+    assert "Can't find the device" in output.out
+    assert output.out.index("bad") < output.out.index(
+        "fake_prog.py hardware.bin a"
+    )
+    assert "scons: ***" not in output.out + output.err
+
+
+def test_upload_records(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that the uploads are recorded by the USB id of the devices and
+    that a device without one is skipped only if its flash is read
+    back."""
+
+    monkeypatch.setenv("APIO_HOME_DIR", str(tmp_path))
+    bitstream_file = tmp_path / "hardware.bin"
+    bitstream_file.write_bytes(b"bitstream")
+    device_cmds = DeviceCommands("upload", "check", None)
+    config = UploadConfig(
+        device_cmds={},
+        check_cmds={},
+        partial_cmds={},
+        skip_unchanged=True,
+        readback=False,
+        record=True,
+        device_ids={"ftdi 0": "0403:6010 FT01"},
+    )
+    cmds = []
+    check_ok = [True]
+
+    def upload(config: UploadConfig, device: str) -> str:
+        cmds.clear()
+
+        def run(cmd: str) -> bool:
+            cmds.append(cmd)
+            return check_ok[0] if cmd == "check" else True
+
+        return _upload_to_device(
+            config, device, device_cmds, str(bitstream_file), run
+        )
+
+    # -- The first upload is recorded, the second one is skipped.
+    assert upload(config, "ftdi 0") == "done"
+    assert upload(config, "ftdi 0") == "unchanged"
+    assert not cmds
+
+    # -- A device without a USB id is not recorded nor skipped.
+    assert upload(config, "ftdi 1") == "done"
+    assert upload(config, "ftdi 1") == "done"
+    assert cmds == ["upload"]
+
+    # -- With a readback, it's skipped if its flash has the bitstream.
+    config = dataclasses.replace(config, readback=True)
+    assert upload(config, "ftdi 1") == "unchanged"
+    assert cmds == ["check"]
+    check_ok[0] = False
+    assert upload(config, "ftdi 1") == "done"
+    assert cmds == ["check", "upload"]
+
+    # -- A recorded device is also uploaded if the readback fails.
+    assert upload(config, "ftdi 0") == "done"
+    assert cmds == ["check", "upload"]
+    records = json.loads((tmp_path / "uploads.json").read_text())
+    assert list(records["devices"]) == ["0403:6010 FT01"]
+
+
+def test_incremental_upload(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that only the changed flash sectors are written and that a
+    failed write or check falls back to a full upload."""
+
+    monkeypatch.setenv("APIO_HOME_DIR", str(tmp_path / "home"))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".apio").mkdir()
+    sector_size = flash_diff.SECTOR_SIZE
+    bitstream = bytearray(4 * sector_size)
+    bitstream_file = tmp_path / "hardware.bin"
+    bitstream_file.write_bytes(bitstream)
+    device_cmds = DeviceCommands("upload", "check", "write ${OFFSET} ${CHUNK}")
+    config = UploadConfig(
+        device_cmds={},
+        check_cmds={},
+        partial_cmds={},
+        skip_unchanged=False,
+        readback=False,
+        record=True,
+        device_ids={"ftdi 0": "0403:6010 FT01"},
+    )
+    cmds = []
+    failing = set()
+
+    def run(cmd: str) -> bool:
+        # -- Keep the written chunks, which are deleted after the upload.
+        op, *args = cmd.split()
+        if op == "write":
+            cmds.append((op, int(args[0]), Path(args[1]).read_bytes()))
+        else:
+            cmds.append(op)
+        return op not in failing
+
+    def upload() -> str:
+        cmds.clear()
+        return _upload_to_device(
+            config, "ftdi 0", device_cmds, str(bitstream_file), run
+        )
+
+    # -- Without a previous upload, the whole bitstream is written.
+    assert upload() == "done"
+    assert cmds == ["upload"]
+
+    # -- Only the changed sector is written, and then the flash checked.
+    bitstream[2 * sector_size + 5] = 1
+    bitstream_file.write_bytes(bitstream)
+    assert upload() == "incremental"
+    start, end = 2 * sector_size, 3 * sector_size
+    assert cmds == [("write", start, bytes(bitstream[start:end])), "check"]
+    assert not list((tmp_path / ".apio").iterdir())
+
+    # -- A failed check or write falls back to a full upload.
+    for op in ("check", "write"):
+        failing.clear()
+        failing.add(op)
+        bitstream[sector_size] += 1
+        bitstream_file.write_bytes(bitstream)
+        assert upload() == "done"
+        assert cmds[-1] == "upload"
+        assert ("check" in cmds) == (op == "check")
@@ -14,7 +14,9 @@ Test for command apio
 # --   pytest -v -s test/test_apio.py::test_apio
 # ------------------------------------------------------------------------
 
+from pathlib import Path
 from click.testing import CliRunner
+import apio.commands
 
 # -- Import the cli entry point: apio/__main__.py
 from apio.__main__ import cli as cmd_apio
@@ -61,3 +63,23 @@ def test_apio_wrong_command(clirunner: CliRunner, configenv):
 
         # -- Check the error message
         assert "Error: No such command" in result.output
+
+
+def test_apio_commands_registry():
+    """Test that every module in apio/commands is a registered apio
+    command, and vice versa."""
+
+    # -- The command modules, except for shared ones.
+    commands_dir = Path(apio.commands.__file__).parent
+    modules = {
+        path.stem
+        for path in commands_dir.glob("*.py")
+        if path.stem not in ("__init__", "options")
+    }
+
+    # -- The registered commands.
+    commands = cmd_apio.list_commands(None)
+
+    assert sorted(modules) == commands
+    for command in commands:
+        assert cmd_apio.get_command(None, command) is not None
@@ -0,0 +1,56 @@
+"""
+Tests of the resources snapshots of apio.resources
+"""
+
+import os
+import json
+from pathlib import Path
+import pytest
+from apio.resources import Resources
+
+# -- A custom boards.json of a project.
+BOARDS = {
+    "my-board": {
+        "name": "My board",
+        "fpga": "iCE40-HX1K-TQ144",
+        "programmer": {"type": "iceprog"},
+    }
+}
+
+
+def test_snapshots(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that the resource snapshots are used while the resource file
+    doesn't change and are ignored when they are corrupt."""
+
+    monkeypatch.setenv("APIO_HOME_DIR", str(tmp_path / "home"))
+    boards_file = tmp_path / "boards.json"
+    boards_file.write_text(json.dumps(BOARDS))
+
+    def load_boards() -> dict:
+        return Resources(project_dir=tmp_path, project_scope=True).boards
+
+    # -- The first load writes the snapshot, the second one reads it.
+    assert list(load_boards()) == ["my-board"]
+    snapshots = list((tmp_path / "home/cache/resources").glob("boards-*"))
+    assert len(snapshots) == 1
+
+    def fail(_):
+        raise AssertionError("The json file was loaded.")
+
+    with monkeypatch.context() as context:
+        context.setattr(Resources, "_load_resource_file", staticmethod(fail))
+        assert list(load_boards()) == ["my-board"]
+
+    # -- A modified resource file invalidates the snapshot.
+    boards = {**BOARDS, "other-board": BOARDS["my-board"]}
+    boards_file.write_text(json.dumps(boards))
+    stat = boards_file.stat()
+    os.utime(boards_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert list(load_boards()) == ["my-board", "other-board"]
+
+    # -- A corrupt snapshot is ignored and rewritten.
+    snapshots[0].write_bytes(b"\x00corrupt")
+    assert list(load_boards()) == ["my-board", "other-board"]
+    with monkeypatch.context() as context:
+        context.setattr(Resources, "_load_resource_file", staticmethod(fail))
+        assert list(load_boards()) == ["my-board", "other-board"]
@@ -0,0 +1,50 @@
+"""
+Tests of apio.util
+"""
+
+import sys
+from pathlib import Path
+from apio import util
+
+# -- A command that writes to stdout and stderr and fails.
+SCRIPT = """
+import sys
+print("out 1", flush=True)
+print("err 1", file=sys.stderr, flush=True)
+sys.stdout.write("out 2\\r\\nout 3\\rout 4")
+sys.exit(3)
+"""
+
+
+def test_exec_command(tmp_path: Path):
+    """Test the callbacks and the capture modes of exec_command()."""
+
+    lines = []
+    result = util.exec_command(
+        [sys.executable, "-c", SCRIPT],
+        on_stdout=lambda line: lines.append(("out", line)),
+        on_stderr=lambda line: lines.append(("err", line)),
+    )
+    assert result == util.CommandResult(
+        "out 1\nout 2\nout 3\nout 4", "err 1", 3
+    )
+    assert [line for line in lines if line[0] == "out"] == [
+        ("out", "out 1"),
+        ("out", "out 2"),
+        ("out", "out 3"),
+        ("out", "out 4"),
+    ]
+
+    # -- Keep only the last line in memory and all of them in a file.
+    spill_file = tmp_path / "output.txt"
+    result = util.exec_command(
+        [sys.executable, "-c", SCRIPT], tail_lines=1, spill_file=spill_file
+    )
+    assert result == util.CommandResult("out 4", "err 1", 3)
+    assert sorted(spill_file.read_text().splitlines()) == [
+        "err 1",
+        "out 1",
+        "out 2",
+        "out 3",
+        "out 4",
+    ]